@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -48,6 +51,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'feedback_app.profiling.SqlProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'feedback.urls'
@@ -79,13 +83,107 @@ WSGI_APPLICATION = 'feedback.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
+# SQLite (db.sqlite3) unless FEEDBACK_DB_ENGINE=postgresql, which needs
+# `pip install psycopg` and reads:
+#   FEEDBACK_DB_NAME, FEEDBACK_DB_USER, FEEDBACK_DB_PASSWORD,
+#   FEEDBACK_DB_HOST, FEEDBACK_DB_PORT  - connection details
+#   FEEDBACK_DB_CONN_MAX_AGE            - seconds to keep connections open (default 60)
+#   FEEDBACK_DB_POOL=1                  - use psycopg's connection pool instead
+#                                         (`pip install "psycopg[pool]"`), sized by
+#                                         FEEDBACK_DB_POOL_MIN / FEEDBACK_DB_POOL_MAX
+# The test suite and `manage.py benchmark_feedback` use whichever backend is
+# configured, e.g. FEEDBACK_DB_ENGINE=postgresql python manage.py test feedback_app
+
+DB_ENGINE = os.environ.get('FEEDBACK_DB_ENGINE', 'sqlite3')
+
+# Hardened SQLite profile (see feedback_app/sqlite.py): WAL and tuned pragmas
+# on every connection, plus a read-only 'reports' alias for the report and
+# dashboard reads. Checkpoint and inspect with `manage.py sqlite_status`.
+FEEDBACK_SQLITE_PRODUCTION = DB_ENGINE == 'sqlite3' and os.environ.get('FEEDBACK_SQLITE_PROFILE') == 'production'
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('FEEDBACK_DB_NAME', 'feedback'),
+            'USER': os.environ.get('FEEDBACK_DB_USER', ''),
+            'PASSWORD': os.environ.get('FEEDBACK_DB_PASSWORD', ''),
+            'HOST': os.environ.get('FEEDBACK_DB_HOST', ''),
+            'PORT': os.environ.get('FEEDBACK_DB_PORT', ''),
+            'CONN_MAX_AGE': int(os.environ.get('FEEDBACK_DB_CONN_MAX_AGE', '60')),
+            # Check a persistent connection is still alive before reusing it
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if os.environ.get('FEEDBACK_DB_POOL') == '1':
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('FEEDBACK_DB_POOL_MIN', '2')),
+            'max_size': int(os.environ.get('FEEDBACK_DB_POOL_MAX', '10')),
+        }
+        # The pool owns connection reuse; Django refuses CONN_MAX_AGE alongside it
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+elif DB_ENGINE == 'sqlite3':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
+    }
+    if FEEDBACK_SQLITE_PRODUCTION:
+        # Take the write lock when a transaction starts, so busy_timeout applies
+        # instead of failing on a read-to-write lock upgrade
+        DATABASES['default']['OPTIONS'] = {'transaction_mode': 'IMMEDIATE'}
+        # Same file, opened read-only, for report and dashboard reads
+        DATABASES['reports'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': f"file:{BASE_DIR / 'db.sqlite3'}?mode=ro",
+            'OPTIONS': {'uri': True},
+            'TEST': {'MIRROR': 'default'},
+        }
+        DATABASE_ROUTERS = ['feedback_app.sqlite.ReportingRouter']
+else:
+    raise ImproperlyConfigured(f"FEEDBACK_DB_ENGINE must be 'sqlite3' or 'postgresql', not {DB_ENGINE!r}")
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Holds the cached dashboards, roles and rendered questions. They are tagged
+# with version stamps kept in the database (feedback_app/versions.py), so a
+# per-process cache stays correct when running several processes.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
+# Seconds a process trusts the version stamps it has read (see
+# feedback_app/versions.py): how long an edit made in another process, such
+# as a questionnaire or role change, can go unseen.
+FEEDBACK_VERSION_CHECK_INTERVAL = 2
+
+# Write-behind submission journal (see feedback_app/journal.py). When enabled,
+# student submissions are appended to FEEDBACK_JOURNAL_PATH and written to the
+# database by `python manage.py drain_feedback_journal`.
+FEEDBACK_JOURNAL_ENABLED = False
+FEEDBACK_JOURNAL_PATH = BASE_DIR / 'feedback_journal.sqlite3'
+
+# One-time access codes (see feedback_app/access_codes.py). When required, a
+# student submission must carry an unused code printed for its teacher-course.
+FEEDBACK_ACCESS_CODES_REQUIRED = os.environ.get('FEEDBACK_ACCESS_CODES_REQUIRED') == '1'
+
+# Seconds a submission's Idempotency-Key and stored result are kept (see
+# feedback_app/idempotency.py); retries with the key replay the stored result.
+FEEDBACK_IDEMPOTENCY_TTL = 24 * 3600
+
+# Per-request SQL profiling (see feedback_app/profiling.py). Off by default;
+# sampled requests are logged as JSON on the 'feedback_app.sql' logger and
+# summarised for staff at /feedback-admin/sql-profile/.
+FEEDBACK_SQL_PROFILING = os.environ.get('FEEDBACK_SQL_PROFILING') == '1'
+FEEDBACK_SQL_PROFILING_SAMPLE_RATE = float(os.environ.get('FEEDBACK_SQL_PROFILING_SAMPLE_RATE', '0.1'))
+FEEDBACK_SQL_PROFILING_WINDOW = 900
+FEEDBACK_SQL_PROFILING_REPEAT_THRESHOLD = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -0,0 +1,208 @@
+"""
+One-time feedback access codes.
+
+A code names a TeacherBatch and a student slot and carries an HMAC of both,
+keyed from SECRET_KEY: ``<teacher_batch_id>-<slot>-<mac>``, for example
+``42-17-7K3QMZ0W9D``. The MAC is 50 bits written in Crockford base32, so
+codes are short enough to type from a printed sheet and ``parse_code``
+verifies one without touching the database.
+
+Redeeming a code is a single INSERT into ``AccessCodeRedemption``, whose
+unique (teacher_batch, slot) index rejects a second use. The row holds the
+teacher-course and slot under a random id, and no column records when, or
+in which order, codes were used. It is written in the same transaction as
+the responses it unlocks, but nothing lines the two up, so knowing who had
+slot N tells whether they gave feedback, not what they answered. (On
+PostgreSQL the table's physical row order still roughly follows insertion,
+which only raw storage access reveals.)
+
+Codes are handed out per teacher-course as CSV or PDF sheets, from the
+teacher courses page or in bulk with ``python manage.py generate_access_codes``.
+Sheets number their slots from 1 and stay below STUDENT_SLOT_BASE. Slots
+from there up belong to rostered students: they are derived from each
+student's own access key (see roster.py), which is never stored, so
+neither the codes nor their redemptions can be traced to a student without
+it.
+"""
+import base64
+import csv
+import hashlib
+import hmac
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import Q
+
+from .models import AccessCodeRedemption
+from .submission import SubmissionError
+
+CODE_SALT = 'feedback_app.access_codes'
+MAC_LENGTH = 10  # Base32 characters, 5 bits each
+DEFAULT_SLOTS = 60  # Codes per sheet when no count is given
+STUDENT_SLOT_BASE = 1_000_000  # First slot of rostered students' codes; sheets stay below it
+MAX_SLOT = 2 ** 31 - 1
+
+# Crockford's alphabet: no I, L, O or U, so misread characters can be mapped back
+_BASE32 = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ234567'
+CROCKFORD_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+_TO_CROCKFORD = str.maketrans(_BASE32, CROCKFORD_ALPHABET)
+TYPOS = str.maketrans({'O': '0', 'I': '1', 'L': '1'})
+
+
+class AccessCodeError(SubmissionError):
+    """Raised for a malformed, forged or already used access code."""
+
+
+def is_required():
+    return getattr(settings, 'FEEDBACK_ACCESS_CODES_REQUIRED', False)
+
+
+def _signer():
+    key = hashlib.sha256(f'{CODE_SALT}{settings.SECRET_KEY}'.encode()).digest()
+    return hmac.new(key, digestmod=hashlib.sha256)
+
+
+def _mac(signer, teacher_batch_id, slot):
+    signer = signer.copy()
+    signer.update(f'{teacher_batch_id}:{slot}'.encode())
+    return base64.b32encode(signer.digest()[:8]).decode()[:MAC_LENGTH].translate(_TO_CROCKFORD)
+
+
+def make_code(teacher_batch_id, slot):
+    return f'{teacher_batch_id}-{slot}-{_mac(_signer(), teacher_batch_id, slot)}'
+
+
+def generate_codes(teacher_batch_id, count, start=1):
+    """``(slot, code)`` pairs for ``count`` slots of a teacher-course, from ``start``."""
+    signer = _signer()
+    return [
+        (slot, f'{teacher_batch_id}-{slot}-{_mac(signer, teacher_batch_id, slot)}')
+        for slot in range(start, start + count)
+    ]
+
+
+def parse_code(code):
+    """Return ``(teacher_batch_id, slot)`` for a genuine code, or raise ``AccessCodeError``.
+
+    Only checks the MAC; whether the code was already used is up to ``redeem``.
+    """
+    parts = ''.join((code or '').split()).upper().split('-')
+    if len(parts) != 3 or not parts[0].isdigit() or not parts[1].isdigit():
+        raise AccessCodeError('Please enter the access code printed on your feedback slip.')
+
+    teacher_batch_id, slot = int(parts[0]), int(parts[1])
+    expected = _mac(_signer(), teacher_batch_id, slot)
+    if not hmac.compare_digest(parts[2].translate(TYPOS), expected):
+        raise AccessCodeError('Invalid access code. Please check it and try again.')
+    return teacher_batch_id, slot
+
+
+def redeem(teacher_batch_id, slot):
+    """Record a code as used; raise ``AccessCodeError`` if it already was.
+
+    One INSERT and no savepoint: inside a transaction the caller must let
+    the error roll it back.
+    """
+    try:
+        AccessCodeRedemption.objects.create(teacher_batch_id=teacher_batch_id, slot=slot)
+    except IntegrityError:
+        raise AccessCodeError('This access code has already been used.')
+
+
+def used_codes(codes):
+    """The ``(teacher_batch_id, slot)`` pairs among ``codes`` that were already redeemed, in one query."""
+    codes = list(codes)
+    if not codes:
+        return set()
+    used = Q()
+    for teacher_batch_id, slot in codes:
+        used |= Q(teacher_batch_id=teacher_batch_id, slot=slot)
+    return set(AccessCodeRedemption.objects.filter(used).values_list('teacher_batch_id', 'slot'))
+
+
+def redeem_many(codes):
+    """Record several codes as used with one INSERT; any already used one raises ``AccessCodeError``."""
+    try:
+        AccessCodeRedemption.objects.bulk_create(
+            AccessCodeRedemption(teacher_batch_id=teacher_batch_id, slot=slot) for teacher_batch_id, slot in codes
+        )
+    except IntegrityError:
+        raise AccessCodeError('One of the access codes has already been used.')
+
+
+def write_csv(fh, codes):
+    writer = csv.writer(fh)
+    writer.writerow(['Slot', 'Access Code'])
+    writer.writerows(codes)
+
+
+# Printable sheet: A4 portrait, Courier, two columns of cut-out slips
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+MARGIN = 50
+ROW_HEIGHT = 24
+COLUMNS = 2
+
+
+def _pdf_text(value):
+    value = str(value).encode('latin-1', 'replace').decode('latin-1')
+    return value.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def write_pdf(fh, title, codes, instructions=''):
+    """Write the codes as a printable PDF sheet to the binary file ``fh``.
+
+    Hand-rolled (one built-in font, text and rules only) so sheets need no
+    PDF library.
+    """
+    header_height = 60
+    rows_per_page = (PAGE_HEIGHT - 2 * MARGIN - header_height) // ROW_HEIGHT
+    per_page = rows_per_page * COLUMNS
+    column_width = (PAGE_WIDTH - 2 * MARGIN) / COLUMNS
+    pages = [codes[i:i + per_page] for i in range(0, len(codes), per_page)] or [[]]
+
+    streams = []
+    for number, page in enumerate(pages, 1):
+        top = PAGE_HEIGHT - MARGIN
+        lines = [
+            f'BT /F2 13 Tf {MARGIN} {top - 14} Td ({_pdf_text(title)}) Tj ET',
+            f'BT /F1 9 Tf {MARGIN} {top - 32} Td ({_pdf_text(instructions)}) Tj ET',
+            f'BT /F1 9 Tf {PAGE_WIDTH - MARGIN - 60} {top - 14} Td (Page {number}/{len(pages)}) Tj ET',
+            '0.6 G 0.5 w',
+        ]
+        for index, (slot, code) in enumerate(page):
+            column, row = divmod(index, rows_per_page)
+            x = MARGIN + column * column_width
+            y = top - header_height - (row + 1) * ROW_HEIGHT
+            lines.append(f'{x:.1f} {y:.1f} m {x + column_width - 10:.1f} {y:.1f} l S')
+            lines.append(f'BT /F1 8 Tf {x:.1f} {y + 9:.1f} Td (#{slot}) Tj ET')
+            lines.append(f'BT /F2 12 Tf {x + 40:.1f} {y + 8:.1f} Td ({_pdf_text(code)}) Tj ET')
+        streams.append('\n'.join(lines).encode('latin-1'))
+
+    # Objects 1-4 are fixed; each page then takes a page and a content object
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        None,
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Courier-Bold >>',
+    ]
+    kids = []
+    for stream in streams:
+        page_id = len(objects) + 1
+        kids.append(f'{page_id} 0 R')
+        objects.append(
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] '
+            f'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents {page_id + 1} 0 R >>'.encode()
+        )
+        objects.append(b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream')
+    objects[1] = f'<< /Type /Pages /Kids [{" ".join(kids)}] /Count {len(kids)} >>'.encode()
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for object_id, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % object_id + body + b'\nendobj\n'
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    out += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    fh.write(bytes(out))
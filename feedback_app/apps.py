@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class FeedbackAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'feedback_app'
+
+    def ready(self):
+        # Registers the receivers that expire cached roles
+        from . import roles  # noqa: F401
+        # Registers the receivers that expire the compiled questionnaire
+        from . import questionnaire  # noqa: F401
+        # Registers the SQLite connection tuning of the production profile
+        from . import sqlite  # noqa: F401
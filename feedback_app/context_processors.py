@@ -1,16 +1,18 @@
+from .roles import get_roles
 
-from django.contrib.auth.models import Group
+# All four read the same Roles object, loaded once per session and
+# memoised on the request, so rendering a page costs no role queries.
 
 def is_admin(request):
-    user = request.user
-    return {'is_admin': user.is_superuser or user.groups.filter(name='admin').exists()}
+    roles = get_roles(request)
+    return {'is_admin': roles.is_superuser or roles.in_group('admin')}
 
 
 def is_hod(request):
-    return {'is_hod': request.user.groups.filter(name='hod').exists()}
+    return {'is_hod': get_roles(request).in_group('hod')}
 
 def is_teacher(request):
-    return {'is_teacher': request.user.groups.filter(name='teacher').exists()}
+    return {'is_teacher': get_roles(request).in_group('teacher')}
 
 def is_principal(request):
-    return {'is_principal': request.user.groups.filter(name='principal').exists()}
\ No newline at end of file
+    return {'is_principal': get_roles(request).in_group('principal')}
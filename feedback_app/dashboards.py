@@ -0,0 +1,186 @@
+"""
+Caching for the dashboard payloads shown on ``index``.
+
+The admin statistics are built once into a small stats store in the cache
+and then kept current: ``save_submissions`` adds each committed batch of
+submissions to the totals, the rating distribution and the current month,
+while teacher, course and assignment edits drop the store so the next
+admin hit rebuilds it. Questionnaire edits retire it through its version
+tag, and it is rebuilt hourly regardless.
+
+The store is also tagged with the ``ADMIN_STATS_KEY`` version stamp, which
+every change to it bumps. A submission only adds itself to the store its
+process holds when the stamp still follows on from that store's tag; when
+another process (another web worker, or the journal drainer) got in
+between, the store is dropped and rebuilt instead. Copies held by other
+processes are retired by the bump.
+
+A teacher's dashboard is cached per teacher under the current questionnaire
+version and the teacher's own version stamp (see versions.py), so editing
+questions, options or option scores retires every cached copy at once.
+``save_submissions`` bumps the stamps of the teachers whose teacher-courses
+received feedback once its transaction commits, and the teacher-course
+assignment views do the same when assignments change. The stamps are in
+the database, so a bump made by the journal drainer or another web worker
+retires the copies cached in every process.
+
+Both are built inside ``reporting()``, so with the SQLite production
+profile their queries run on the read-only reports connection.
+"""
+import threading
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import (
+    Course, Department, FeedbackOptionCount, StudentFeedbackResponse, Teacher, TeacherBatch,
+)
+from . import versions
+from .questionnaire import VERSION_KEY, get_questionnaire
+from .sqlite import reporting
+
+TEACHER_DASHBOARD_TIMEOUT = 600  # Upper bound on staleness for edits nothing invalidates (course names etc.)
+
+ADMIN_STATS_KEY = 'admin_dashboard_stats'
+ADMIN_STATS_TIMEOUT = 3600  # Full rebuild at least hourly, so missed increments cannot drift for long
+ADMIN_MONTHS = 6
+
+# Serialises read-modify-write of the admin stats within a process; across
+# processes the stamp's compare-and-set in record_submissions decides
+_admin_lock = threading.Lock()
+
+
+def _teacher_key(teacher_id):
+    return f'teacher_dashboard:{teacher_id}'
+
+
+def cached_teacher_dashboard(teacher_id, build):
+    """Return the cached dashboard for a teacher, calling ``build()`` on a miss."""
+    key = _teacher_key(teacher_id)
+    # Both stamps in one read; get_questionnaire() then finds its own already checked
+    stamps = versions.get_versions([VERSION_KEY, key])
+    version = (get_questionnaire().version, stamps[key])
+    cached = cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    with reporting():
+        data = build()
+    cache.set(key, (version, data), TEACHER_DASHBOARD_TIMEOUT)
+    return data
+
+
+def invalidate_teacher_dashboards(teacher_ids):
+    """Retire the cached dashboards of the given teachers, in every process."""
+    keys = [_teacher_key(teacher_id) for teacher_id in set(teacher_ids)]
+    versions.bump_versions(keys)
+    cache.delete_many(keys)
+
+
+def invalidate_for_teacher_batches(teacher_batch_ids):
+    """Drop the cached dashboards of the teachers owning these teacher-courses."""
+    teacher_ids = TeacherBatch.objects.filter(pk__in=set(teacher_batch_ids)).values_list('teacher_id', flat=True)
+    invalidate_teacher_dashboards(teacher_ids)
+
+
+def month_key(value):
+    """Key of a month in the stats store's monthly series, e.g. ``'2025-03'``."""
+    return f"{value.year:04d}-{value.month:02d}"
+
+
+def build_admin_stats():
+    """Compute the admin stats store from the database.
+
+    Submission and rating totals come from the rollups and the monthly
+    series from one ``TruncMonth`` group-by over the last six months.
+    """
+    now = timezone.localtime()
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    first_month = month_start
+    for _ in range(ADMIN_MONTHS - 1):
+        first_month = (first_month - timedelta(days=1)).replace(day=1)
+
+    monthly = {
+        month_key(timezone.localtime(month)): n
+        for month, n in StudentFeedbackResponse.objects.filter(submitted_at__gte=first_month)
+        .order_by().annotate(month=TruncMonth('submitted_at')).values_list('month').annotate(n=Count('pk'))
+    }
+
+    return {
+        'version': get_questionnaire().version,
+        'built_at': now,
+        'updated_at': now,
+        'total_feedback_submissions': TeacherBatch.objects.aggregate(n=Sum('submission_count'))['n'] or 0,
+        'active_teachers': Teacher.objects.filter(fb_active=True).count(),
+        'total_courses': Course.objects.count(),
+        'total_departments': Department.objects.count(),
+        'gender': list(
+            Teacher.objects.exclude(gender__isnull=True).exclude(gender__exact='')
+            .order_by().values_list('gender').annotate(count=Count('pk'))
+        ),
+        'ratings': dict(
+            FeedbackOptionCount.objects.filter(selected_option__score__isnull=False)
+            .order_by().values_list('selected_option__score').annotate(n=Sum('count'))
+        ),
+        'monthly': monthly,
+        'departments': list(
+            Department.objects.annotate(teacher_count=Count('teacher'))
+            .order_by('-teacher_count').values_list('dept_name', 'teacher_count')
+        ),
+    }
+
+
+def admin_stats():
+    """Return the admin stats store, building it on a miss.
+
+    Like the teacher dashboards the store is tagged with the questionnaire
+    version, since re-scoring options changes the rating distribution.
+    """
+    stamp = versions.get_versions([VERSION_KEY, ADMIN_STATS_KEY])[ADMIN_STATS_KEY]
+    stats = cache.get(ADMIN_STATS_KEY)
+    if stats is None or stats['version'] != get_questionnaire().version or stats['stamp'] != stamp:
+        with reporting():
+            stats = build_admin_stats()
+        # The stamp was read first, so a change made during the build retires this copy
+        stats['stamp'] = stamp
+        cache.set(ADMIN_STATS_KEY, stats, ADMIN_STATS_TIMEOUT)
+    return stats
+
+
+def invalidate_admin_stats():
+    """Drop the admin stats store in every process; the next admin hit rebuilds it."""
+    versions.bump_version(ADMIN_STATS_KEY)
+    cache.delete(ADMIN_STATS_KEY)
+
+
+def record_submissions(teacher_batch_ids, submissions, rows, ratings):
+    """Fold committed submissions into the cached stats and drop affected dashboards.
+
+    ``rows`` is the number of response rows written and ``ratings`` a
+    ``Counter`` of option score -> answers. Called by ``save_submissions``
+    once its transaction commits.
+    """
+    invalidate_for_teacher_batches(teacher_batch_ids)
+
+    with _admin_lock:
+        stats = cache.get(ADMIN_STATS_KEY)
+        stamp = versions.bump_version(ADMIN_STATS_KEY, expected=stats['stamp'] if stats else None)
+        if stats is None or stamp is None:
+            # Nothing cached, or the store missed another process's change:
+            # the next admin hit builds fresh numbers
+            cache.delete(ADMIN_STATS_KEY)
+            return
+        now = timezone.localtime()
+        stats['stamp'] = stamp
+        month = month_key(now)
+        stats['total_feedback_submissions'] += submissions
+        stats['monthly'][month] = stats['monthly'].get(month, 0) + rows
+        for score, n in ratings.items():
+            stats['ratings'][score] = stats['ratings'].get(score, 0) + n
+        stats['updated_at'] = now
+        # Keep the original expiry so a rebuild still happens on schedule
+        remaining = ADMIN_STATS_TIMEOUT - int((now - stats['built_at']).total_seconds())
+        cache.set(ADMIN_STATS_KEY, stats, max(remaining, 1))
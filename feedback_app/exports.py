@@ -0,0 +1,182 @@
+"""
+Streaming CSV and XLSX exports of raw student responses.
+
+Rows are read with ``iterator(chunk_size=...)`` over one joined query and
+written out as they arrive, so memory use does not grow with the number of
+responses and the download starts with the first chunk.
+
+The XLSX writer produces a minimal single-sheet workbook with inline
+strings, streamed through ``zipfile`` onto a write-only buffer; no
+spreadsheet library is needed.
+
+Both writers prefix text cells that a spreadsheet would read as a formula
+(starting with ``=``, ``+``, ``-``, ``@``, a tab or a carriage return) with
+``'``, so a student's answer cannot run as a formula on the staff machine
+that opens the export.
+"""
+import csv
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+
+EXPORT_CHUNK_SIZE = 2000
+
+# Control characters XML 1.0 does not allow, even escaped
+XML_ILLEGAL = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+HEADER = [
+    'Feedback #', 'Session', 'Submitted At', 'Department', 'Teacher', 'Course Code',
+    'Course Name', 'Batch', 'Question ID', 'Question', 'Question Type', 'Answer',
+]
+
+
+def export_rows(responses, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield one list of cell values per response, in insertion order."""
+    rows = (
+        responses.order_by('pk')
+        .values_list(
+            'feedback_number', 'session_id', 'submitted_at',
+            'teacher_batch__department__dept_name', 'teacher_batch__teacher__name',
+            'teacher_batch__course__code', 'teacher_batch__course__name',
+            'teacher_batch__batch__acad_year', 'teacher_batch__batch__part',
+            'question_id', 'question__q_desc', 'question__q_type',
+            'selected_option__answer', 'response_text',
+        )
+        .iterator(chunk_size=chunk_size)
+    )
+    for (number, session_id, submitted_at, dept, teacher, course_code, course_name,
+         acad_year, part, question_id, question, q_type, option, text) in rows:
+        yield [
+            number if number is not None else '', session_id,
+            timezone.localtime(submitted_at).strftime('%Y-%m-%d %H:%M:%S') if submitted_at else '',
+            dept or '', teacher or '', course_code or '', course_name or '',
+            f"{acad_year} - {part}" if acad_year else '',
+            question_id, question, q_type, option if option is not None else (text or ''),
+        ]
+
+
+def _safe_text(value):
+    """Cell text that spreadsheets will not evaluate as a formula."""
+    value = str(value)
+    return "'" + value if value.startswith(FORMULA_PREFIXES) else value
+
+
+class _Echo:
+    """File-like object whose write() just hands the value back."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield CSV text a chunk of rows at a time."""
+    writer = csv.writer(_Echo())
+    chunk = [writer.writerow(HEADER)]
+    for row in rows:
+        chunk.append(writer.writerow([value if isinstance(value, int) else _safe_text(value) for value in row]))
+        if len(chunk) >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+class _ZipBuffer:
+    """Write-only, unseekable sink that zipfile streams into."""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.offset = 0
+
+    def write(self, b):
+        self.data += b
+        self.offset += len(b)
+        return len(b)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = bytes(self.data)
+        self.data.clear()
+        return data
+
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Responses" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _xlsx_row(values):
+    cells = []
+    for value in values:
+        if isinstance(value, int):
+            cells.append(f'<c t="n"><v>{value}</v></c>')
+        else:
+            text = escape(_safe_text(XML_ILLEGAL.sub('', str(value))))
+            cells.append(f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>')
+    return f'<row>{"".join(cells)}</row>'
+
+
+def stream_xlsx(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield the bytes of a single-sheet XLSX workbook as it is written."""
+    buffer = _ZipBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, content)
+        yield buffer.take()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(_xlsx_row(HEADER).encode())
+            written = 0
+            for row in rows:
+                sheet.write(_xlsx_row(row).encode())
+                written += 1
+                if written % chunk_size == 0 and buffer.data:
+                    yield buffer.take()
+            sheet.write(b'</sheetData></worksheet>')
+    yield buffer.take()
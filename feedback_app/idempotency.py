@@ -0,0 +1,152 @@
+"""
+Client retry keys for the student submit endpoints.
+
+The feedback forms send an ``Idempotency-Key`` header with every submit:
+a fresh key per submission, reused when the form retries after a timeout.
+``idempotent`` wraps a submit view:
+
+* An unknown key is claimed with a row that has no response yet, and the
+  view runs. A successful JSON response is stored under the key. Anything
+  else releases the key, so a retry after a transient error runs again.
+* A replayed key gets the stored response back, with an
+  ``Idempotent-Replayed`` header, and the view does not run, so nothing
+  touches ``StudentFeedbackResponse`` a second time.
+* A key whose first request is still running gets a 409, which the forms
+  retry after a moment. A key reused with different answers gets a 422.
+
+Keys expire after FEEDBACK_IDEMPOTENCY_TTL seconds. Expired rows are
+ignored, and one claim in a hundred evicts a bounded batch of them through
+the ``created_at`` index.
+"""
+import functools
+import hashlib
+import json
+import random
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import JsonResponse
+from django.utils import timezone
+
+from .models import SubmissionIdempotencyKey
+
+KEY_TTL = 24 * 3600  # Seconds; FEEDBACK_IDEMPOTENCY_TTL overrides
+IN_PROGRESS_TIMEOUT = 60  # Seconds before an unfinished claim counts as abandoned
+EVICT_SAMPLE_RATE = 0.01
+EVICT_BATCH = 1000
+
+_KEY = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+
+def key_ttl():
+    return getattr(settings, 'FEEDBACK_IDEMPOTENCY_TTL', KEY_TTL)
+
+
+def request_hash(request):
+    """Hash of the posted fields.
+
+    Not of the raw body: browsers pick a new multipart boundary for every
+    retry of the same FormData.
+    """
+    fields = sorted(
+        (name, value) for name, values in request.POST.lists() if name != 'csrfmiddlewaretoken' for value in values
+    )
+    return hashlib.sha256(json.dumps(fields).encode()).hexdigest()
+
+
+def evict_expired(limit=EVICT_BATCH):
+    """Delete up to ``limit`` expired keys; returns the number removed."""
+    cutoff = timezone.now() - timedelta(seconds=key_ttl())
+    expired = list(
+        SubmissionIdempotencyKey.objects.filter(created_at__lt=cutoff).values_list('pk', flat=True)[:limit]
+    )
+    if not expired:
+        return 0
+    return SubmissionIdempotencyKey.objects.filter(pk__in=expired).delete()[0]
+
+
+def _in_progress():
+    return JsonResponse(
+        {'success': False, 'in_progress': True, 'error': 'Your submission is still being processed. Please wait.'},
+        status=409,
+    )
+
+
+def _claim(key, digest):
+    """Claim ``key`` for this request.
+
+    Returns ``None`` when the view should run, otherwise the response to
+    send instead.
+    """
+    now = timezone.now()
+    stored = SubmissionIdempotencyKey.objects.filter(pk=key).first()
+    if stored is None:
+        try:
+            # Savepoint, so losing the race does not break an outer transaction
+            with transaction.atomic():
+                SubmissionIdempotencyKey.objects.create(key=key, request_hash=digest)
+        except IntegrityError:
+            # A concurrent retry claimed it first
+            stored = SubmissionIdempotencyKey.objects.filter(pk=key).first()
+            if stored is None:
+                return _in_progress()
+        else:
+            if random.random() < EVICT_SAMPLE_RATE:
+                evict_expired()
+            return None
+
+    expired = stored.created_at < now - timedelta(seconds=key_ttl())
+    abandoned = stored.response is None and stored.created_at < now - timedelta(seconds=IN_PROGRESS_TIMEOUT)
+    if expired or abandoned:
+        # Take the key over, unless another request just did
+        taken = SubmissionIdempotencyKey.objects.filter(pk=key, created_at=stored.created_at).update(
+            request_hash=digest, response=None, created_at=now,
+        )
+        return None if taken else _in_progress()
+
+    if stored.request_hash != digest:
+        return JsonResponse(
+            {'success': False, 'error': 'This idempotency key was already used for a different submission.'},
+            status=422,
+        )
+    if stored.response is None:
+        return _in_progress()
+
+    response = JsonResponse(stored.response)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    """Make a JSON submit view safe to retry under an ``Idempotency-Key`` header.
+
+    Requests without a key are passed straight through.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if request.method != 'POST' or not key:
+            return view(request, *args, **kwargs)
+        if not _KEY.match(key):
+            return JsonResponse({'success': False, 'error': 'Invalid idempotency key.'}, status=400)
+
+        replay = _claim(key, request_hash(request))
+        if replay is not None:
+            return replay
+
+        try:
+            response = view(request, *args, **kwargs)
+        except BaseException:
+            SubmissionIdempotencyKey.objects.filter(pk=key).delete()
+            raise
+
+        result = json.loads(response.content) if response.status_code == 200 else None
+        if result and result.get('success'):
+            SubmissionIdempotencyKey.objects.filter(pk=key).update(response=result)
+        else:
+            SubmissionIdempotencyKey.objects.filter(pk=key).delete()
+        return response
+
+    return wrapper
@@ -0,0 +1,220 @@
+"""
+Write-behind journal for student feedback submissions.
+
+When ``FEEDBACK_JOURNAL_ENABLED`` is set, ``submit_student_feedback`` only
+validates a submission and appends it to a small WAL-mode SQLite file next
+to the main database. ``python manage.py drain_feedback_journal`` then
+moves journaled submissions into ``StudentFeedbackResponse`` in large
+batches through ``save_submissions``.
+
+Entries are only marked as drained after the batch has been committed to
+the main database. If the drainer dies in between, the next run replays
+the batch and ``save_submissions`` skips every session that was already
+stored, so replay never duplicates responses.
+
+A batch that cannot be written is retried one entry at a time, so a single
+bad entry does not hold up the rest. An entry that fails MAX_ATTEMPTS times
+is set aside as failed: it is no longer drained, ``lag()`` counts it, and
+``requeue_failed`` puts it back in the queue once the cause is fixed.
+Errors that mean the main database is unavailable are raised instead, and
+leave every entry pending.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError
+
+from .submission import Submission, SubmissionError, save_submissions
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+MAX_ATTEMPTS = 3  # Failed drains before an entry is set aside; FEEDBACK_JOURNAL_MAX_ATTEMPTS overrides
+
+# Raised when the main database itself is unavailable, not because of an entry
+DATABASE_UNAVAILABLE = (InterfaceError, OperationalError)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL UNIQUE,
+    teacher_batch_id INTEGER NOT NULL,
+    answers TEXT NOT NULL,
+    enqueued_at REAL NOT NULL,
+    drained_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    failed_at REAL
+);
+"""
+
+# Columns added after the first journal files were written
+UPGRADE_COLUMNS = [
+    ('attempts', 'INTEGER NOT NULL DEFAULT 0'),
+    ('last_error', 'TEXT'),
+    ('failed_at', 'REAL'),
+]
+
+INDEXES = """
+DROP INDEX IF EXISTS journal_pending;
+CREATE INDEX IF NOT EXISTS journal_queue ON journal (drained_at, failed_at, id);
+"""
+
+
+def is_enabled():
+    return getattr(settings, 'FEEDBACK_JOURNAL_ENABLED', False)
+
+
+def max_attempts():
+    return getattr(settings, 'FEEDBACK_JOURNAL_MAX_ATTEMPTS', MAX_ATTEMPTS)
+
+
+def _connection():
+    path = str(settings.FEEDBACK_JOURNAL_PATH)
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'path', None) != path:
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # Every append must survive a crash once the student sees "received"
+        conn.execute('PRAGMA synchronous=FULL')
+        conn.executescript(SCHEMA)
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(journal)')}
+        for name, definition in UPGRADE_COLUMNS:
+            if name not in columns:
+                conn.execute(f'ALTER TABLE journal ADD COLUMN {name} {definition}')
+        conn.executescript(INDEXES)
+        _local.conn, _local.path = conn, path
+    return conn
+
+
+def append(submission):
+    """Durably journal a validated submission."""
+    try:
+        _connection().execute(
+            'INSERT INTO journal (session_id, teacher_batch_id, answers, enqueued_at) VALUES (?, ?, ?, ?)',
+            (submission.session_id, submission.teacher_batch_id, json.dumps(submission.answers), time.time()),
+        )
+    except sqlite3.IntegrityError:
+        raise SubmissionError('Feedback already submitted from this session.')
+
+
+def fetch_pending(limit):
+    """Return up to ``limit`` undrained entries as ``(entry_id, Submission)`` pairs."""
+    rows = _connection().execute(
+        'SELECT id, teacher_batch_id, session_id, answers FROM journal '
+        'WHERE drained_at IS NULL AND failed_at IS NULL ORDER BY id LIMIT ?',
+        (limit,),
+    ).fetchall()
+    return [
+        (entry_id, Submission(tb_id, session_id, [tuple(a) for a in json.loads(answers)]))
+        for entry_id, tb_id, session_id, answers in rows
+    ]
+
+
+def mark_drained(entry_ids):
+    conn = _connection()
+    conn.execute('BEGIN IMMEDIATE')
+    conn.executemany(
+        'UPDATE journal SET drained_at = ? WHERE id = ?',
+        [(time.time(), entry_id) for entry_id in entry_ids],
+    )
+    conn.execute('COMMIT')
+
+
+def record_failure(entry_id, error):
+    """Count a failed drain of an entry; returns True once the entry has been set aside."""
+    conn = _connection()
+    conn.execute(
+        'UPDATE journal SET attempts = attempts + 1, last_error = ?, '
+        'failed_at = CASE WHEN attempts + 1 >= ? THEN ? END WHERE id = ?',
+        (f'{type(error).__name__}: {error}', max_attempts(), time.time(), entry_id),
+    )
+    return conn.execute('SELECT failed_at IS NOT NULL FROM journal WHERE id = ?', (entry_id,)).fetchone()[0] == 1
+
+
+def failed_entries(limit=100):
+    """Entries that were set aside, as ``(entry_id, session_id, attempts, last_error)`` rows."""
+    return _connection().execute(
+        'SELECT id, session_id, attempts, last_error FROM journal '
+        'WHERE drained_at IS NULL AND failed_at IS NOT NULL ORDER BY id LIMIT ?',
+        (limit,),
+    ).fetchall()
+
+
+def requeue_failed():
+    """Put every failed entry back in the queue; returns the number requeued."""
+    cursor = _connection().execute(
+        'UPDATE journal SET attempts = 0, failed_at = NULL WHERE drained_at IS NULL AND failed_at IS NOT NULL'
+    )
+    return cursor.rowcount
+
+
+def purge_drained(older_than_seconds):
+    """Delete drained entries older than the given age; returns the number removed."""
+    cursor = _connection().execute(
+        'DELETE FROM journal WHERE drained_at IS NOT NULL AND drained_at < ?',
+        (time.time() - older_than_seconds,),
+    )
+    return cursor.rowcount
+
+
+def lag():
+    """Backlog metric: pending entries, the age of the oldest one in seconds and failed entries."""
+    pending, oldest, failed = _connection().execute(
+        'SELECT SUM(failed_at IS NULL), MIN(CASE WHEN failed_at IS NULL THEN enqueued_at END), '
+        'SUM(failed_at IS NOT NULL) FROM journal WHERE drained_at IS NULL'
+    ).fetchone()
+    return {
+        'pending': pending or 0,
+        'oldest_pending_seconds': round(time.time() - oldest, 3) if oldest else 0.0,
+        'failed': failed or 0,
+    }
+
+
+def drain(batch_size=500):
+    """Move one batch of journaled submissions into the database.
+
+    Returns the number of journal entries processed.
+    """
+    entries = fetch_pending(batch_size)
+    if not entries:
+        return 0
+
+    try:
+        numbers = save_submissions([submission for _, submission in entries])
+        drained = [entry_id for entry_id, _ in entries]
+    except DATABASE_UNAVAILABLE:
+        raise
+    except Exception:
+        logger.exception('Journal batch of %d entries failed; retrying them one at a time', len(entries))
+        numbers, drained = _drain_one_by_one(entries)
+
+    skipped = numbers.count(None)
+    if skipped:
+        logger.info('Skipped %d journaled submissions that were already stored', skipped)
+
+    mark_drained(drained)
+    return len(entries)
+
+
+def _drain_one_by_one(entries):
+    numbers, drained = [], []
+    for entry_id, submission in entries:
+        try:
+            numbers.extend(save_submissions([submission]))
+        except DATABASE_UNAVAILABLE:
+            # Entries saved so far are replayed and skipped on the next run
+            raise
+        except Exception as e:
+            if record_failure(entry_id, e):
+                logger.error('Journal entry %d failed %d times and was set aside: %s', entry_id, max_attempts(), e)
+            else:
+                logger.warning('Journal entry %d failed: %s', entry_id, e)
+        else:
+            drained.append(entry_id)
+    return numbers, drained
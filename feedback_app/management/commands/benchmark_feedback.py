@@ -0,0 +1,237 @@
+import io
+import itertools
+import json
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from feedback_app.models import TeacherBatch
+from feedback_app.questionnaire import get_questionnaire
+from feedback_app.submission import new_submission_token
+from feedback_app.views import get_admin_dashboard_data, get_teacher_dashboard_data
+
+from .loadtest_feedback import allowed_host
+
+DEFAULT_SCALES = '10000,100000,1000000'
+REPORT_FILTERS = ('department', 'teacher', 'course', 'batch')
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the dashboards, the response report (every filter combination) and feedback "
+        "submission at several dataset sizes. Each size gets its own throwaway test database "
+        "seeded with generate_feedback_data; results are appended to a JSON history file and "
+        "compared with the previous run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default=DEFAULT_SCALES,
+                            help=f'Comma-separated response counts (default {DEFAULT_SCALES}).')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per benchmark; the median is kept.')
+        parser.add_argument('--history', default=str(settings.BASE_DIR / 'benchmark_history.json'),
+                            help='JSON file the results are appended to.')
+        parser.add_argument('--label', default='', help='Free-text note stored with this run.')
+        parser.add_argument('--seed', type=int, default=1, help='Seed passed to generate_feedback_data.')
+
+    def handle(self, *args, **options):
+        try:
+            scales = [int(scale) for scale in options['scales'].split(',') if scale.strip()]
+        except ValueError:
+            raise CommandError('--scales must be a comma-separated list of integers.')
+        if not scales or min(scales) < 1 or options['repeat'] < 1:
+            raise CommandError('--scales and --repeat must be positive.')
+
+        self.repeat = options['repeat']
+        run = {
+            'timestamp': timezone.now().isoformat(timespec='seconds'),
+            'label': options['label'],
+            'revision': git_revision(),
+            'vendor': connection.vendor,
+            'repeat': self.repeat,
+            'scales': {},
+        }
+        for scale in scales:
+            self.stdout.write(f"\n== {scale:,} responses")
+            with TestDatabase():
+                run['scales'][str(scale)] = self.run_scale(scale, options['seed'])
+
+        history = load_history(options['history'])
+        self.print_comparison(run, history[-1] if history else None)
+        history.append(run)
+        with open(options['history'], 'w') as fh:
+            json.dump(history, fh, indent=2)
+        self.stdout.write(f"\nAppended run to {options['history']}")
+
+    def run_scale(self, scale, seed):
+        started = time.perf_counter()
+        call_command('generate_feedback_data', responses=scale, seed=seed, stdout=io.StringIO())
+        self.stdout.write(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+        # A busy teacher-course, so every report filter narrows to real data
+        tb = TeacherBatch.objects.order_by('-response_count', 'pk').first()
+        admin = User.objects.create_superuser(f'bench_admin_{uuid.uuid4().hex[:8]}', password=None)
+        client = Client(SERVER_NAME=allowed_host())
+        client.force_login(admin)
+
+        results = {}
+        results['admin_dashboard (cold)'] = self.measure(get_admin_dashboard_data, before=cache.clear)
+        results['admin_dashboard (warm)'] = self.measure(get_admin_dashboard_data)
+        results['teacher_dashboard (cold)'] = self.measure(
+            lambda: get_teacher_dashboard_data(tb.teacher_id), before=cache.clear
+        )
+        results['teacher_dashboard (warm)'] = self.measure(lambda: get_teacher_dashboard_data(tb.teacher_id))
+
+        values = {
+            'department': tb.department_id, 'teacher': tb.teacher_id,
+            'course': tb.course_id, 'batch': tb.batch_id,
+        }
+        report_url = reverse('admin_student_feedback_responses')
+        for size in range(len(REPORT_FILTERS) + 1):
+            for combination in itertools.combinations(REPORT_FILTERS, size):
+                params = {name: values[name] for name in combination}
+                name = f"report [{'+'.join(combination) or 'no filters'}]"
+                results[name] = self.measure(lambda: check(client.get(report_url, params)))
+
+        results['submit'] = self.measure(lambda: self.submit(tb.pk))
+        for name, result in results.items():
+            self.stdout.write(f"  {name:<44}{result['median_ms']:>10} ms{result['queries']:>6} queries")
+        return results
+
+    def measure(self, call, before=None):
+        """Median and best wall time of ``call`` over the repeats, plus its query count."""
+        timings = []
+        for _ in range(self.repeat):
+            if before:
+                before()
+            started = time.perf_counter()
+            call()
+            timings.append(time.perf_counter() - started)
+
+        # Counted on a separate run so the capture does not skew the timings,
+        # across every alias so reads sent to ``reports`` are included
+        if before:
+            before()
+        with ExitStack() as stack:
+            captures = [stack.enter_context(CaptureQueriesContext(db)) for db in connections.all()]
+            call()
+        return {
+            'median_ms': round(statistics.median(timings) * 1000, 2),
+            'min_ms': round(min(timings) * 1000, 2),
+            'queries': sum(len(queries) for queries in captures),
+        }
+
+    @override_settings(FEEDBACK_JOURNAL_ENABLED=False)
+    def submit(self, teacher_batch_id):
+        questionnaire = get_questionnaire()
+        data = {'teacher_batch_id': teacher_batch_id, 'submission_token': new_submission_token()}
+        for question, options in questionnaire.mcq_questions:
+            data[f'question_{question.q_id}'] = options[0].id
+        for question in questionnaire.desc_questions:
+            data[f'question_{question.q_id}'] = 'Benchmark comment'
+
+        response = Client(SERVER_NAME=allowed_host()).post(reverse('submit_student_feedback'), data)
+        if not check(response).json().get('success'):
+            raise CommandError(f'Benchmark submission failed: {response.content.decode()}')
+
+    def print_comparison(self, run, previous):
+        if previous is None:
+            self.stdout.write('\nNo previous run to compare with.')
+            return
+        self.stdout.write(
+            f"\nCompared with {previous['timestamp']} {previous.get('revision') or ''} {previous.get('label') or ''}"
+        )
+        header = f"{'scale':>9}  {'benchmark':<44}{'before ms':>11}{'after ms':>11}{'change':>9}{'queries':>10}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for scale, results in run['scales'].items():
+            before = previous['scales'].get(scale, {})
+            for name, result in results.items():
+                if name not in before:
+                    continue
+                old = before[name]
+                change = (result['median_ms'] - old['median_ms']) / old['median_ms'] if old['median_ms'] else 0.0
+                line = (
+                    f"{int(scale):>9,}  {name:<44}{old['median_ms']:>11}{result['median_ms']:>11}"
+                    f"{change:>+9.0%}{old['queries']:>5} ->{result['queries']:>3}"
+                )
+                self.stdout.write(self.style.ERROR(line) if change > 0.2 else line)
+
+
+class TestDatabase:
+    """Create a fresh test database for the duration of a ``with`` block.
+
+    SQLite test databases default to memory; a temporary file is used
+    instead so the timings include real I/O. Aliases mirroring the default
+    database, such as the production profile's ``reports``, are pointed at
+    it as the test runner would, so report reads see the seeded data.
+    """
+
+    def __enter__(self):
+        self.test_settings = connection.settings_dict['TEST']
+        self.original_test_name = self.test_settings.get('NAME')
+        self.tempdir = None
+        if connection.vendor == 'sqlite' and not self.original_test_name:
+            self.tempdir = tempfile.TemporaryDirectory()
+            self.test_settings['NAME'] = os.path.join(self.tempdir.name, 'benchmark.sqlite3')
+        self.old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        self.mirrors = {}
+        for alias in connections:
+            mirror = connections[alias]
+            if alias != DEFAULT_DB_ALIAS and mirror.settings_dict['TEST'].get('MIRROR') == DEFAULT_DB_ALIAS:
+                self.mirrors[alias] = mirror.settings_dict['NAME']
+                mirror.close()
+                mirror.creation.set_as_test_mirror(connection.settings_dict)
+        cache.clear()
+        return self
+
+    def __exit__(self, *exc_info):
+        for alias, name in self.mirrors.items():
+            connections[alias].close()
+            connections[alias].settings_dict['NAME'] = name
+        connection.creation.destroy_test_db(self.old_name, verbosity=0)
+        self.test_settings['NAME'] = self.original_test_name
+        if self.tempdir:
+            self.tempdir.cleanup()
+        cache.clear()
+
+
+def check(response):
+    if response.status_code != 200:
+        raise CommandError(f'{response.request["PATH_INFO"]} returned {response.status_code}')
+    return response
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as fh:
+        try:
+            return json.load(fh)
+        except ValueError:
+            raise CommandError(f'{path} is not a benchmark history file.')
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,71 @@
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+# The only key the old session-based student flow stored
+STUDENT_SESSION_KEYS = {'student_feedback_session'}
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired sessions in bounded batches, and with --student-sessions the unexpired "
+        "anonymous sessions left by the old session-based feedback form. Student forms now use "
+        "signed submission tokens, so nothing new accumulates; unlike clearsessions this never "
+        "issues one unbounded DELETE."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Sessions read and deleted per batch.')
+        parser.add_argument('--limit', type=int, default=100000, help='Stop after deleting this many sessions.')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Seconds to sleep between batches, to leave room for other writers.')
+        parser.add_argument('--dry-run', action='store_true', help='Count what would be deleted without deleting.')
+        parser.add_argument('--student-sessions', action='store_true',
+                            help='Also delete unexpired sessions holding only the old student form key.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['limit'] < 1:
+            raise CommandError('--batch-size and --limit must be positive.')
+        self.options = options
+        self.deleted = 0
+
+        expired = self.sweep(
+            Session.objects.filter(expire_date__lt=timezone.now()), keep=lambda session: False
+        )
+        students = 0
+        if options['student_sessions']:
+            students = self.sweep(
+                Session.objects.filter(expire_date__gte=timezone.now()), keep=lambda session: not is_student_session(session)
+            )
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f"{verb} {expired} expired and {students} student sessions"))
+        if self.deleted >= options['limit']:
+            self.stdout.write(f"Stopped at --limit {options['limit']}; run again to continue.")
+
+    def sweep(self, sessions, keep):
+        """Walk ``sessions`` in key order, deleting every batch member ``keep`` rejects."""
+        batch_size = self.options['batch_size']
+        deleted = 0
+        last_key = ''
+        while self.deleted < self.options['limit']:
+            batch = list(sessions.filter(session_key__gt=last_key).order_by('session_key')[:batch_size])
+            if not batch:
+                break
+            last_key = batch[-1].session_key
+            doomed = [session.session_key for session in batch if not keep(session)]
+            doomed = doomed[:self.options['limit'] - self.deleted]
+            if doomed and not self.options['dry_run']:
+                Session.objects.filter(session_key__in=doomed).delete()
+            deleted += len(doomed)
+            self.deleted += len(doomed)
+            if self.options['pause']:
+                time.sleep(self.options['pause'])
+        return deleted
+
+
+def is_student_session(session):
+    """True for a session holding nothing but the old student form key."""
+    data = session.get_decoded()
+    return bool(data) and set(data) <= STUDENT_SESSION_KEYS
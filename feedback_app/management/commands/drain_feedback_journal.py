@@ -0,0 +1,86 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from feedback_app import journal
+
+logger = logging.getLogger(__name__)
+
+MAX_BACKOFF = 60  # Seconds between attempts while the database is unavailable
+
+
+class Command(BaseCommand):
+    help = "Flush the write-behind submission journal into StudentFeedbackResponse."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Journal entries written per database transaction.')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to sleep when the journal is empty.')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain everything that is pending, then exit.')
+        parser.add_argument('--status', action='store_true',
+                            help='Print the current journal lag and exit.')
+        parser.add_argument('--requeue-failed', action='store_true',
+                            help='Put entries that were set aside after failing back in the queue, then drain.')
+        parser.add_argument('--purge-after', type=float, default=7 * 24 * 3600,
+                            help='Delete drained entries older than this many seconds.')
+
+    def handle(self, *args, **options):
+        if not journal.is_enabled():
+            raise CommandError('FEEDBACK_JOURNAL_ENABLED is off; there is no journal to drain.')
+
+        if options['status']:
+            self.report_lag()
+            return
+
+        if options['requeue_failed']:
+            self.stdout.write(f"Requeued {journal.requeue_failed()} failed entries")
+
+        self.stdout.write(f"Draining {settings.FEEDBACK_JOURNAL_PATH} (batch size {options['batch_size']})")
+        last_report = 0.0
+        failures = 0
+        try:
+            while True:
+                try:
+                    drained = journal.drain(options['batch_size'])
+                except Exception as e:
+                    # Nothing was marked drained; the entries stay journaled
+                    logger.exception('Draining the feedback journal failed')
+                    if options['once']:
+                        raise CommandError(f'Draining failed: {e}')
+                    failures += 1
+                    delay = min(options['interval'] * 2 ** failures, MAX_BACKOFF)
+                    self.stderr.write(f"Draining failed ({e}); retrying in {delay:.0f}s")
+                    time.sleep(delay)
+                    continue
+                failures = 0
+                if drained:
+                    self.stdout.write(f"Drained {drained} submissions")
+                    continue
+
+                journal.purge_drained(options['purge_after'])
+                if options['once']:
+                    break
+                if time.monotonic() - last_report > 60:
+                    self.report_lag()
+                    last_report = time.monotonic()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.report_lag()
+
+    def report_lag(self):
+        lag = journal.lag()
+        self.stdout.write(
+            f"Journal lag: {lag['pending']} pending, oldest {lag['oldest_pending_seconds']}s"
+        )
+        if lag['failed']:
+            self.stdout.write(self.style.WARNING(
+                f"{lag['failed']} entries failed {journal.max_attempts()} times and were set aside; "
+                "fix the cause and re-run with --requeue-failed"
+            ))
+            for entry_id, session_id, attempts, error in journal.failed_entries(10):
+                self.stdout.write(f"  #{entry_id} {session_id}: {error}")
@@ -0,0 +1,70 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from feedback_app import access_codes
+from feedback_app.models import TeacherBatch
+
+
+class Command(BaseCommand):
+    help = (
+        "Write printable sheets of one-time feedback access codes, one CSV or PDF file per "
+        "teacher-course. Codes are derived from SECRET_KEY, so re-running with the same slots "
+        "prints the same codes; nothing is written to the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('teacher_batch_ids', nargs='*', type=int,
+                            help='TeacherBatch ids to print codes for.')
+        parser.add_argument('--active', action='store_true',
+                            help='Every teacher-course that is active for feedback.')
+        parser.add_argument('--count', type=int,
+                            help='Codes (student slots) per teacher-course. Defaults to the batch roster '
+                                 f'size, or {access_codes.DEFAULT_SLOTS} for batches without a roster.')
+        parser.add_argument('--start', type=int, default=1, help='First slot number.')
+        parser.add_argument('--format', choices=['csv', 'pdf'], default='pdf', dest='file_format')
+        parser.add_argument('--output-dir', default='access_codes', help='Directory the sheets are written to.')
+
+    def handle(self, *args, **options):
+        if (options['count'] is not None and options['count'] < 1) or options['start'] < 1:
+            raise CommandError('--count and --start must be positive.')
+        if options['start'] + (options['count'] or 1) > access_codes.STUDENT_SLOT_BASE:
+            raise CommandError(f'Sheet slots must stay below {access_codes.STUDENT_SLOT_BASE}; '
+                               'the slots above belong to rostered students.')
+
+        teacher_batches = TeacherBatch.objects.select_related('teacher', 'course', 'batch').order_by('pk')
+        if options['active']:
+            teacher_batches = teacher_batches.filter(is_active_for_feedback=True)
+        elif options['teacher_batch_ids']:
+            teacher_batches = teacher_batches.filter(pk__in=options['teacher_batch_ids'])
+            missing = set(options['teacher_batch_ids']) - {tb.pk for tb in teacher_batches}
+            if missing:
+                raise CommandError(f"Unknown TeacherBatch ids: {', '.join(map(str, sorted(missing)))}")
+        else:
+            raise CommandError('Name some TeacherBatch ids or pass --active.')
+
+        os.makedirs(options['output_dir'], exist_ok=True)
+        started = time.perf_counter()
+        sheets = total = 0
+        for tb in teacher_batches:
+            count = options['count'] or tb.batch.enrolled_count or access_codes.DEFAULT_SLOTS
+            count = min(count, access_codes.STUDENT_SLOT_BASE - options['start'])
+            codes = access_codes.generate_codes(tb.pk, count, options['start'])
+            path = os.path.join(options['output_dir'], f"access_codes_{tb.course.code}_{tb.pk}.{options['file_format']}")
+            if options['file_format'] == 'csv':
+                with open(path, 'w', newline='') as fh:
+                    access_codes.write_csv(fh, codes)
+            else:
+                with open(path, 'wb') as fh:
+                    access_codes.write_pdf(
+                        fh, f'{tb.course.code} - {tb.teacher.name} ({tb.batch.acad_year} {tb.batch.part})', codes,
+                        instructions='One code per student. Enter it at /student-feedback/code/',
+                    )
+            sheets += 1
+            total += len(codes)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {total:,} codes on {sheets} sheets to {options['output_dir']} "
+            f"in {time.perf_counter() - started:.2f}s"
+        ))
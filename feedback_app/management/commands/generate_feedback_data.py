@@ -0,0 +1,221 @@
+import random
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from feedback_app.forms import DESIGNATION_CHOICES, LEVEL_CHOICES, PART_CHOICES
+from feedback_app.models import (
+    Batch, Course, Department, FeedbackQOption, FeedbackQuestion, Programme,
+    Role, StudentFeedbackResponse, Teacher, TeacherBatch, guess_option_score,
+)
+from feedback_app.questionnaire import bump_questionnaire_version
+from feedback_app.rollups import rebuild_rollups
+
+RATING_OPTIONS = ['Excellent', 'Good', 'Average', 'Poor', 'Very Poor']
+# Students lean positive, which is what real drives look like
+RATING_WEIGHTS = [30, 35, 20, 10, 5]
+COMMENTS = [
+    'Explains concepts clearly.',
+    'Please share more worked examples.',
+    'Classes are well organised.',
+    'The pace is a bit fast.',
+    'Very approachable outside class.',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a seeded synthetic dataset (departments, programmes, courses, batches, "
+        "teachers, assignments, questions and student responses) for scale testing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1, help='Random seed; also namespaces generated usernames.')
+        parser.add_argument('--departments', type=int, default=6)
+        parser.add_argument('--programmes', type=int, default=2, help='Programmes per department.')
+        parser.add_argument('--courses', type=int, default=5, help='Courses per programme.')
+        parser.add_argument('--batches', type=int, default=2, help='Batches per course.')
+        parser.add_argument('--teachers', type=int, default=10, help='Teachers per department.')
+        parser.add_argument('--teachers-per-course', type=int, default=2, help='Teachers assigned to each course batch.')
+        parser.add_argument('--mcq-questions', type=int, default=10, help='Used only when no active questions exist.')
+        parser.add_argument('--desc-questions', type=int, default=2, help='Used only when no active questions exist.')
+        parser.add_argument('--responses', type=int, default=100000, help='Approximate number of response rows.')
+        parser.add_argument('--days', type=int, default=180, help='Spread submissions over this many past days.')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Rows per bulk insert.')
+        parser.add_argument('--password', default='synthetic', help='Password for every generated teacher user.')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        self.rng = random.Random(options['seed'])
+        self.chunk_size = options['chunk_size']
+        self.username_prefix = f"synth{options['seed']}_"
+        if User.objects.filter(username__startswith=self.username_prefix).exists():
+            raise CommandError(f"Users named {self.username_prefix}* already exist; pick another --seed.")
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            teacher_batches = self.create_structure(options)
+            questionnaire = self.create_questions(options)
+        self.stdout.write(f"Created {len(teacher_batches)} teacher-course assignments in {time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+        rows = self.create_responses(teacher_batches, questionnaire, options)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Inserted {rows} responses in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:,.0f} rows/s)"
+        ))
+
+        # The raw inserts bypass save_submissions, so recount the rollups once at the end
+        started = time.perf_counter()
+        rebuild_rollups()
+        self.stdout.write(f"Rebuilt feedback rollups in {time.perf_counter() - started:.1f}s")
+
+    def create_structure(self, options):
+        rng = self.rng
+        roles = {name: Role.objects.get_or_create(role_name=name)[0] for name in ('Teacher', 'HOD')}
+        groups = {name: Group.objects.get_or_create(name=name.lower())[0] for name in roles}
+
+        departments = Department.objects.bulk_create(
+            Department(dept_name=f'Department {d + 1}') for d in range(options['departments'])
+        )
+        programmes = Programme.objects.bulk_create(
+            Programme(pgm_name=f'{dept.dept_name} Programme {p + 1}', dept=dept, level=rng.choice(LEVEL_CHOICES)[0])
+            for dept in departments for p in range(options['programmes'])
+        )
+        courses = Course.objects.bulk_create(
+            Course(
+                name=f'{pgm.pgm_name} Course {c + 1}', code=f'D{pgm.dept_id}P{pgm.pgm_id}C{c + 1}',
+                credit=rng.choice([2, 3, 4]), dept=pgm.dept, pgm=pgm,
+            )
+            for pgm in programmes for c in range(options['courses'])
+        )
+        this_year = timezone.now().year
+        batches = Batch.objects.bulk_create(
+            Batch(
+                course=course, acad_year=str(this_year - b // len(PART_CHOICES)),
+                part=PART_CHOICES[b % len(PART_CHOICES)][0], is_active=True,
+            )
+            for course in courses for b in range(options['batches'])
+        )
+
+        # Hashing is deliberately slow, so every generated user shares one hash
+        password = make_password(options['password'])
+        users = User.objects.bulk_create(
+            User(username=f'{self.username_prefix}{n + 1}', password=password)
+            for n in range(options['departments'] * options['teachers'])
+        )
+        teachers = []
+        memberships = []
+        for n, user in enumerate(users):
+            dept = departments[n // options['teachers']]
+            role_name = 'HOD' if n % options['teachers'] == 0 else 'Teacher'
+            teachers.append(Teacher(
+                user=user, name=f'Teacher {n + 1}', dept=dept,
+                designation=rng.choice(DESIGNATION_CHOICES)[0],
+                gender=rng.choice(['Male', 'Female']), role=roles[role_name], fb_active=True,
+            ))
+            memberships.append(User.groups.through(user_id=user.id, group_id=groups[role_name].id))
+        teachers = Teacher.objects.bulk_create(teachers)
+        User.groups.through.objects.bulk_create(memberships)
+
+        teachers_by_dept = {}
+        for teacher in teachers:
+            teachers_by_dept.setdefault(teacher.dept_id, []).append(teacher)
+        courses_by_id = {course.course_id: course for course in courses}
+        assignments = []
+        for batch in batches:
+            course = courses_by_id[batch.course_id]
+            pool = teachers_by_dept[course.dept_id]
+            for teacher in rng.sample(pool, min(options['teachers_per_course'], len(pool))):
+                assignments.append(TeacherBatch(
+                    teacher=teacher, batch=batch, course=course,
+                    department_id=course.dept_id, is_active_for_feedback=True,
+                ))
+        return TeacherBatch.objects.bulk_create(assignments)
+
+    def create_questions(self, options):
+        """Return ``[(question_id, q_type, [option ids])]`` for the active questions."""
+        questions = list(FeedbackQuestion.objects.filter(active=True).order_by('q_id'))
+        if not questions:
+            questions = FeedbackQuestion.objects.bulk_create(
+                [FeedbackQuestion(q_desc=f'Synthetic rating question {n + 1}', q_type='MCQ')
+                 for n in range(options['mcq_questions'])]
+                + [FeedbackQuestion(q_desc=f'Synthetic comment question {n + 1}', q_type='DESC')
+                   for n in range(options['desc_questions'])]
+            )
+            FeedbackQOption.objects.bulk_create(
+                FeedbackQOption(q=question, ans_id=f'opt_{i}', answer=answer, score=guess_option_score(answer))
+                for question in questions if question.q_type == 'MCQ'
+                for i, answer in enumerate(RATING_OPTIONS, 1)
+            )
+            # bulk_create sends no post_save
+            bump_questionnaire_version()
+
+        option_ids = {}
+        for option_id, q_id in FeedbackQOption.objects.filter(q__in=questions).order_by('q_id', 'ans_id').values_list('id', 'q_id'):
+            option_ids.setdefault(q_id, []).append(option_id)
+        return [(q.q_id, q.q_type, option_ids.get(q.q_id, [])) for q in questions]
+
+    def create_responses(self, teacher_batches, questionnaire, options):
+        rng = self.rng
+        if not teacher_batches or not questionnaire:
+            return 0
+
+        sessions = max(1, options['responses'] // len(questionnaire))
+        counters = {tb.pk: tb.feedback_counter for tb in teacher_batches}
+        tb_ids = list(counters)
+        now = timezone.now()
+        span = options['days'] * 24 * 3600
+
+        meta = StudentFeedbackResponse._meta
+        fields = ['question', 'response_text', 'selected_option', 'submitted_at',
+                  'session_id', 'feedback_number', 'teacher_batch']
+        # Raw executemany skips model instantiation and the auto_now_add
+        # override, which lets submitted_at be spread over the past
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            connection.ops.quote_name(meta.db_table),
+            ', '.join(connection.ops.quote_name(meta.get_field(f).column) for f in fields),
+            ', '.join(['%s'] * len(fields)),
+        )
+        adapt = connection.ops.adapt_datetimefield_value
+
+        chunk = []
+        inserted = 0
+        for _ in range(sessions):
+            tb_id = rng.choice(tb_ids)
+            counters[tb_id] += 1
+            session_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+            submitted_at = adapt(now - timedelta(seconds=rng.randrange(span)))
+            for q_id, q_type, option_ids in questionnaire:
+                if q_type == 'MCQ' and option_ids:
+                    weights = RATING_WEIGHTS if len(option_ids) == len(RATING_WEIGHTS) else None
+                    option_id = rng.choices(option_ids, weights)[0]
+                    chunk.append((q_id, None, option_id, submitted_at, session_id, counters[tb_id], tb_id))
+                else:
+                    text = rng.choice(COMMENTS) if rng.random() < 0.3 else None
+                    chunk.append((q_id, text, None, submitted_at, session_id, counters[tb_id], tb_id))
+            if len(chunk) >= self.chunk_size:
+                inserted += self.flush(sql, chunk)
+                chunk = []
+        inserted += self.flush(sql, chunk)
+
+        TeacherBatch.objects.bulk_update(
+            [TeacherBatch(pk=tb_id, feedback_counter=counter) for tb_id, counter in counters.items()],
+            ['feedback_counter'], batch_size=1000,
+        )
+        return inserted
+
+    def flush(self, sql, rows):
+        if not rows:
+            return 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+        if self.verbosity > 1:
+            self.stdout.write(f"  inserted {len(rows)} rows")
+        return len(rows)
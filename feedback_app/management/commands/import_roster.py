@@ -0,0 +1,73 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from feedback_app.models import Batch
+from feedback_app.roster import RosterError, import_roster, issue_missing_keys, read_roster_csv
+
+
+class Command(BaseCommand):
+    help = (
+        "Import a student roster CSV (roll_number, name, batch_id columns) in chunked "
+        "transactions. Students already enrolled in a batch are skipped, so a failed "
+        "import can be fixed and re-run. Students new to the roster get an access key, "
+        "written to --keys-output; only a digest is stored, so that file is the only copy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path', nargs='?', help='Roster CSV file.')
+        parser.add_argument('--batch', type=int, dest='batch_id',
+                            help='Enrol every row in this Batch; the file then needs no batch_id column.')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows written per transaction.')
+        parser.add_argument('--keys-output', default='roster_keys.csv',
+                            help='CSV the new access keys are appended to, to be handed out to the students.')
+        parser.add_argument('--issue-missing-keys', action='store_true',
+                            help='Import nothing; give a key to every rostered student without one.')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive.')
+        if not options['csv_path'] and not options['issue_missing_keys']:
+            raise CommandError('Name a roster CSV or pass --issue-missing-keys.')
+        if options['batch_id'] is not None and not Batch.objects.filter(pk=options['batch_id']).exists():
+            raise CommandError(f"Unknown batch id {options['batch_id']}.")
+
+        started = time.perf_counter()
+        issued = 0
+        try:
+            # Appended to, and flushed per chunk, so keys of committed chunks survive a failed import
+            with open(options['keys_output'], 'a', newline='') as keys_fh:
+                writer = csv.writer(keys_fh)
+                if not keys_fh.tell():
+                    writer.writerow(['roll_number', 'name', 'access_key'])
+
+                def write_keys(rows):
+                    nonlocal issued
+                    writer.writerows(rows)
+                    keys_fh.flush()
+                    issued += len(rows)
+
+                if options['issue_missing_keys']:
+                    issue_missing_keys(write_keys, chunk_size=options['chunk_size'])
+                else:
+                    with open(options['csv_path'], newline='', encoding='utf-8-sig') as fh:
+                        added, skipped = import_roster(
+                            read_roster_csv(fh, options['batch_id']), chunk_size=options['chunk_size'], keys=write_keys,
+                        )
+        except OSError as e:
+            raise CommandError(str(e))
+        except RosterError as e:
+            raise CommandError(f'{e} Rows before the failing chunk were imported; their keys are in '
+                               f"{options['keys_output']}.")
+
+        if not options['issue_missing_keys']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Enrolled {added:,} students ({skipped:,} already enrolled) "
+                f"in {time.perf_counter() - started:.1f}s"
+            ))
+        if issued:
+            self.stdout.write(self.style.WARNING(
+                f"Wrote {issued:,} new access keys to {options['keys_output']}. It is the only copy: "
+                "hand the keys out to the students, then delete the file."
+            ))
@@ -0,0 +1,228 @@
+import http.cookiejar
+import json
+import math
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+TEACHER_COURSE_LINK = re.compile(r'/student-feedback/teacher-course/(\d+)/')
+CSRF_INPUT = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+SUBMISSION_TOKEN = re.compile(r'name="submission_token" value="([^"]+)"')
+MCQ_OPTION = re.compile(r'data-question="question_(\d+)" data-value="(\d+)"')
+DESC_FIELD = re.compile(r'<textarea[^>]*name="question_(\d+)"')
+
+ENDPOINTS = ('select_teacher_for_feedback', 'student_feedback_form_by_teacher_course', 'submit_student_feedback')
+
+
+class InProcessSession:
+    """One student's cookie jar, talking to the WSGI handler directly."""
+
+    def __init__(self):
+        self.client = Client(enforce_csrf_checks=True, raise_request_exception=False, SERVER_NAME=allowed_host())
+
+    def get(self, path):
+        response = self.client.get(path)
+        return response.status_code, response.content.decode()
+
+    def post(self, path, data, csrf_token, idempotency_key=None):
+        extra = {'HTTP_IDEMPOTENCY_KEY': idempotency_key} if idempotency_key else {}
+        response = self.client.post(path, data, HTTP_X_CSRFTOKEN=csrf_token, **extra)
+        return response.status_code, response.content.decode()
+
+
+class HttpSession:
+    """One student's cookie jar, talking to a running server over HTTP."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def _open(self, request):
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                return response.status, response.read().decode()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode(errors='replace')
+
+    def get(self, path):
+        return self._open(urllib.request.Request(self.base_url + path))
+
+    def post(self, path, data, csrf_token, idempotency_key=None):
+        headers = {'X-CSRFToken': csrf_token, 'Referer': self.base_url + '/'}
+        if idempotency_key:
+            headers['Idempotency-Key'] = idempotency_key
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=urllib.parse.urlencode(data).encode(),
+            headers=headers,
+        )
+        return self._open(request)
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate concurrent anonymous students going through the feedback journey "
+        "(teacher list -> feedback form -> submit) and report latency per endpoint. "
+        "Submissions are really written, so point it at a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=100, help='Number of simulated students.')
+        parser.add_argument('--concurrency', type=int, default=10, help='Students running at the same time.')
+        parser.add_argument('--url', help='Base URL of a running server; omit to use an in-process WSGI client.')
+        parser.add_argument('--teacher-batch', type=int, action='append', dest='teacher_batches',
+                            help='TeacherBatch id to give feedback for (repeatable). '
+                                 'Defaults to a random course from the teacher list.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for course and answer choices.')
+        parser.add_argument('--output', help='Also write the raw summary as JSON to this file.')
+
+    def handle(self, *args, **options):
+        if options['students'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--students and --concurrency must be positive.')
+
+        self.base_url = options['url']
+        self.teacher_batches = options['teacher_batches']
+        self.seed = options['seed']
+        self.samples = defaultdict(list)
+        self.lock = threading.Lock()
+
+        target = self.base_url or 'in-process WSGI client'
+        self.stdout.write(
+            f"Running {options['students']} students, {options['concurrency']} at a time, against {target}"
+        )
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            list(pool.map(self.run_student, range(options['students'])))
+        elapsed = time.perf_counter() - started
+
+        summary = self.summarise(elapsed)
+        self.print_summary(summary)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(summary, fh, indent=2)
+
+    def record(self, endpoint, latency, ok, body=''):
+        with self.lock:
+            self.samples[endpoint].append({
+                'latency': latency,
+                'ok': ok,
+                # "database is locked" / "database table is locked" from SQLite
+                'lock_timeout': 'is locked' in body,
+            })
+
+    def timed(self, endpoint, call, *args):
+        started = time.perf_counter()
+        try:
+            status, body = call(*args)
+        except Exception as e:
+            self.record(endpoint, time.perf_counter() - started, False, str(e))
+            return None, ''
+        self.record(endpoint, time.perf_counter() - started, status == 200, body if status != 200 else '')
+        return status, body
+
+    def run_student(self, index):
+        rng = random.Random(f'{self.seed}-{index}')
+        session = HttpSession(self.base_url) if self.base_url else InProcessSession()
+
+        status, body = self.timed(ENDPOINTS[0], session.get, reverse('select_teacher_for_feedback'))
+        if status != 200:
+            return
+        choices = self.teacher_batches or [int(tb) for tb in TEACHER_COURSE_LINK.findall(body)]
+        if not choices:
+            return
+        teacher_batch_id = rng.choice(choices)
+
+        status, body = self.timed(
+            ENDPOINTS[1], session.get,
+            reverse('student_feedback_form_by_teacher_course', args=[teacher_batch_id]),
+        )
+        if status != 200:
+            return
+        csrf = CSRF_INPUT.search(body)
+        token = SUBMISSION_TOKEN.search(body)
+        if not csrf or not token:
+            self.record(ENDPOINTS[1], 0.0, False)
+            return
+
+        options_by_question = defaultdict(list)
+        for question_id, option_id in MCQ_OPTION.findall(body):
+            options_by_question[question_id].append(option_id)
+        data = {'teacher_batch_id': teacher_batch_id, 'submission_token': token.group(1)}
+        for question_id, option_ids in options_by_question.items():
+            data[f'question_{question_id}'] = rng.choice(option_ids)
+        for question_id in DESC_FIELD.findall(body):
+            data[f'question_{question_id}'] = f'Load test comment {index}'
+
+        started = time.perf_counter()
+        try:
+            # Keyed like the browser form, so the idempotency check is part of the measured cost
+            status, body = session.post(reverse('submit_student_feedback'), data, csrf.group(1), uuid.uuid4().hex)
+        except Exception as e:
+            self.record(ENDPOINTS[2], time.perf_counter() - started, False, str(e))
+            return
+        latency = time.perf_counter() - started
+        try:
+            ok = status == 200 and json.loads(body).get('success', False)
+        except ValueError:
+            ok = False
+        self.record(ENDPOINTS[2], latency, ok, '' if ok else body)
+
+    def summarise(self, elapsed):
+        summary = {'elapsed_seconds': round(elapsed, 3), 'endpoints': {}}
+        for endpoint in ENDPOINTS:
+            samples = self.samples.get(endpoint, [])
+            latencies = sorted(s['latency'] for s in samples)
+            count = len(samples)
+            summary['endpoints'][endpoint] = {
+                'requests': count,
+                'throughput_per_second': round(count / elapsed, 2) if elapsed else 0.0,
+                'p50_ms': percentile(latencies, 50),
+                'p95_ms': percentile(latencies, 95),
+                'p99_ms': percentile(latencies, 99),
+                'error_rate': round(sum(not s['ok'] for s in samples) / count, 4) if count else 0.0,
+                'lock_timeout_rate': round(sum(s['lock_timeout'] for s in samples) / count, 4) if count else 0.0,
+            }
+        return summary
+
+    def print_summary(self, summary):
+        self.stdout.write(f"\nFinished in {summary['elapsed_seconds']}s\n")
+        header = f"{'endpoint':<42}{'reqs':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>9}{'locked':>9}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for endpoint, stats in summary['endpoints'].items():
+            self.stdout.write(
+                f"{endpoint:<42}{stats['requests']:>6}{stats['throughput_per_second']:>9}"
+                f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}"
+                f"{stats['error_rate']:>9.2%}{stats['lock_timeout_rate']:>9.2%}"
+            )
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of already sorted seconds, in milliseconds."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return round(sorted_values[rank] * 1000, 2)
+
+
+def allowed_host():
+    """A host name the in-process client can use without tripping ALLOWED_HOSTS."""
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*':
+            return host.lstrip('.')
+    # An empty ALLOWED_HOSTS still accepts localhost while DEBUG is on
+    return 'localhost'
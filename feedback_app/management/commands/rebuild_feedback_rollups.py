@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from feedback_app.rollups import rebuild_rollups, verify_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the feedback rollups (option counts per teacher-course and question, "
+        "per teacher-course submission totals and per batch enrolment) from the stored responses "
+        "and rosters."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Only compare the rollups with the stored responses; exit non-zero on mismatch.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk write.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['verify']:
+            problems = verify_rollups()
+            for problem in problems[:50]:
+                self.stderr.write(problem)
+            if problems:
+                raise CommandError(
+                    f"{len(problems)} rollup mismatches found; run rebuild_feedback_rollups to fix them."
+                )
+            self.stdout.write(self.style.SUCCESS(
+                f"Rollups match the stored responses ({time.perf_counter() - started:.1f}s)"
+            ))
+            return
+
+        rows = rebuild_rollups(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {rows} option count rows in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from feedback_app.sqlite import CHECKPOINT_MODES, checkpoint, database_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Report SQLite file, WAL and page cache statistics, and optionally checkpoint the WAL. "
+        "Run with --checkpoint TRUNCATE from cron under the production profile so long report "
+        "reads cannot leave the WAL growing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database alias to inspect.')
+        parser.add_argument('--checkpoint', choices=[mode.lower() for mode in CHECKPOINT_MODES],
+                            type=str.lower, help='Checkpoint the WAL first, in this mode.')
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        if alias not in connections:
+            raise CommandError(f"Unknown database alias '{alias}'.")
+        if connections[alias].vendor != 'sqlite':
+            raise CommandError(f"Database '{alias}' is not SQLite.")
+
+        if options['checkpoint']:
+            busy, wal_pages, checkpointed = checkpoint(options['checkpoint'], alias)
+            if busy:
+                self.stdout.write(self.style.WARNING(
+                    f"Checkpoint ({options['checkpoint']}) was blocked by a reader or writer: "
+                    f"{checkpointed} of {wal_pages} WAL pages copied back"
+                ))
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Checkpoint ({options['checkpoint']}) copied {checkpointed} of {wal_pages} WAL pages back"
+                ))
+
+        stats = database_stats(alias)
+        rows = [
+            ('Database file', stats['path']),
+            ('File size', megabytes(stats['file_bytes'])),
+            ('Pages', f"{stats['page_count']:,} x {stats['page_size']:,} bytes"),
+            ('Free pages', f"{stats['freelist_count']:,} ({megabytes(stats['free_bytes'])})"),
+            ('Journal mode', stats['journal_mode']),
+            ('Synchronous', {0: 'OFF', 1: 'NORMAL', 2: 'FULL', 3: 'EXTRA'}.get(stats['synchronous'], stats['synchronous'])),
+            ('WAL size', f"{megabytes(stats['wal_bytes'])} ({stats['wal_pages']:,} pages)"),
+            ('WAL autocheckpoint', f"{stats['wal_autocheckpoint']:,} pages"),
+            ('Shared memory file', megabytes(stats['shm_bytes'])),
+            ('Page cache', f"{megabytes(stats['cache_bytes'])} per connection"),
+            ('Memory map', megabytes(stats['mmap_size'])),
+            ('Busy timeout', f"{stats['busy_timeout']} ms"),
+        ]
+        width = max(len(label) for label, _ in rows)
+        for label, value in rows:
+            self.stdout.write(f"{label:<{width}}  {value}")
+
+
+def megabytes(size):
+    return f"{size / (1024 * 1024):,.1f} MiB"
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:28
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def backfill_feedback_counter(apps, schema_editor):
+    TeacherBatch = apps.get_model('feedback_app', 'TeacherBatch')
+    StudentFeedbackResponse = apps.get_model('feedback_app', 'StudentFeedbackResponse')
+
+    last_numbers = (
+        StudentFeedbackResponse.objects.filter(teacher_batch__isnull=False)
+        .order_by()
+        .values('teacher_batch_id')
+        .annotate(last=Max('feedback_number'))
+    )
+    for row in last_numbers:
+        TeacherBatch.objects.filter(pk=row['teacher_batch_id']).update(feedback_counter=row['last'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback_app', '0015_remove_studentfeedbackresponse_teacher'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='teacherbatch',
+            name='feedback_counter',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_feedback_counter, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def backfill_rollups(apps, schema_editor):
+    StudentFeedbackResponse = apps.get_model('feedback_app', 'StudentFeedbackResponse')
+    TeacherBatch = apps.get_model('feedback_app', 'TeacherBatch')
+    FeedbackOptionCount = apps.get_model('feedback_app', 'FeedbackOptionCount')
+
+    grouped = (
+        StudentFeedbackResponse.objects.filter(teacher_batch__isnull=False)
+        .order_by()
+        .values_list('teacher_batch_id', 'question_id', 'selected_option_id')
+        .annotate(n=Count('pk'))
+    )
+    FeedbackOptionCount.objects.bulk_create(
+        [
+            FeedbackOptionCount(teacher_batch_id=tb_id, question_id=q_id, selected_option_id=option_id, count=n)
+            for tb_id, q_id, option_id, n in grouped
+        ],
+        batch_size=1000,
+    )
+
+    totals = (
+        StudentFeedbackResponse.objects.filter(teacher_batch__isnull=False)
+        .order_by()
+        .values_list('teacher_batch_id')
+        .annotate(submissions=Count('session_id', distinct=True), responses=Count('pk'), latest=Max('submitted_at'))
+    )
+    for tb_id, submissions, responses, latest in totals:
+        TeacherBatch.objects.filter(pk=tb_id).update(
+            submission_count=submissions, response_count=responses, last_submitted_at=latest,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback_app', '0016_teacherbatch_feedback_counter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='teacherbatch',
+            name='last_submitted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='teacherbatch',
+            name='response_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='teacherbatch',
+            name='submission_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='FeedbackOptionCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.IntegerField(default=0)),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='feedback_app.feedbackquestion')),
+                ('selected_option', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='feedback_app.feedbackqoption')),
+                ('teacher_batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='feedback_app.teacherbatch')),
+            ],
+            options={
+                'unique_together': {('teacher_batch', 'question', 'selected_option')},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:41
+
+from django.db import migrations, models
+
+# Frozen copy of models.SCORE_KEYWORDS; checked in order so "very poor" wins over "poor"
+SCORE_KEYWORDS = [
+    ('very poor', 1),
+    ('excellent', 5),
+    ('good', 4),
+    ('average', 3),
+    ('poor', 2),
+]
+
+
+def backfill_scores(apps, schema_editor):
+    FeedbackQOption = apps.get_model('feedback_app', 'FeedbackQOption')
+    options = list(FeedbackQOption.objects.all())
+    for option in options:
+        answer = (option.answer or '').lower()
+        option.score = next((score for keyword, score in SCORE_KEYWORDS if keyword in answer), None)
+    FeedbackQOption.objects.bulk_update(options, ['score'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback_app', '0017_feedback_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feedbackqoption',
+            name='score',
+            field=models.PositiveSmallIntegerField(blank=True, choices=[(5, '5 - Excellent'), (4, '4 - Good'), (3, '3 - Average'), (2, '2 - Poor'), (1, '1 - Very Poor')], null=True),
+        ),
+        migrations.RunPython(backfill_scores, migrations.RunPython.noop),
+    ]
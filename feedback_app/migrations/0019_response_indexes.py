@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback_app', '0018_feedbackqoption_score'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='studentfeedbackresponse',
+            index=models.Index(fields=['teacher_batch', 'session_id'], name='sfr_tb_session_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentfeedbackresponse',
+            index=models.Index(fields=['question', 'selected_option'], name='sfr_question_option_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentfeedbackresponse',
+            index=models.Index(fields=['submitted_at'], name='sfr_submitted_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentfeedbackresponse',
+            index=models.Index(fields=['session_id'], name='sfr_session_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='teacherbatch',
+            index=models.Index(condition=models.Q(('is_active_for_feedback', True)), fields=['is_active_for_feedback', 'batch'], name='tb_active_batch_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback_app', '0019_response_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccessCodeRedemption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.PositiveIntegerField()),
+                ('redeemed_at', models.DateTimeField(auto_now_add=True)),
+                ('teacher_batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='feedback_app.teacherbatch')),
+            ],
+            options={
+                'db_table': 'access_code_redemption',
+                'constraints': [models.UniqueConstraint(fields=('teacher_batch', 'slot'), name='access_code_once')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback_app', '0020_access_code_redemption'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batch',
+            name='enrolled_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='RosterEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('roll_number', models.CharField(max_length=30)),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('slot', models.PositiveIntegerField()),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='roster', to='feedback_app.batch')),
+            ],
+            options={
+                'db_table': 'roster_entry',
+                'indexes': [models.Index(fields=['roll_number', 'batch', 'slot'], name='roster_roll_idx')],
+                'constraints': [models.UniqueConstraint(fields=('batch', 'roll_number'), name='roster_batch_roll'), models.UniqueConstraint(fields=('batch', 'slot'), name='roster_batch_slot')],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def backfill_sessions(apps, schema_editor):
+    StudentFeedbackResponse = apps.get_model('feedback_app', 'StudentFeedbackResponse')
+    FeedbackSession = apps.get_model('feedback_app', 'FeedbackSession')
+
+    grouped = (
+        StudentFeedbackResponse.objects.order_by()
+        .values_list('teacher_batch_id', 'session_id')
+        .annotate(first=Min('submitted_at'), number=Min('feedback_number'))
+    )
+    FeedbackSession.objects.bulk_create(
+        [
+            FeedbackSession(teacher_batch_id=tb_id, session_id=session_id, submitted_at=first, feedback_number=number)
+            for tb_id, session_id, first, number in grouped
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback_app', '0022_submission_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedbackSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(max_length=100)),
+                ('feedback_number', models.IntegerField(default=1)),
+                ('submitted_at', models.DateTimeField()),
+                ('teacher_batch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='feedback_app.teacherbatch')),
+            ],
+            options={
+                'db_table': 'feedback_session',
+                'indexes': [models.Index(fields=['submitted_at', 'id'], name='fs_submitted_idx'), models.Index(fields=['teacher_batch', 'submitted_at', 'id'], name='fs_tb_submitted_idx')],
+                'constraints': [models.UniqueConstraint(fields=('teacher_batch', 'session_id'), name='feedback_session_once')],
+            },
+        ),
+        migrations.RunPython(backfill_sessions, migrations.RunPython.noop),
+    ]
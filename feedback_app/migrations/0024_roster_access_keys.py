@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback_app', '0023_feedback_session'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='rosterentry',
+            name='roster_batch_slot',
+        ),
+        migrations.RemoveIndex(
+            model_name='rosterentry',
+            name='roster_roll_idx',
+        ),
+        migrations.RemoveField(
+            model_name='accesscoderedemption',
+            name='redeemed_at',
+        ),
+        migrations.RemoveField(
+            model_name='rosterentry',
+            name='slot',
+        ),
+        migrations.AddField(
+            model_name='rosterentry',
+            name='key_digest',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='rosterentry',
+            index=models.Index(fields=['roll_number', 'batch', 'key_digest'], name='roster_roll_idx'),
+        ),
+    ]
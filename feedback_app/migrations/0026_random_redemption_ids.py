@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:44
+
+import random
+
+import feedback_app.models
+from django.db import migrations, models
+
+
+def rekey_redemptions(apps, schema_editor):
+    """Rewrite the existing redemptions under random ids, in shuffled order."""
+    AccessCodeRedemption = apps.get_model('feedback_app', 'AccessCodeRedemption')
+
+    codes = list(AccessCodeRedemption.objects.values_list('teacher_batch_id', 'slot'))
+    random.SystemRandom().shuffle(codes)
+    AccessCodeRedemption.objects.all().delete()
+    AccessCodeRedemption.objects.bulk_create(
+        [
+            AccessCodeRedemption(
+                id=feedback_app.models.random_redemption_id(), teacher_batch_id=tb_id, slot=slot,
+            )
+            for tb_id, slot in codes
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback_app', '0025_version_stamp'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='accesscoderedemption',
+            name='id',
+            field=models.BigAutoField(default=feedback_app.models.random_redemption_id, primary_key=True, serialize=False),
+        ),
+        migrations.RunPython(rekey_redemptions, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,5 @@
+import secrets
+
 from django.db import models
 from django.contrib.auth.models import User
 # -------------------
@@ -44,6 +46,7 @@ class Batch(models.Model):
     acad_year = models.CharField(max_length=10)
     part = models.CharField(max_length=20)
     is_active = models.BooleanField(default=False)  # NEW FIELD for batch activation
+    enrolled_count = models.IntegerField(default=0)  # Roster size, maintained by roster.import_roster
 
     def __str__(self):
         return f"{self.acad_year} - {self.part}"
@@ -91,12 +94,26 @@ class TeacherBatch(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     department = models.ForeignKey(Department, on_delete=models.CASCADE)
     is_active_for_feedback = models.BooleanField(default=False)  # NEW FIELD for teacher-course feedback activation
+    feedback_counter = models.IntegerField(default=0)  # Last feedback number handed out for this teacher-course
+    # Rollup of stored submissions, maintained by submission.save_submissions
+    submission_count = models.IntegerField(default=0)
+    response_count = models.IntegerField(default=0)
+    last_submitted_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.teacher.name} - {self.batch.acad_year} - {self.course.code} - {self.department.dept_name}"
 
     class Meta:
         unique_together = ('teacher', 'batch', 'course', 'department') 
+        indexes = [
+            # Student teacher list: active teacher-courses of active batches.
+            # Partial because boolean filters compile to a bare column test,
+            # which SQLite only matches against an index with the same WHERE
+            models.Index(
+                fields=['is_active_for_feedback', 'batch'], name='tb_active_batch_idx',
+                condition=models.Q(is_active_for_feedback=True),
+            ),
+        ]
 
 
 
@@ -141,10 +158,39 @@ class FeedbackQuestion(models.Model):
 # -------------------
 # Feedback Question Options
 # -------------------
+# Rating scale used by the dashboards; an option without a score is not a rating
+SCORE_CHOICES = [
+    (5, '5 - Excellent'),
+    (4, '4 - Good'),
+    (3, '3 - Average'),
+    (2, '2 - Poor'),
+    (1, '1 - Very Poor'),
+]
+
+# Checked in order, so "very poor" wins over "poor"
+SCORE_KEYWORDS = [
+    ('very poor', 1),
+    ('excellent', 5),
+    ('good', 4),
+    ('average', 3),
+    ('poor', 2),
+]
+
+
+def guess_option_score(answer):
+    """Suggest a score for an option from its text, or None if it is not a rating."""
+    answer = (answer or '').lower()
+    for keyword, score in SCORE_KEYWORDS:
+        if keyword in answer:
+            return score
+    return None
+
+
 class FeedbackQOption(models.Model):
     q = models.ForeignKey(FeedbackQuestion, on_delete=models.CASCADE)
     ans_id = models.CharField(max_length=10)  # Custom ID (not necessary for options)
     answer = models.CharField(max_length=200)  # The text of the option (e.g., "Excellent")
+    score = models.PositiveSmallIntegerField(choices=SCORE_CHOICES, null=True, blank=True)  # NULL: not counted in ratings
 
     def __str__(self):
         return self.answer  # Ensure the option text is returned
@@ -188,4 +234,132 @@ class StudentFeedbackResponse(models.Model):
     
     class Meta:
         db_table = 'student_feedback_response'
-        ordering = ['feedback_number', 'question__q_id']
\ No newline at end of file
+        # Hot queries clear this with order_by() so it costs no join or sort there
+        ordering = ['feedback_number', 'question__q_id']
+        indexes = [
+            models.Index(fields=['teacher_batch', 'session_id'], name='sfr_tb_session_idx'),
+            models.Index(fields=['question', 'selected_option'], name='sfr_question_option_idx'),
+            models.Index(fields=['submitted_at'], name='sfr_submitted_at_idx'),
+            models.Index(fields=['session_id'], name='sfr_session_idx'),
+        ]
+
+
+# -------------------
+# Option count rollup per teacher-course and question
+# -------------------
+class FeedbackOptionCount(models.Model):
+    teacher_batch = models.ForeignKey(TeacherBatch, on_delete=models.CASCADE)
+    question = models.ForeignKey(FeedbackQuestion, on_delete=models.CASCADE)
+    selected_option = models.ForeignKey(FeedbackQOption, on_delete=models.CASCADE, blank=True, null=True)  # NULL counts answers without an option
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.teacher_batch_id} - Q{self.question_id} - {self.selected_option_id}: {self.count}"
+
+    class Meta:
+        unique_together = ('teacher_batch', 'question', 'selected_option')
+
+
+# -------------------
+# One row per stored submission, which the report pages seek through (see reports.session_page)
+# -------------------
+class FeedbackSession(models.Model):
+    session_id = models.CharField(max_length=100)
+    teacher_batch = models.ForeignKey(TeacherBatch, on_delete=models.CASCADE, null=True, blank=True)
+    feedback_number = models.IntegerField(default=1)
+    submitted_at = models.DateTimeField()  # Of the submission's first response
+
+    def __str__(self):
+        return f"Feedback #{self.feedback_number} - {self.teacher_batch_id} ({self.session_id})"
+
+    class Meta:
+        db_table = 'feedback_session'
+        constraints = [
+            models.UniqueConstraint(fields=['teacher_batch', 'session_id'], name='feedback_session_once'),
+        ]
+        indexes = [
+            # Keyset order of the session pages, unfiltered and per teacher-course
+            models.Index(fields=['submitted_at', 'id'], name='fs_submitted_idx'),
+            models.Index(fields=['teacher_batch', 'submitted_at', 'id'], name='fs_tb_submitted_idx'),
+        ]
+
+
+# -------------------
+# Used one-time access codes (see access_codes.py)
+# -------------------
+def random_redemption_id():
+    return secrets.randbelow(2 ** 63 - 1) + 1
+
+
+class AccessCodeRedemption(models.Model):
+    # Random, not sequential: redemptions are written alongside the responses
+    # they unlock, so an ordered id would line the two up
+    id = models.BigAutoField(primary_key=True, default=random_redemption_id)
+    teacher_batch = models.ForeignKey(TeacherBatch, on_delete=models.CASCADE)
+    slot = models.PositiveIntegerField()
+    # No timestamp: with one, redemptions could be matched to responses by time
+
+    def __str__(self):
+        return f"{self.teacher_batch_id} - slot {self.slot}"
+
+    class Meta:
+        db_table = 'access_code_redemption'
+        constraints = [
+            models.UniqueConstraint(fields=['teacher_batch', 'slot'], name='access_code_once'),
+        ]
+
+
+# -------------------
+# Students enrolled in a batch (see roster.py)
+# -------------------
+class RosterEntry(models.Model):
+    batch = models.ForeignKey(Batch, on_delete=models.CASCADE, related_name='roster')
+    roll_number = models.CharField(max_length=30)
+    name = models.CharField(max_length=100, blank=True)
+    key_digest = models.CharField(max_length=64, blank=True)  # Of the student's access key (see roster.py); blank until issued
+
+    def __str__(self):
+        return f"{self.roll_number} - {self.batch_id}"
+
+    class Meta:
+        db_table = 'roster_entry'
+        constraints = [
+            models.UniqueConstraint(fields=['batch', 'roll_number'], name='roster_batch_roll'),
+        ]
+        indexes = [
+            # Pending feedback lookup by roll number across batches
+            models.Index(fields=['roll_number', 'batch', 'key_digest'], name='roster_roll_idx'),
+        ]
+
+
+# -------------------
+# Stored results of student submissions, by client retry key (see idempotency.py)
+# -------------------
+class SubmissionIdempotencyKey(models.Model):
+    key = models.CharField(max_length=64, primary_key=True)
+    request_hash = models.CharField(max_length=64)  # Tells a retry from a different submission under the same key
+    response = models.JSONField(null=True, blank=True)  # NULL while the first request is still running
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.key
+
+    class Meta:
+        db_table = 'submission_idempotency_key'
+        indexes = [
+            models.Index(fields=['created_at'], name='idempotency_created_idx'),
+        ]
+
+
+# -------------------
+# Version stamps of cached data, shared by every process (see versions.py)
+# -------------------
+class VersionStamp(models.Model):
+    key = models.CharField(max_length=100, primary_key=True)
+    version = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.key}: {self.version}"
+
+    class Meta:
+        db_table = 'version_stamp'
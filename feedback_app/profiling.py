@@ -0,0 +1,176 @@
+"""
+Opt-in per-request SQL profiling.
+
+``SqlProfilingMiddleware`` wraps every database connection with
+``connection.execute_wrapper`` for a sampled share of requests. For each
+sampled request it records the query count, total database time, the
+slowest statements and repeated statement fingerprints (the usual sign of
+an N+1 loop). Each record is logged as one JSON line on the
+``feedback_app.sql`` logger and kept in an in-process sliding window that
+``worst_views()`` summarises for the staff endpoint.
+
+Settings (all optional):
+
+* ``FEEDBACK_SQL_PROFILING`` - turn the middleware on (default ``False``;
+  when off Django drops it from the stack entirely).
+* ``FEEDBACK_SQL_PROFILING_SAMPLE_RATE`` - share of requests profiled,
+  0.0-1.0 (default 0.1).
+* ``FEEDBACK_SQL_PROFILING_WINDOW`` - seconds of history kept (default 900).
+* ``FEEDBACK_SQL_PROFILING_REPEAT_THRESHOLD`` - executions of one
+  fingerprint in a request that count as N+1 (default 5).
+
+The window lives in each process's memory, so with several workers the
+endpoint shows the worker that served it; the JSON log lines carry the
+complete picture.
+"""
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('feedback_app.sql')
+
+SLOWEST_KEPT = 5
+MAX_RECORDS = 5000  # Hard cap on the window, whatever the traffic
+
+_QUOTED = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN \((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+_SPACES = re.compile(r'\s+')
+
+_records = deque(maxlen=MAX_RECORDS)
+_records_lock = threading.Lock()
+
+
+def fingerprint(sql):
+    """Reduce a statement to its shape: literals become ``?``, IN lists ``IN (...)``."""
+    sql = _QUOTED.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """``execute_wrapper`` callable collecting timings for one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.slowest = []  # (seconds, sql), at most SLOWEST_KEPT
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.total += elapsed
+            self.fingerprints[fingerprint(sql)] += 1
+            if len(self.slowest) < SLOWEST_KEPT or elapsed > self.slowest[-1][0]:
+                self.slowest.append((elapsed, sql))
+                self.slowest.sort(key=lambda item: item[0], reverse=True)
+                del self.slowest[SLOWEST_KEPT:]
+
+
+class SqlProfilingMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'FEEDBACK_SQL_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = float(getattr(settings, 'FEEDBACK_SQL_PROFILING_SAMPLE_RATE', 0.1))
+        self.repeat_threshold = int(getattr(settings, 'FEEDBACK_SQL_PROFILING_REPEAT_THRESHOLD', 5))
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all(initialized_only=False):
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        record = {
+            'at': time.time(),
+            'view': (match.view_name or match._func_path) if match else None,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'db_ms': round(recorder.total * 1000, 2),
+            'total_ms': round(elapsed * 1000, 2),
+            'slowest': [{'ms': round(seconds * 1000, 2), 'sql': sql} for seconds, sql in recorder.slowest],
+            'repeated': [
+                {'count': count, 'fingerprint': shape}
+                for shape, count in recorder.fingerprints.most_common()
+                if count >= self.repeat_threshold
+            ],
+        }
+        with _records_lock:
+            _records.append(record)
+        logger.info(json.dumps(record, default=str))
+        return response
+
+
+def worst_views(window=None, limit=20):
+    """Summarise the sampled requests of the last ``window`` seconds per view.
+
+    Views are ranked by their worst query count, then by average database
+    time. Each entry lists the N+1 fingerprints seen for that view.
+    """
+    if window is None:
+        window = int(getattr(settings, 'FEEDBACK_SQL_PROFILING_WINDOW', 900))
+    cutoff = time.time() - window
+    with _records_lock:
+        records = [record for record in _records if record['at'] >= cutoff]
+
+    by_view = {}
+    for record in records:
+        stats = by_view.setdefault(record['view'] or record['path'], {
+            'requests': 0, 'queries': 0, 'max_queries': 0, 'db_ms': 0.0, 'total_ms': 0.0,
+            'max_total_ms': 0.0, 'repeated': Counter(), 'slowest': [],
+        })
+        stats['requests'] += 1
+        stats['queries'] += record['queries']
+        stats['max_queries'] = max(stats['max_queries'], record['queries'])
+        stats['db_ms'] += record['db_ms']
+        stats['total_ms'] += record['total_ms']
+        stats['max_total_ms'] = max(stats['max_total_ms'], record['total_ms'])
+        for repeated in record['repeated']:
+            stats['repeated'][repeated['fingerprint']] = max(
+                stats['repeated'][repeated['fingerprint']], repeated['count']
+            )
+        stats['slowest'] = sorted(stats['slowest'] + record['slowest'], key=lambda q: q['ms'], reverse=True)[:SLOWEST_KEPT]
+
+    summary = []
+    for view, stats in by_view.items():
+        requests = stats['requests']
+        summary.append({
+            'view': view,
+            'requests': requests,
+            'avg_queries': round(stats['queries'] / requests, 1),
+            'max_queries': stats['max_queries'],
+            'avg_db_ms': round(stats['db_ms'] / requests, 2),
+            'avg_total_ms': round(stats['total_ms'] / requests, 2),
+            'max_total_ms': stats['max_total_ms'],
+            'n_plus_one': [
+                {'count': count, 'fingerprint': shape} for shape, count in stats['repeated'].most_common(5)
+            ],
+            'slowest': stats['slowest'],
+        })
+    summary.sort(key=lambda item: (item['max_queries'], item['avg_db_ms']), reverse=True)
+    return {'window_seconds': window, 'sampled_requests': len(records), 'views': summary[:limit]}
@@ -0,0 +1,125 @@
+"""
+Compiled, per-process cache of the active feedback questionnaire.
+
+The questionnaire (active questions plus their options) is built once and
+reused by the student form views and by submission validation. A version
+stamp kept in the database (see versions.py) tells each process when its
+copy is stale.
+Saving or deleting a question or option bumps it through the signal
+receivers below, once the change is committed. ``bulk_create`` and
+``bulk_update`` send no signals, so code using them on questions or options
+calls ``bump_questionnaire_version()`` itself.
+
+The same version keys the rendered question block of ``feedback_form.html``
+(a ``{% cache %}`` fragment), so the HTML for all questions is rendered once
+per version and shared by every teacher and course.
+
+Because the stamp is in the database, an edit reaches every web worker
+within FEEDBACK_VERSION_CHECK_INTERVAL seconds, whatever cache backend is
+configured.
+"""
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import versions
+from .models import FeedbackQOption, FeedbackQuestion
+
+VERSION_KEY = 'feedback_questionnaire_version'
+
+# Name of the {% cache %} fragment in feedback_form.html holding the rendered questions
+FRAGMENT_NAME = 'feedback_questions'
+
+McqQuestion = namedtuple('McqQuestion', ['question', 'options'])
+
+_lock = threading.Lock()
+_compiled = None
+
+
+class Questionnaire:
+    """Immutable snapshot of the active questions and their options."""
+
+    __slots__ = ('version', 'questions', 'mcq_questions', 'desc_questions', 'option_question', 'option_score')
+
+    def __init__(self, version, questions, options):
+        options_by_question = {}
+        for option in options:
+            options_by_question.setdefault(option.q_id, []).append(option)
+
+        mcq_questions = []
+        desc_questions = []
+        for question in questions:
+            if question.q_type == 'MCQ':
+                mcq_questions.append(McqQuestion(question, tuple(options_by_question.get(question.q_id, ()))))
+            elif question.q_type == 'DESC':
+                desc_questions.append(question)
+
+        set_attr = super().__setattr__
+        set_attr('version', version)
+        set_attr('questions', tuple(questions))
+        set_attr('mcq_questions', tuple(mcq_questions))
+        set_attr('desc_questions', tuple(desc_questions))
+        # option id -> question id, used to validate posted answers
+        set_attr('option_question', MappingProxyType({
+            option.id: question.q_id
+            for question, question_options in mcq_questions
+            for option in question_options
+        }))
+        # option id -> score, for options that count as a rating
+        set_attr('option_score', MappingProxyType({
+            option.id: option.score
+            for _, question_options in mcq_questions
+            for option in question_options
+            if option.score is not None
+        }))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Questionnaire is immutable')
+
+    @property
+    def total_questions(self):
+        return len(self.questions)
+
+
+def get_questionnaire():
+    """Return the compiled questionnaire, rebuilding it if the version moved."""
+    global _compiled
+    version = versions.get_version(VERSION_KEY)
+    compiled = _compiled
+    if compiled is not None and compiled.version == version:
+        return compiled
+
+    with _lock:
+        if _compiled is None or _compiled.version != version:
+            questions = list(FeedbackQuestion.objects.filter(active=True).order_by('q_id'))
+            options = FeedbackQOption.objects.filter(
+                q__in=[q.q_id for q in questions if q.q_type == 'MCQ']
+            ).order_by('q_id', 'ans_id')
+            _compiled = Questionnaire(version, questions, options)
+        return _compiled
+
+
+def bump_questionnaire_version():
+    """Mark every process's compiled questionnaire as stale.
+
+    The rendered question block cached for the old version is evicted too.
+    """
+    old_version = versions.get_version(VERSION_KEY)
+    versions.bump_version(VERSION_KEY)
+    # This process's copy; other processes never read theirs again once they see the new version
+    cache.delete(make_template_fragment_key(FRAGMENT_NAME, [old_version]))
+
+
+@receiver(post_save, sender=FeedbackQuestion)
+@receiver(post_delete, sender=FeedbackQuestion)
+@receiver(post_save, sender=FeedbackQOption)
+@receiver(post_delete, sender=FeedbackQOption)
+def _questionnaire_changed(sender, **kwargs):
+    # After commit, or another process could rebuild from the old rows under the new version
+    transaction.on_commit(bump_questionnaire_version)
@@ -0,0 +1,175 @@
+"""
+Aggregation helpers for the student feedback reports.
+"""
+from datetime import datetime
+
+from django.core import signing
+from django.db.models import F, FloatField, IntegerField, Q, Sum
+from django.db.models.functions import Cast, NullIf
+
+from .models import StudentFeedbackResponse
+from .questionnaire import get_questionnaire
+
+SESSION_PAGE_SIZE = 20
+CURSOR_SALT = 'feedback_app.reports.session_page'
+
+
+class InvalidCursor(Exception):
+    """Raised when a session-page cursor is malformed or was tampered with."""
+
+
+def average_score():
+    """Aggregate for the mean option score over ``FeedbackOptionCount`` rows.
+
+    Each rollup row is weighted by its count; filter the queryset to
+    ``selected_option__score__isnull=False`` first so unscored options
+    stay out of the denominator.
+    """
+    score_total = Sum(F('count') * F('selected_option__score'), output_field=IntegerField())
+    return Cast(score_total, FloatField()) / NullIf(Sum('count'), 0)
+
+
+def summarize_questions(responses, option_counts):
+    """Build the question-wise summary for a filtered report.
+
+    ``responses`` and ``option_counts`` are the report's
+    ``StudentFeedbackResponse`` and ``FeedbackOptionCount`` querysets under
+    the same filters. MCQ option counts are summed from the rollup, so they
+    cost one query however many responses exist; descriptive answers are
+    fetched with one query that already carries the course code. The result
+    has the shape ``admin_response.html`` expects, one entry per active
+    question.
+    """
+    questionnaire = get_questionnaire()
+    mcq_ids = [mcq.question.q_id for mcq in questionnaire.mcq_questions]
+    desc_ids = [question.q_id for question in questionnaire.desc_questions]
+
+    option_totals = {}
+    question_totals = {}
+    if mcq_ids:
+        grouped = (
+            option_counts.filter(question_id__in=mcq_ids)
+            .order_by()
+            .values_list('question_id', 'selected_option_id')
+            .annotate(n=Sum('count'))
+        )
+        for question_id, option_id, n in grouped:
+            question_totals[question_id] = question_totals.get(question_id, 0) + n
+            if option_id is not None:
+                option_totals[option_id] = n
+
+    desc_responses = {}
+    if desc_ids:
+        rows = (
+            responses.filter(question_id__in=desc_ids, response_text__isnull=False)
+            .exclude(response_text__exact="")
+            .order_by('feedback_number', 'pk')
+            .values_list('question_id', 'response_text', 'submitted_at', 'feedback_number',
+                         'teacher_batch__course__code')
+        )
+        for question_id, text, submitted_at, feedback_number, course_code in rows:
+            desc_responses.setdefault(question_id, []).append({
+                'text': text,
+                'submitted_at': submitted_at,
+                'feedback_number': feedback_number,
+                'course_info': f"{course_code}" if course_code is not None else "N/A",
+            })
+
+    questions_with_responses = []
+    mcq_options = {mcq.question.q_id: mcq.options for mcq in questionnaire.mcq_questions}
+    for question in questionnaire.questions:
+        if question.q_type == 'MCQ':
+            all_options = mcq_options[question.q_id]
+            option_counts = {opt.answer: 0 for opt in all_options}
+            for opt in all_options:
+                option_counts[opt.answer] += option_totals.get(opt.id, 0)
+
+            questions_with_responses.append({
+                'question': question,
+                'type': 'MCQ',
+                'option_counts': option_counts,
+                'total_responses': question_totals.get(question.q_id, 0),
+                'all_options': [opt.answer for opt in all_options],
+            })
+
+        elif question.q_type == 'DESC':
+            desc_list = desc_responses.get(question.q_id, [])
+            questions_with_responses.append({
+                'question': question,
+                'type': 'DESC',
+                'responses': desc_list,
+                'total_responses': len(desc_list),
+            })
+
+    return questions_with_responses
+
+
+def session_page(sessions, cursor=None, page_size=SESSION_PAGE_SIZE):
+    """Return one page of submissions and the cursor for the next page.
+
+    ``sessions`` is the report's ``FeedbackSession`` queryset, one row per
+    submission. Pages are ordered by (submitted_at, id) and the keyset
+    cursor seeks into that index, so LIMIT stops after one page however
+    many submissions match, and every page costs the same two queries: one
+    for the page's sessions and one for their answers with question, option
+    and course loaded through ``select_related``. The cursor also carries
+    the running position, which keeps the "Feedback #" labels continuous
+    across pages.
+    """
+    position = 0
+    if cursor:
+        try:
+            last_submitted, last_id, position = signing.loads(cursor, salt=CURSOR_SALT)
+            last_submitted, last_id = datetime.fromisoformat(last_submitted), int(last_id)
+        except (signing.BadSignature, TypeError, ValueError):
+            raise InvalidCursor(cursor)
+        # The >= bound on its own lets the index range start at the cursor
+        sessions = sessions.filter(
+            Q(submitted_at__gte=last_submitted),
+            Q(submitted_at__gt=last_submitted) | Q(pk__gt=last_id),
+        )
+
+    page = list(
+        sessions.order_by('submitted_at', 'pk')
+        .values('pk', 'session_id', 'teacher_batch_id', 'submitted_at')[:page_size + 1]
+    )
+    has_more = len(page) > page_size
+    page = page[:page_size]
+
+    answers = {}
+    rows = (
+        StudentFeedbackResponse.objects.filter(session_id__in={s['session_id'] for s in page})
+        .select_related('question', 'selected_option', 'teacher_batch__course', 'teacher_batch__batch')
+        .order_by('submitted_at', 'pk')
+    )
+    for response in rows:
+        answers.setdefault((response.teacher_batch_id, response.session_id), []).append(response)
+
+    feedback_sessions = []
+    for i, session in enumerate(page, start=position + 1):
+        session_responses = answers.get((session['teacher_batch_id'], session['session_id']), [])
+        course_info = None
+        tb = session_responses[0].teacher_batch if session_responses else None
+        if tb:
+            course_info = {
+                'course_code': tb.course.code,
+                'course_name': tb.course.name,
+                'batch': f"{tb.batch.acad_year} - {tb.batch.part}"
+            }
+
+        feedback_sessions.append({
+            'feedback_number': i,
+            'submitted_at': session['submitted_at'],
+            'total_responses': len(session_responses),
+            'responses': session_responses,
+            'course_info': course_info,
+        })
+
+    next_cursor = None
+    if has_more:
+        last = page[-1]
+        next_cursor = signing.dumps(
+            [last['submitted_at'].isoformat(), last['pk'], position + len(page)],
+            salt=CURSOR_SALT, compress=True,
+        )
+    return feedback_sessions, next_cursor
@@ -0,0 +1,120 @@
+"""
+Role resolution for the logged-in user.
+
+A user's group names and their Teacher/Role are loaded once, memoised on
+the request and kept in the session, so templates and views stop querying
+``user.groups`` and ``Teacher`` on every render. The session copy is tagged
+with a per-user version stamp held in the database (see versions.py);
+changing the user's groups or their Teacher record bumps that stamp in the
+same transaction (see the signal receivers below) and the next request
+reloads. Every process sees the bump within
+FEEDBACK_VERSION_CHECK_INTERVAL seconds, so a demoted user cannot keep
+their old role in the other workers.
+"""
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import versions
+from .models import Teacher
+
+SESSION_KEY = 'feedback_roles'
+REQUEST_ATTR = '_feedback_roles'
+
+
+class Roles:
+    """What the current user is allowed to be, resolved once per session."""
+
+    __slots__ = ('user', 'groups', 'teacher_id', 'role_name')
+
+    def __init__(self, user, groups=(), teacher_id=None, role_name=None):
+        self.user = user
+        self.groups = frozenset(groups)
+        self.teacher_id = teacher_id
+        self.role_name = role_name
+
+    def in_group(self, name):
+        return name in self.groups
+
+    @property
+    def is_staff(self):
+        return self.user.is_staff
+
+    @property
+    def is_superuser(self):
+        return self.user.is_superuser
+
+    @property
+    def has_teacher(self):
+        return self.teacher_id is not None
+
+    @property
+    def teacher_role(self):
+        """The Teacher's role name in lower case ("hod", "teacher"), or None."""
+        return self.role_name.strip().lower() if self.role_name else None
+
+
+def _version_key(user_id):
+    return f'roles_version:{user_id}'
+
+
+def bump_roles_version(*user_ids):
+    """Make every session of these users reload their roles on the next request."""
+    versions.bump_versions(_version_key(user_id) for user_id in user_ids)
+
+
+def _load(user):
+    groups = list(user.groups.values_list('name', flat=True))
+    teacher = Teacher.objects.filter(user=user).values_list('teacher_id', 'role__role_name').first()
+    teacher_id, role_name = teacher if teacher else (None, None)
+    return groups, teacher_id, role_name
+
+
+def get_roles(request):
+    """Return the ``Roles`` of ``request.user``, loading them at most once per session."""
+    roles = getattr(request, REQUEST_ATTR, None)
+    if roles is not None:
+        return roles
+
+    user = request.user
+    if not user.is_authenticated:
+        # Anonymous students: no queries and no session writes
+        roles = Roles(user)
+    else:
+        version = versions.get_version(_version_key(user.pk))
+        stored = request.session.get(SESSION_KEY)
+        if stored and stored.get('user') == user.pk and stored.get('version') == version:
+            groups, teacher_id, role_name = stored['groups'], stored['teacher_id'], stored['role_name']
+        else:
+            groups, teacher_id, role_name = _load(user)
+            request.session[SESSION_KEY] = {
+                'user': user.pk,
+                'version': version,
+                'groups': groups,
+                'teacher_id': teacher_id,
+                'role_name': role_name,
+            }
+        roles = Roles(user, groups, teacher_id, role_name)
+
+    setattr(request, REQUEST_ATTR, roles)
+    return roles
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def _groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        # user.groups.add/remove/clear(...): instance is the User
+        if action.startswith('post_'):
+            bump_roles_version(instance.pk)
+    elif action == 'pre_clear':
+        # group.user_set.clear(): collect the members before they are gone
+        bump_roles_version(*instance.user_set.values_list('pk', flat=True))
+    elif action.startswith('post_') and pk_set:
+        bump_roles_version(*pk_set)
+
+
+@receiver(post_save, sender=Teacher)
+@receiver(post_delete, sender=Teacher)
+def _teacher_changed(sender, instance, **kwargs):
+    if instance.user_id:
+        bump_roles_version(instance.user_id)
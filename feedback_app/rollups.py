@@ -0,0 +1,166 @@
+"""
+Rebuild and verify the feedback rollups.
+
+``save_submissions`` keeps ``FeedbackOptionCount``, ``FeedbackSession`` and
+the TeacherBatch totals (``submission_count``, ``response_count``,
+``last_submitted_at``) up to date as feedback comes in, and ``roster.import_roster`` keeps
+``Batch.enrolled_count``. These helpers recompute the same numbers from the
+raw ``StudentFeedbackResponse`` and ``RosterEntry`` rows, for backfills,
+bulk imports that bypass those paths and consistency checks. Deleting
+questions or options cascades to their responses, so those views rebuild the
+rollups of the teacher-courses that had answers to them.
+"""
+from django.db import transaction
+from django.db.models import Count, Max, Min
+
+from .models import Batch, FeedbackOptionCount, FeedbackSession, StudentFeedbackResponse, TeacherBatch
+
+
+def _scoped(queryset, teacher_batch_ids):
+    return queryset if teacher_batch_ids is None else queryset.filter(teacher_batch_id__in=teacher_batch_ids)
+
+
+def _responses(teacher_batch_ids=None):
+    return _scoped(StudentFeedbackResponse.objects.order_by(), teacher_batch_ids)
+
+
+def expected_option_counts(teacher_batch_ids=None):
+    """Return ``{(teacher_batch_id, question_id, option_id): count}`` from raw rows."""
+    grouped = (
+        _responses(teacher_batch_ids)
+        .values_list('teacher_batch_id', 'question_id', 'selected_option_id')
+        .annotate(n=Count('pk'))
+    )
+    return {(tb_id, q_id, option_id): n for tb_id, q_id, option_id, n in grouped if tb_id is not None}
+
+
+def expected_teacher_batch_totals(teacher_batch_ids=None):
+    """Return ``{teacher_batch_id: (submissions, responses, last_submitted_at)}`` from raw rows."""
+    grouped = (
+        _responses(teacher_batch_ids).filter(teacher_batch__isnull=False)
+        .values_list('teacher_batch_id')
+        .annotate(
+            submissions=Count('session_id', distinct=True),
+            responses=Count('pk'),
+            latest=Max('submitted_at'),
+        )
+    )
+    return {tb_id: (submissions, responses, latest) for tb_id, submissions, responses, latest in grouped}
+
+
+def expected_sessions(teacher_batch_ids=None):
+    """Return ``{(teacher_batch_id, session_id): (first submitted_at, feedback_number)}`` from raw rows."""
+    grouped = (
+        _responses(teacher_batch_ids)
+        .values_list('teacher_batch_id', 'session_id')
+        .annotate(first=Min('submitted_at'), number=Min('feedback_number'))
+    )
+    return {(tb_id, session_id): (first, number) for tb_id, session_id, first, number in grouped}
+
+
+def expected_enrolled_counts():
+    """Return ``{batch_id: roster size}`` from the roster rows."""
+    return dict(Batch.objects.order_by().values_list('pk').annotate(n=Count('roster')))
+
+
+def rebuild_rollups(batch_size=1000, teacher_batch_ids=None):
+    """Recompute the rollups from scratch and return the number of count rows written.
+
+    With ``teacher_batch_ids`` only those teacher-courses' rollups are
+    rebuilt, and the enrolment counts are left alone.
+    """
+    if teacher_batch_ids is not None:
+        teacher_batch_ids = set(teacher_batch_ids)
+    option_counts = expected_option_counts(teacher_batch_ids)
+    totals = expected_teacher_batch_totals(teacher_batch_ids)
+
+    with transaction.atomic():
+        _scoped(FeedbackOptionCount.objects.all(), teacher_batch_ids).delete()
+        FeedbackOptionCount.objects.bulk_create(
+            [
+                FeedbackOptionCount(teacher_batch_id=tb_id, question_id=q_id, selected_option_id=option_id, count=n)
+                for (tb_id, q_id, option_id), n in option_counts.items()
+            ],
+            batch_size=batch_size,
+        )
+
+        _scoped(FeedbackSession.objects.all(), teacher_batch_ids).delete()
+        FeedbackSession.objects.bulk_create(
+            [
+                FeedbackSession(teacher_batch_id=tb_id, session_id=session_id, submitted_at=first, feedback_number=number)
+                for (tb_id, session_id), (first, number) in expected_sessions(teacher_batch_ids).items()
+            ],
+            batch_size=batch_size,
+        )
+
+        teacher_batches = TeacherBatch.objects.only('pk')
+        if teacher_batch_ids is not None:
+            teacher_batches = teacher_batches.filter(pk__in=teacher_batch_ids)
+        teacher_batches = list(teacher_batches)
+        for tb in teacher_batches:
+            tb.submission_count, tb.response_count, tb.last_submitted_at = totals.get(tb.pk, (0, 0, None))
+        TeacherBatch.objects.bulk_update(
+            teacher_batches, ['submission_count', 'response_count', 'last_submitted_at'], batch_size=batch_size,
+        )
+        if teacher_batch_ids is not None:
+            return len(option_counts)
+
+        enrolled = expected_enrolled_counts()
+        batches = list(Batch.objects.only('pk'))
+        for batch in batches:
+            batch.enrolled_count = enrolled.get(batch.pk, 0)
+        Batch.objects.bulk_update(batches, ['enrolled_count'], batch_size=batch_size)
+
+    return len(option_counts)
+
+
+def verify_rollups():
+    """Compare the stored rollups with the raw rows and return a list of mismatch descriptions."""
+    problems = []
+
+    expected = expected_option_counts()
+    stored = {
+        (tb_id, q_id, option_id): n
+        for tb_id, q_id, option_id, n in FeedbackOptionCount.objects.exclude(count=0).values_list(
+            'teacher_batch_id', 'question_id', 'selected_option_id', 'count'
+        )
+    }
+    for key in sorted(set(expected) | set(stored), key=str):
+        if expected.get(key, 0) != stored.get(key, 0):
+            tb_id, q_id, option_id = key
+            problems.append(
+                f"TeacherBatch {tb_id} question {q_id} option {option_id}: "
+                f"rollup has {stored.get(key, 0)}, responses have {expected.get(key, 0)}"
+            )
+
+    totals = expected_teacher_batch_totals()
+    for tb_id, submissions, responses, latest in TeacherBatch.objects.order_by('pk').values_list(
+        'pk', 'submission_count', 'response_count', 'last_submitted_at'
+    ):
+        want_submissions, want_responses, want_latest = totals.get(tb_id, (0, 0, None))
+        if (submissions, responses) != (want_submissions, want_responses):
+            problems.append(
+                f"TeacherBatch {tb_id}: rollup has {submissions} submissions / {responses} responses, "
+                f"responses have {want_submissions} / {want_responses}"
+            )
+        if latest != want_latest:
+            problems.append(
+                f"TeacherBatch {tb_id}: rollup has last submission at {latest}, responses have {want_latest}"
+            )
+
+    sessions = set(expected_sessions())
+    stored = set(FeedbackSession.objects.values_list('teacher_batch_id', 'session_id'))
+    for tb_id, session_id in sorted(sessions ^ stored, key=str):
+        problems.append(
+            f"TeacherBatch {tb_id} session {session_id}: "
+            f"{'missing from' if (tb_id, session_id) in sessions else 'has no responses but is in'} the session table"
+        )
+
+    enrolled = expected_enrolled_counts()
+    for batch_id, enrolled_count in Batch.objects.order_by('pk').values_list('pk', 'enrolled_count'):
+        if enrolled_count != enrolled.get(batch_id, 0):
+            problems.append(
+                f"Batch {batch_id}: rollup has {enrolled_count} enrolled, roster has {enrolled.get(batch_id, 0)}"
+            )
+
+    return problems
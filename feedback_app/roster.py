@@ -0,0 +1,204 @@
+"""
+Student rosters: which roll numbers are enrolled in which Batch.
+
+Every rostered student gets an access key when first imported, one per
+roll number across all their batches. Keys are written out once, to be
+handed to the students separately; only a keyed digest is stored. A roll
+number on its own therefore opens nothing: the pending-feedback list and
+the student's codes need the key too.
+
+A student's code for a teacher-course uses a slot derived from their key
+(``student_slot``), above the slots of the printed sheets. A teacher-course
+is pending until that code has been redeemed. Without the key the slot
+cannot be worked out, so the redemption table does not say who gave
+feedback, let alone what they answered.
+
+``Batch.enrolled_count`` is kept up to date by ``import_roster``, so
+"responses received vs enrolled" is ``TeacherBatch.submission_count``
+against ``batch.enrolled_count`` and costs no aggregate.
+"""
+import csv
+import hmac
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import F
+from django.utils.crypto import get_random_string, salted_hmac
+
+from . import access_codes
+from .models import Batch, RosterEntry, TeacherBatch
+
+KEY_SALT = 'feedback_app.roster.key'
+SLOT_SALT = 'feedback_app.roster.slot'
+KEY_LENGTH = 10  # Crockford base32 characters, 50 bits
+
+
+class RosterError(Exception):
+    """Raised for a roster file that cannot be imported, or a roll number and key that do not match."""
+
+
+def new_access_key():
+    return get_random_string(KEY_LENGTH, access_codes.CROCKFORD_ALPHABET)
+
+
+def format_key(key):
+    return f'{key[:5]}-{key[5:]}'
+
+
+def _normalize_key(key):
+    return ''.join(ch for ch in (key or '').upper() if ch.isalnum()).translate(access_codes.TYPOS)
+
+
+def key_digest(key):
+    return salted_hmac(KEY_SALT, _normalize_key(key), algorithm='sha256').hexdigest()
+
+
+def student_slot(key, teacher_batch_id):
+    """The access code slot of the student holding ``key`` in a teacher-course."""
+    mac = salted_hmac(SLOT_SALT, f'{_normalize_key(key)}:{teacher_batch_id}', algorithm='sha256').digest()
+    span = access_codes.MAX_SLOT - access_codes.STUDENT_SLOT_BASE
+    return access_codes.STUDENT_SLOT_BASE + int.from_bytes(mac[:8], 'big') % span
+
+
+def read_roster_csv(fh, batch_id=None):
+    """Yield ``(batch_id, roll_number, name)`` from a roster CSV.
+
+    Needs a ``roll_number`` column, an optional ``name`` column and a
+    ``batch_id`` column unless ``batch_id`` is given for the whole file.
+    """
+    reader = csv.DictReader(fh)
+    columns = {column.strip().lower(): column for column in reader.fieldnames or []}
+    if 'roll_number' not in columns or (batch_id is None and 'batch_id' not in columns):
+        raise RosterError('The roster needs a roll_number column, and a batch_id column unless a batch is given.')
+
+    for line, row in enumerate(reader, 2):
+        roll_number = (row[columns['roll_number']] or '').strip()
+        if not roll_number:
+            raise RosterError(f'Line {line}: missing roll number.')
+        row_batch = batch_id
+        if row_batch is None:
+            try:
+                row_batch = int(row[columns['batch_id']])
+            except (TypeError, ValueError):
+                raise RosterError(f'Line {line}: batch_id must be a number.')
+        name = (row[columns['name']] or '').strip() if 'name' in columns else ''
+        yield row_batch, roll_number, name
+
+
+def import_roster(rows, chunk_size=1000, keys=None):
+    """Add ``(batch_id, roll_number, name)`` rows to the roster; return ``(added, skipped)``.
+
+    Rows are written a chunk per transaction; students already enrolled in
+    the batch are skipped, so an interrupted import can simply be re-run.
+    Roll numbers seen for the first time get a new access key, and
+    ``keys`` is called after each chunk commits with its
+    ``(roll_number, name, key)`` rows. Keys are not stored, so that is the
+    only chance to hand them out.
+    """
+    rows = iter(rows)
+    added = skipped = 0
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return added, skipped
+        chunk_added, issued = _import_chunk(chunk)
+        added += chunk_added
+        skipped += len(chunk) - chunk_added
+        if keys and issued:
+            keys(issued)
+
+
+def _import_chunk(chunk):
+    by_batch = {}
+    for batch_id, roll_number, name in chunk:
+        # A roll number repeated within the chunk keeps its first name
+        by_batch.setdefault(batch_id, {}).setdefault(roll_number, name)
+
+    known = set(Batch.objects.filter(pk__in=by_batch).values_list('pk', flat=True))
+    unknown = set(by_batch) - known
+    if unknown:
+        raise RosterError(f"Unknown batch ids: {', '.join(map(str, sorted(unknown)))}")
+
+    rolls = {roll for batch_rolls in by_batch.values() for roll in batch_rolls}
+    with transaction.atomic():
+        enrolled = set()
+        digests = {}
+        for batch_id, roll, digest in RosterEntry.objects.filter(roll_number__in=rolls).values_list(
+            'batch_id', 'roll_number', 'key_digest'
+        ):
+            enrolled.add((batch_id, roll))
+            if digest:
+                digests[roll] = digest
+
+        entries = []
+        issued = []
+        # Batches in a fixed order so concurrent imports cannot deadlock
+        for batch_id, batch_rolls in sorted(by_batch.items()):
+            new = [(roll, name) for roll, name in batch_rolls.items() if (batch_id, roll) not in enrolled]
+            if not new:
+                continue
+            Batch.objects.filter(pk=batch_id).update(enrolled_count=F('enrolled_count') + len(new))
+            for roll, name in new:
+                if roll not in digests:
+                    # A student in several batches keeps one key
+                    key = new_access_key()
+                    digests[roll] = key_digest(key)
+                    issued.append((roll, name, format_key(key)))
+                entries.append(RosterEntry(batch_id=batch_id, roll_number=roll, name=name, key_digest=digests[roll]))
+        RosterEntry.objects.bulk_create(entries)
+    return len(entries), issued
+
+
+def issue_missing_keys(keys, chunk_size=1000):
+    """Give an access key to every rostered roll number without one; returns how many were issued.
+
+    ``keys`` receives the ``(roll_number, name, key)`` rows as for ``import_roster``.
+    """
+    issued = 0
+    while True:
+        rolls = dict(
+            RosterEntry.objects.filter(key_digest='').order_by('roll_number').values_list('roll_number', 'name')[:chunk_size]
+        )
+        if not rolls:
+            return issued
+        rows = []
+        with transaction.atomic():
+            for roll, name in rolls.items():
+                key = new_access_key()
+                RosterEntry.objects.filter(roll_number=roll).update(key_digest=key_digest(key))
+                rows.append((roll, name, format_key(key)))
+        keys(rows)
+        issued += len(rows)
+
+
+def pending_teacher_batches(roll_number, key):
+    """Active teacher-courses a student is enrolled for and has not given feedback on yet.
+
+    Returns ``(teacher_batch, access_code)`` pairs, the code being the
+    student's own for that teacher-course. Raises ``RosterError`` unless
+    ``key`` is the student's access key. Three queries: the roster through
+    its roll number index, the teacher-courses of the student's batches and
+    the redemptions of their codes through the redemption table's unique
+    index.
+    """
+    digest = key_digest(key)
+    batch_ids = [
+        batch_id
+        for batch_id, stored in RosterEntry.objects.filter(roll_number=roll_number).values_list('batch_id', 'key_digest')
+        if stored and hmac.compare_digest(stored, digest)
+    ]
+    if not batch_ids:
+        # The same answer for an unknown roll number, so rosters cannot be probed
+        raise RosterError('That roll number and access key do not match.')
+
+    teacher_batches = list(
+        TeacherBatch.objects.filter(batch_id__in=batch_ids, is_active_for_feedback=True, batch__is_active=True)
+        .select_related('teacher', 'course', 'batch')
+        .order_by('course__code', 'pk')
+    )
+    codes = {tb.pk: (tb.pk, student_slot(key, tb.pk)) for tb in teacher_batches}
+    used = access_codes.used_codes(codes.values())
+    return [
+        (tb, access_codes.make_code(*codes[tb.pk]))
+        for tb in teacher_batches if codes[tb.pk] not in used
+    ]
@@ -0,0 +1,147 @@
+"""
+Production profile for deployments that stay on SQLite.
+
+Enabled with ``FEEDBACK_SQLITE_PROFILE=production`` (see settings.py), which
+also adds a ``reports`` database alias: a read-only connection to the same
+file.
+
+* ``_tune_connection`` runs on every new SQLite connection and switches the
+  database to WAL with ``synchronous=NORMAL``, a busy timeout, memory-mapped
+  I/O and a larger page cache. Read-only connections get the read-side
+  pragmas plus ``query_only``.
+* ``ReportingRouter`` sends reads made inside ``reporting()`` to the
+  ``reports`` alias. The report views and the dashboard builders run inside
+  it, so their long scans read a WAL snapshot and never hold up the writers
+  that store student submissions.
+* ``checkpoint()`` and ``database_stats()`` back the ``sqlite_status``
+  command, which is meant to run from cron to checkpoint the WAL. Long
+  report reads can keep the automatic checkpoints from resetting it.
+"""
+import contextvars
+import os
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+REPORTS_DB = 'reports'
+
+# Applied to every connection of the production profile
+READ_PRAGMAS = {
+    'busy_timeout': 5000,  # ms to wait for a lock before "database is locked"
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # Negative means KiB: 64 MiB of page cache
+    'temp_store': 'MEMORY',
+}
+# Applied to writable connections only
+WRITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    # Safe in WAL mode: a power cut can lose the last commits but never corrupts
+    'synchronous': 'NORMAL',
+    'wal_autocheckpoint': 1000,  # pages
+}
+
+CHECKPOINT_MODES = ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE')
+
+_reporting = contextvars.ContextVar('feedback_reporting', default=False)
+
+
+def is_enabled():
+    return getattr(settings, 'FEEDBACK_SQLITE_PRODUCTION', False)
+
+
+def is_read_only(connection):
+    return connection.alias == REPORTS_DB
+
+
+@receiver(connection_created)
+def _tune_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite' or not is_enabled():
+        return
+    pragmas = dict(READ_PRAGMAS)
+    if is_read_only(connection):
+        pragmas['query_only'] = 'ON'
+    else:
+        pragmas.update(WRITE_PRAGMAS)
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@contextmanager
+def reporting():
+    """Route the reads made inside this block to the read-only reports alias.
+
+    Usable as a decorator too. Querysets must be evaluated inside the block;
+    streamed ones should be pinned with ``.using(reporting_db())``.
+    """
+    token = _reporting.set(True)
+    try:
+        yield
+    finally:
+        _reporting.reset(token)
+
+
+def reporting_db():
+    """Alias heavy report reads should use: ``reports`` when configured."""
+    return REPORTS_DB if REPORTS_DB in settings.DATABASES else 'default'
+
+
+class ReportingRouter:
+    """Send reads inside ``reporting()`` to the read-only alias; everything else is default."""
+
+    def db_for_read(self, model, **hints):
+        if _reporting.get():
+            return reporting_db()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same database file
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPORTS_DB
+
+
+def database_path(alias='default'):
+    return str(connections[alias].settings_dict['NAME'])
+
+
+def checkpoint(mode='PASSIVE', alias='default'):
+    """Checkpoint the WAL; return ``(busy, wal_pages, checkpointed_pages)``."""
+    mode = mode.upper()
+    if mode not in CHECKPOINT_MODES:
+        raise ValueError(f'Unknown checkpoint mode {mode!r}')
+    with connections[alias].cursor() as cursor:
+        cursor.execute(f'PRAGMA wal_checkpoint({mode})')
+        return tuple(cursor.fetchone())
+
+
+def database_stats(alias='default'):
+    """File, WAL and page cache figures for a SQLite alias, as an ordered dict."""
+    path = database_path(alias)
+    stats = {'path': path}
+    for suffix, label in (('', 'file_bytes'), ('-wal', 'wal_bytes'), ('-shm', 'shm_bytes')):
+        try:
+            stats[label] = os.path.getsize(path + suffix)
+        except OSError:
+            stats[label] = 0
+
+    with connections[alias].cursor() as cursor:
+        for pragma in ('journal_mode', 'synchronous', 'busy_timeout', 'page_size', 'page_count',
+                       'freelist_count', 'cache_size', 'mmap_size', 'wal_autocheckpoint'):
+            cursor.execute(f'PRAGMA {pragma}')
+            stats[pragma] = cursor.fetchone()[0]
+
+    page_size = stats['page_size']
+    cache_size = stats['cache_size']
+    stats['cache_bytes'] = -cache_size * 1024 if cache_size < 0 else cache_size * page_size
+    stats['free_bytes'] = stats['freelist_count'] * page_size
+    # A WAL file is a 32-byte header followed by frames of a 24-byte header and one page
+    stats['wal_pages'] = max(stats['wal_bytes'] - 32, 0) // (page_size + 24)
+    return stats
@@ -0,0 +1,254 @@
+"""
+Submission engine for anonymous student feedback.
+
+A posted answer set is validated into a ``Submission`` and then written by
+``save_submissions``, which stores every response row of one or more
+submissions with a single bulk insert inside one transaction.
+
+Anonymous students carry no Django session. Each feedback form embeds a
+signed submission token holding a fresh session id, and the submit view
+takes the id back out of it, so the student flow never touches
+``django_session``. A token can be replayed until it expires, but only its
+first submission is stored: sessions that already have responses are
+skipped.
+
+The combined form covers several teacher-courses with one token. Each
+course's answers are stored under ``course_session_id``, an HMAC of the
+token's id and the course, so replays are still skipped per course while
+one student's answers to different courses cannot be linked by session.
+"""
+import uuid
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.db.models import F
+from django.utils.crypto import salted_hmac
+
+from .dashboards import record_submissions
+from .models import FeedbackOptionCount, FeedbackSession, StudentFeedbackResponse, TeacherBatch
+from .questionnaire import get_questionnaire
+
+
+# answers is a list of (question_id, option_id, response_text) tuples
+Submission = namedtuple('Submission', ['teacher_batch_id', 'session_id', 'answers'])
+
+
+class SubmissionError(Exception):
+    """Raised when a posted answer set cannot be accepted."""
+
+
+TOKEN_SALT = 'feedback_app.submission'
+TOKEN_MAX_AGE = 6 * 3600  # Seconds a form stays submittable; FEEDBACK_SUBMISSION_TOKEN_MAX_AGE overrides
+
+
+def new_submission_token():
+    """Signed token for a feedback form, carrying a new session id."""
+    return signing.dumps(str(uuid.uuid4()), salt=TOKEN_SALT)
+
+
+def read_submission_token(token):
+    """Return the session id in a submission token, or raise ``SubmissionError``."""
+    max_age = getattr(settings, 'FEEDBACK_SUBMISSION_TOKEN_MAX_AGE', TOKEN_MAX_AGE)
+    try:
+        return signing.loads(token or '', salt=TOKEN_SALT, max_age=max_age)
+    except signing.BadSignature:
+        # Also covers SignatureExpired
+        raise SubmissionError('Session expired. Please refresh the page.')
+
+
+def course_session_id(session_id, teacher_batch_id):
+    """Session id for one course of a combined submission."""
+    return salted_hmac(TOKEN_SALT, f'{session_id}:{teacher_batch_id}', algorithm='sha256').hexdigest()[:40]
+
+
+def build_submission(data, teacher_batch_id, session_id):
+    """Validate posted answers against the active questionnaire.
+
+    ``data`` is a ``request.POST``-like mapping holding ``question_<q_id>``
+    keys. Every MCQ question must name one of its own options; descriptive
+    questions are only enforced when marked as required. Validation runs
+    entirely against the cached questionnaire and makes no queries.
+    """
+    questionnaire = get_questionnaire()
+
+    unanswered_questions = []
+    answers = []
+    for question in questionnaire.questions:
+        if question.q_type == 'MCQ':
+            value = (data.get(f'question_{question.q_id}') or '').strip()
+            if not value:
+                unanswered_questions.append(f"Question {question.q_id}")
+            elif not (value.isascii() and value.isdigit()) or questionnaire.option_question.get(int(value)) != question.q_id:
+                unanswered_questions.append(f"Question {question.q_id} (Invalid option)")
+            else:
+                answers.append((question.q_id, int(value), None))
+
+        elif question.q_type == 'DESC':
+            response_text = (data.get(f'question_{question.q_id}') or '').strip()
+            if question.is_required and not response_text:
+                unanswered_questions.append(f"Question {question.q_id}")
+            else:
+                answers.append((question.q_id, None, response_text or None))
+
+    if unanswered_questions:
+        raise SubmissionError(
+            f'Please answer all required questions. Missing answers for: {", ".join(unanswered_questions)}'
+        )
+
+    return Submission(teacher_batch_id, session_id, answers)
+
+
+def _allocate_feedback_numbers(teacher_batch_id, count):
+    """Reserve ``count`` consecutive feedback numbers for a teacher-course.
+
+    The UPDATE takes the row (or, on SQLite, database) write lock, so the
+    numbers stay reserved for this transaction until it commits.
+    """
+    TeacherBatch.objects.filter(pk=teacher_batch_id).update(
+        feedback_counter=F('feedback_counter') + count
+    )
+    last = TeacherBatch.objects.filter(pk=teacher_batch_id).values_list('feedback_counter', flat=True).get()
+    return last - count + 1
+
+
+def save_submissions(submissions):
+    """Write validated submissions and return their feedback numbers.
+
+    Everything happens in one transaction: feedback numbers are allocated
+    per TeacherBatch, sessions that already have stored responses are
+    skipped (their number is returned as ``None``), all response rows are
+    inserted with one ``bulk_create`` and the rollups (TeacherBatch totals,
+    ``FeedbackOptionCount`` and a ``FeedbackSession`` row per submission)
+    are updated alongside them. Once the
+    transaction commits the cached admin stats are advanced and the cached
+    dashboards of the affected teachers are dropped.
+    """
+    numbers = [None] * len(submissions)
+    by_teacher_batch = {}
+    for index, submission in enumerate(submissions):
+        by_teacher_batch.setdefault(submission.teacher_batch_id, []).append(index)
+
+    with transaction.atomic():
+        # Lock counters in a fixed order so concurrent batches cannot deadlock
+        first_numbers = {
+            tb_id: _allocate_feedback_numbers(tb_id, len(indexes))
+            for tb_id, indexes in sorted(by_teacher_batch.items())
+        }
+
+        # Checked while holding the counter lock, so a double submit of the
+        # same session cannot slip in between the check and the insert
+        already_saved = set(
+            StudentFeedbackResponse.objects.filter(
+                session_id__in={s.session_id for s in submissions}
+            ).order_by().values_list('session_id', flat=True).distinct()
+        )
+
+        rows = []
+        seen_sessions = set(already_saved)
+        totals = {}
+        for tb_id, indexes in sorted(by_teacher_batch.items()):
+            next_number = first_numbers[tb_id]
+            tb_rows = 0
+            for index in indexes:
+                submission = submissions[index]
+                if submission.session_id in seen_sessions:
+                    continue
+                seen_sessions.add(submission.session_id)
+                numbers[index] = next_number
+                rows.extend(
+                    StudentFeedbackResponse(
+                        question_id=question_id,
+                        selected_option_id=option_id,
+                        response_text=response_text,
+                        session_id=submission.session_id,
+                        feedback_number=next_number,
+                        teacher_batch_id=tb_id,
+                    )
+                    for question_id, option_id, response_text in submission.answers
+                )
+                tb_rows += len(submission.answers)
+                next_number += 1
+
+            saved = next_number - first_numbers[tb_id]
+            totals[tb_id] = (len(indexes) - saved, saved, tb_rows)
+
+        StudentFeedbackResponse.objects.bulk_create(rows)
+        latest = {}
+        for row in rows:
+            latest[row.teacher_batch_id] = max(row.submitted_at, latest.get(row.teacher_batch_id, row.submitted_at))
+        for tb_id, (skipped, saved, tb_rows) in sorted(totals.items()):
+            # Hand back the numbers reserved for skipped duplicates and
+            # roll the stored submissions into the teacher-course totals;
+            # a batch of duplicates leaves the latest submission time alone
+            update = {'feedback_counter': F('feedback_counter') - skipped}
+            if saved:
+                update.update(submission_count=F('submission_count') + saved, response_count=F('response_count') + tb_rows)
+            if tb_id in latest:
+                update['last_submitted_at'] = latest[tb_id]
+            TeacherBatch.objects.filter(pk=tb_id).update(**update)
+
+        _add_option_counts(rows)
+        _add_sessions(rows)
+
+        if rows:
+            option_score = get_questionnaire().option_score
+            ratings = Counter(
+                option_score[row.selected_option_id] for row in rows if row.selected_option_id in option_score
+            )
+            submitted = sum(number is not None for number in numbers)
+            transaction.on_commit(lambda: record_submissions(
+                {row.teacher_batch_id for row in rows}, submitted, len(rows), ratings,
+            ))
+
+    return numbers
+
+
+def _add_sessions(rows):
+    """Add a ``FeedbackSession`` row per stored submission, with one INSERT.
+
+    Runs after the response rows were inserted, so their ``submitted_at`` is
+    filled in; a session's first row is its earliest.
+    """
+    first_rows = {}
+    for row in rows:
+        first_rows.setdefault((row.teacher_batch_id, row.session_id), row)
+    FeedbackSession.objects.bulk_create(
+        FeedbackSession(
+            teacher_batch_id=row.teacher_batch_id,
+            session_id=row.session_id,
+            feedback_number=row.feedback_number,
+            submitted_at=row.submitted_at,
+        )
+        for row in first_rows.values()
+    )
+
+
+def _add_option_counts(rows):
+    """Fold new response rows into ``FeedbackOptionCount``.
+
+    Runs inside ``save_submissions`` after the TeacherBatch counters were
+    locked, so read-modify-write of the affected rollup rows is safe. Costs
+    three queries however many questions were answered.
+    """
+    deltas = Counter((row.teacher_batch_id, row.question_id, row.selected_option_id) for row in rows)
+    if not deltas:
+        return
+
+    existing = FeedbackOptionCount.objects.filter(
+        teacher_batch_id__in={tb_id for tb_id, _, _ in deltas},
+        question_id__in={q_id for _, q_id, _ in deltas},
+    )
+    to_update = []
+    for rollup in existing:
+        key = (rollup.teacher_batch_id, rollup.question_id, rollup.selected_option_id)
+        if key in deltas:
+            rollup.count += deltas.pop(key)
+            to_update.append(rollup)
+
+    FeedbackOptionCount.objects.bulk_update(to_update, ['count'])
+    FeedbackOptionCount.objects.bulk_create(
+        FeedbackOptionCount(teacher_batch_id=tb_id, question_id=q_id, selected_option_id=option_id, count=n)
+        for (tb_id, q_id, option_id), n in deltas.items()
+    )
@@ -1,3 +1,918 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import re
+import tempfile
+import time
+import zipfile
+from collections import Counter
+from contextlib import ExitStack
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import Group, User
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core import signing
+from django.core.management import CommandError, call_command
+from django.conf import settings
+from django.db import OperationalError, connection, connections
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import access_codes, journal, profiling, versions
+from .models import (
+    AccessCodeRedemption, Batch, Department, FeedbackOptionCount, FeedbackQOption, FeedbackQuestion, FeedbackSession,
+    RosterEntry, StudentFeedbackResponse, SubmissionIdempotencyKey, Teacher, TeacherBatch, VersionStamp,
+    guess_option_score,
+)
+from .questionnaire import VERSION_KEY, bump_questionnaire_version, get_questionnaire
+from .reports import CURSOR_SALT, average_score, session_page
+from .dashboards import ADMIN_STATS_KEY
+from .exports import stream_csv, stream_xlsx
+from .idempotency import evict_expired
+from .rollups import verify_rollups
+from .roster import import_roster
+from .sqlite import REPORTS_DB, ReportingRouter, reporting, reporting_db
+from .submission import Submission, SubmissionError, build_submission, new_submission_token, save_submissions
+from .views import build_teacher_dashboard_data
+
+# Tables whose full scans we never want on a hot path
+HOT_TABLES = (
+    StudentFeedbackResponse._meta.db_table,
+    TeacherBatch._meta.db_table,
+    FeedbackOptionCount._meta.db_table,
+    RosterEntry._meta.db_table,
+    FeedbackSession._meta.db_table,
+)
+FULL_SCAN = re.compile(r'\bSCAN (%s)\b(?! USING)' % '|'.join(HOT_TABLES))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+class HotQueryPlanTests(TestCase):
+    """Each hot query must reach the response and assignment tables through an index."""
+
+    def hot_queries(self):
+        since = timezone.now() - timedelta(days=180)
+        return {
+            'duplicate session check (save_submissions)': StudentFeedbackResponse.objects.filter(
+                session_id__in=['a', 'b']
+            ).order_by().values_list('session_id', flat=True).distinct(),
+            'report sessions, unfiltered admin report (session_page)': FeedbackSession.objects.order_by(
+                'submitted_at', 'pk'
+            ).values('pk', 'session_id', 'teacher_batch_id', 'submitted_at')[:21],
+            'report sessions for one teacher (session_page)': FeedbackSession.objects.filter(
+                teacher_batch__teacher_id=1
+            ).order_by('submitted_at', 'pk').values('pk', 'session_id', 'teacher_batch_id', 'submitted_at')[:21],
+            'report sessions for one teacher-course (session_page)': FeedbackSession.objects.filter(
+                teacher_batch_id=1
+            ).order_by('submitted_at', 'pk').values('pk', 'session_id', 'teacher_batch_id', 'submitted_at')[:21],
+            'answers of a session page (session_page)': StudentFeedbackResponse.objects.filter(
+                session_id__in=['a', 'b']
+            ).select_related('question', 'selected_option', 'teacher_batch__course', 'teacher_batch__batch')
+            .order_by('submitted_at', 'pk'),
+            'descriptive answers (summarize_questions)': StudentFeedbackResponse.objects.filter(
+                question_id__in=[1, 2], response_text__isnull=False
+            ).exclude(response_text__exact='').order_by('feedback_number', 'pk')
+            .values_list('question_id', 'response_text', 'teacher_batch__course__code'),
+            'monthly series (build_admin_stats)': StudentFeedbackResponse.objects.filter(
+                submitted_at__gte=since
+            ).order_by().annotate(month=TruncMonth('submitted_at')).values_list('month').annotate(n=Count('pk')),
+            'active teacher list (select_teacher_for_feedback)': TeacherBatch.objects.filter(
+                batch__is_active=True, is_active_for_feedback=True
+            ).select_related('teacher', 'course', 'batch', 'department'),
+            'teacher dashboard ratings (build_teacher_dashboard_data)': FeedbackOptionCount.objects.filter(
+                teacher_batch__teacher_id=1, selected_option__score__isnull=False
+            ).order_by().values_list('teacher_batch_id').annotate(n=Sum('count')),
+            'rollup upsert read (save_submissions)': FeedbackOptionCount.objects.filter(
+                teacher_batch_id__in=[1, 2], question_id__in=[1, 2]
+            ),
+            'roster of a student (pending_teacher_batches)': RosterEntry.objects.filter(
+                roll_number='R001'
+            ).values_list('batch_id', 'key_digest'),
+            'teacher-courses of a student (pending_teacher_batches)': TeacherBatch.objects.filter(
+                batch_id__in=[1, 2], is_active_for_feedback=True, batch__is_active=True
+            ).select_related('teacher', 'course', 'batch').order_by('course__code', 'pk'),
+        }
+
+    def test_hot_queries_use_indexes(self):
+        for name, queryset in self.hot_queries().items():
+            with self.subTest(name):
+                plan = queryset.explain()
+                self.assertIsNone(FULL_SCAN.search(plan), f'{name} does a full table scan:\n{plan}')
+
+    def test_admin_session_pages_seek(self):
+        """The default staff report pages every submission; each page must be an index seek that LIMIT can stop."""
+        cursor = signing.dumps([timezone.now().isoformat(), 1, 20], salt=CURSOR_SALT, compress=True)
+        for name, page_cursor in (('first page', None), ('later page', cursor)):
+            with self.subTest(name), CaptureQueriesContext(connection) as queries:
+                session_page(FeedbackSession.objects.all(), page_cursor)
+                with connection.cursor() as db:
+                    db.execute('EXPLAIN QUERY PLAN ' + queries.captured_queries[0]['sql'])
+                    plan = '\n'.join(row[-1] for row in db.fetchall())
+                self.assertIn('fs_submitted_idx', plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+
+class ExportTests(SimpleTestCase):
+    """Exported answers must not run as spreadsheet formulas."""
+
+    rows = [[7, '=HYPERLINK("http://x")', '+1', '-2', '@SUM(A1)', 'Fine - thanks', -3]]
+
+    def test_csv_escapes_formulas(self):
+        lines = ''.join(stream_csv(self.rows)).splitlines()
+        self.assertEqual(lines[1], '7,"\'=HYPERLINK(""http://x"")",\'+1,\'-2,\'@SUM(A1),Fine - thanks,-3')
+
+    def test_xlsx_escapes_formulas(self):
+        workbook = zipfile.ZipFile(io.BytesIO(b''.join(stream_xlsx(self.rows))))
+        sheet = workbook.read('xl/worksheets/sheet1.xml').decode()
+        for text in ("'=HYPERLINK(\"http://x\")", "'+1", "'-2", "'@SUM(A1)", '>Fine - thanks<'):
+            self.assertIn(text, sheet)
+        self.assertIn('<v>-3</v>', sheet)
+
+
+@override_settings(FEEDBACK_SQL_PROFILING=True, FEEDBACK_SQL_PROFILING_SAMPLE_RATE=1.0,
+                   FEEDBACK_SQL_PROFILING_REPEAT_THRESHOLD=3)
+class SqlProfilingTests(TestCase):
+    """A sampled request's queries are counted and timed, and its wrappers never outlive it."""
+
+    def setUp(self):
+        patcher = mock.patch.object(profiling, '_records', profiling.deque(maxlen=profiling.MAX_RECORDS))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.request = RequestFactory().get('/profiled/')
+
+    def wrappers(self):
+        return [wrapper for db in connections.all(initialized_only=False) for wrapper in db.execute_wrappers]
+
+    def test_records_request(self):
+        def view(request):
+            self.assertEqual(len(connection.execute_wrappers), 1)
+            for pk in (1, 2, 3):
+                list(Department.objects.filter(pk=pk))
+            time.sleep(0.01)
+            return HttpResponse('ok')
+
+        response = profiling.SqlProfilingMiddleware(view)(self.request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.wrappers(), [])
+
+        record, = profiling._records
+        self.assertEqual((record['path'], record['status'], record['queries']), ('/profiled/', 200, 3))
+        self.assertEqual(len(record['slowest']), 3)
+        self.assertGreater(record['db_ms'], 0)
+        self.assertGreaterEqual(record['total_ms'], record['db_ms'] + 10)
+        self.assertEqual([repeated['count'] for repeated in record['repeated']], [3])
+        self.assertEqual(profiling.worst_views()['views'][0]['max_queries'], 3)
+
+    def test_wrappers_removed_when_view_raises(self):
+        def view(request):
+            list(Department.objects.all())
+            raise ValueError('boom')
+
+        with self.assertRaisesMessage(ValueError, 'boom'):
+            profiling.SqlProfilingMiddleware(view)(self.request)
+        self.assertEqual(self.wrappers(), [])
+        self.assertEqual(list(profiling._records), [])
+        # The connection still works, unwrapped
+        with CaptureQueriesContext(connection) as queries:
+            list(Department.objects.all())
+        self.assertEqual(len(queries), 1)
+
+
+class ReportingRouterTests(TestCase):
+    """Reads inside ``reporting()`` go to the read-only reports alias; writes never do."""
+
+    databases = {'default', REPORTS_DB}.intersection(settings.DATABASES)
+
+    def test_router(self):
+        router = ReportingRouter()
+        self.assertIsNone(router.db_for_read(TeacherBatch))
+        with reporting():
+            self.assertEqual(router.db_for_read(TeacherBatch), reporting_db())
+            self.assertEqual(router.db_for_write(TeacherBatch), 'default')
+        self.assertIsNone(router.db_for_read(TeacherBatch))
+        self.assertFalse(router.allow_migrate(REPORTS_DB, 'feedback_app'))
+
+    @skipUnless(REPORTS_DB in settings.DATABASES, 'the reports alias needs FEEDBACK_SQLITE_PROFILE=production')
+    def test_reports_alias(self):
+        with reporting():
+            self.assertEqual(TeacherBatch.objects.all().db, REPORTS_DB)
+            department = Department.objects.create(dept_name='Routing')
+        self.assertEqual(department._state.db, 'default')
+        self.assertEqual(TeacherBatch.objects.all().db, 'default')
+
+        with connections[REPORTS_DB].cursor() as cursor, self.assertRaisesMessage(OperationalError, 'readonly'):
+            cursor.execute('DELETE FROM feedback_session')
+
+
+class RolesTests(TestCase):
+    """Group changes reach the user's next request, whichever process serves it."""
+
+    def test_group_change_is_seen_on_next_request(self):
+        user = User.objects.create_user('demoted', password='x')
+        hod = Group.objects.create(name='hod')
+        user.groups.add(hod)
+        self.client.force_login(user)
+        self.assertTrue(self.client.get(reverse('index')).context['is_hod'])
+
+        # Demoted by another worker, with its own cache and stamp copies
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                                   'LOCATION': 'another-worker'}}):
+            user.groups.remove(hod)
+        versions.forget()
+        self.assertFalse(self.client.get(reverse('index')).context['is_hod'])
+
+
+class ClearStudentSessionsTests(TestCase):
+    """clear_student_sessions removes expired sessions, and live student ones only when asked."""
+
+    def session(self, data, expired=False):
+        store = SessionStore()
+        store.update(data)
+        store.create()
+        if expired:
+            Session.objects.filter(pk=store.session_key).update(expire_date=timezone.now() - timedelta(minutes=1))
+        return store.session_key
+
+    def remaining(self, **options):
+        call_command('clear_student_sessions', batch_size=1, stdout=io.StringIO(), **options)
+        return set(Session.objects.values_list('pk', flat=True))
+
+    def test_only_expired_sessions_go(self):
+        expired = self.session({'student_feedback_session': 'old'}, expired=True)
+        live = self.session({'student_feedback_session': 'new'})
+        staff = self.session({'_auth_user_id': '1'})
+
+        self.assertEqual(self.remaining(dry_run=True), {expired, live, staff})
+        self.assertEqual(self.remaining(), {live, staff})
+        self.assertEqual(self.remaining(student_sessions=True), {staff})
+
+
+class QuestionnaireVersionTests(TestCase):
+    """Question and option edits expire the compiled questionnaire once committed."""
+
+    def test_edits_bump_version_on_commit(self):
+        question = FeedbackQuestion.objects.create(q_desc='Pace of the course', q_type='MCQ')
+        compiled = get_questionnaire()
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            option = FeedbackQOption.objects.create(q=question, ans_id='opt_1', answer='Good')
+            # Not before the commit
+            self.assertIs(get_questionnaire(), compiled)
+        self.assertTrue(callbacks)
+        self.assertIn(option.id, get_questionnaire().option_question)
+
+        compiled = get_questionnaire()
+        with self.captureOnCommitCallbacks(execute=True):
+            question.delete()
+        self.assertNotIn(question.q_id, [q.q_id for q in get_questionnaire().questions])
+        self.assertNotEqual(get_questionnaire().version, compiled.version)
+
+    @override_settings(FEEDBACK_VERSION_CHECK_INTERVAL=0)
+    def test_bump_in_another_process_is_seen(self):
+        compiled = get_questionnaire()
+        FeedbackQuestion.objects.create(q_desc='Pace of the course', q_type='DESC', active=True)
+        # Another process's bump reaches only the database, not this process's cache
+        VersionStamp.objects.update_or_create(key=VERSION_KEY, defaults={'version': compiled.version + 1})
+        self.assertIn('Pace of the course', [question.q_desc for question in get_questionnaire().questions])
+
+    def test_new_options_get_guessed_scores(self):
+        self.client.post(reverse('add_question'), {
+            'q_desc': 'Clarity of lectures', 'q_type': 'MCQ', 'active': 'on', 'options': 'Excellent, Poor, Not sure',
+        })
+        question = FeedbackQuestion.objects.get(q_desc='Clarity of lectures')
+        self.client.post(reverse('add_options', args=[question.q_id]), {'options_text': 'Good'})
+
+        options = FeedbackQOption.objects.filter(q=question).order_by('ans_id')
+        self.assertEqual(
+            [(option.ans_id, option.score) for option in options],
+            [(f'opt_{n}', guess_option_score(text)) for n, text in enumerate(['Excellent', 'Poor', 'Not sure', 'Good'], 1)],
+        )
+        self.assertIsNotNone(options[0].score)
+
+
+class ReportingTestCase(TestCase):
+    """Lets views read through the reports alias, which the SQLite production profile adds."""
+
+    databases = {'default', REPORTS_DB}.intersection(settings.DATABASES)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        if REPORTS_DB in cls.databases:
+            # The test mirror is a second connection to the shared in-memory database;
+            # let it read the test transaction instead of waiting on its table locks
+            with connections[REPORTS_DB].cursor() as cursor:
+                cursor.execute('PRAGMA read_uncommitted = 1')
+
+
+class SubmissionTestCase(ReportingTestCase):
+    """One teacher-course and a helper that answers its questionnaire."""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command(
+            'generate_feedback_data', departments=1, programmes=1, courses=1, batches=1,
+            teachers=2, responses=0, stdout=io.StringIO(),
+        )
+        cls.tb = TeacherBatch.objects.order_by('pk').first()
+
+    def submission(self, session_id):
+        questionnaire = get_questionnaire()
+        answers = [(mcq.question.q_id, mcq.options[0].id, None) for mcq in questionnaire.mcq_questions]
+        answers += [(question.q_id, None, 'Fine.') for question in questionnaire.desc_questions]
+        return Submission(self.tb.pk, session_id, answers)
+
+
+class SaveSubmissionsTests(SubmissionTestCase):
+    """The submission engine: feedback numbers, duplicate sessions and the single bulk insert."""
+
+    def inserts(self, queries):
+        table = StudentFeedbackResponse._meta.db_table
+        return [q['sql'] for q in queries.captured_queries if q['sql'].startswith(f'INSERT INTO "{table}"')]
+
+    def test_consecutive_numbers_and_one_insert(self):
+        first = self.tb.feedback_counter + 1
+        with CaptureQueriesContext(connection) as queries:
+            numbers = save_submissions([self.submission('s1'), self.submission('s2')])
+
+        self.assertEqual(numbers, [first, first + 1])
+        self.assertEqual(len(self.inserts(queries)), 1)
+        self.assertEqual(
+            dict(StudentFeedbackResponse.objects.filter(teacher_batch=self.tb).values_list('session_id', 'feedback_number').distinct()),
+            {'s1': first, 's2': first + 1},
+        )
+        self.tb.refresh_from_db()
+        self.assertEqual((self.tb.feedback_counter, self.tb.submission_count), (first + 1, 2))
+
+    def test_replayed_session_is_skipped(self):
+        first = self.tb.feedback_counter + 1
+        save_submissions([self.submission('s1')])
+        stored = StudentFeedbackResponse.objects.filter(session_id='s1').count()
+        self.tb.refresh_from_db()
+        last_submitted_at = self.tb.last_submitted_at
+
+        # A replay alone stores nothing and leaves the latest submission time alone
+        self.assertEqual(save_submissions([self.submission('s1')]), [None])
+        self.tb.refresh_from_db()
+        self.assertEqual(self.tb.last_submitted_at, last_submitted_at)
+
+        # Already stored, and repeated within the same batch
+        numbers = save_submissions([self.submission('s1'), self.submission('s2'), self.submission('s2')])
+
+        self.assertEqual(numbers, [None, first + 1, None])
+        self.assertEqual(StudentFeedbackResponse.objects.filter(session_id='s1').count(), stored)
+        self.tb.refresh_from_db()
+        # Numbers reserved for the skipped sessions are handed back
+        self.assertEqual((self.tb.feedback_counter, self.tb.submission_count), (first + 1, 2))
+        self.assertEqual(verify_rollups(), [])
+
+    def test_build_submission_takes_only_ascii_option_ids(self):
+        questionnaire = get_questionnaire()
+        mcq = questionnaire.mcq_questions[0]
+        data = {f'question_{m.question.q_id}': str(m.options[0].id) for m in questionnaire.mcq_questions}
+        data.update({f'question_{q.q_id}': 'Fine.' for q in questionnaire.desc_questions})
+        self.assertEqual(len(build_submission(data, self.tb.pk, 's1').answers), len(questionnaire.questions))
+
+        option_id = str(mcq.options[0].id)
+        # Superscript and Arabic-Indic digits pass str.isdigit(); int() rejects one and accepts the other
+        for value in ('\u00b2', ''.join(chr(0x0660 + int(digit)) for digit in option_id)):
+            data[f'question_{mcq.question.q_id}'] = value
+            with self.assertRaisesMessage(SubmissionError, f'Question {mcq.question.q_id} (Invalid option)'):
+                build_submission(data, self.tb.pk, 's1')
+
+    def test_session_pages_seek_through_every_submission(self):
+        session_ids = [f's{n}' for n in range(5)]
+        save_submissions([self.submission(session_id) for session_id in session_ids])
+
+        seen, cursor = [], None
+        while True:
+            page, cursor = session_page(FeedbackSession.objects.filter(teacher_batch=self.tb), cursor, page_size=2)
+            seen.extend((session['feedback_number'], session['responses'][0].session_id) for session in page)
+            if cursor is None:
+                break
+        self.assertEqual(seen, list(enumerate(session_ids, 1)))
+
+    def test_deleting_answered_options_and_questions_keeps_rollups(self):
+        questionnaire = get_questionnaire()
+        mcq, other = questionnaire.mcq_questions[:2]
+        # s2 only answered with the option that goes, so its whole submission goes with it
+        save_submissions([
+            self.submission('s1'), Submission(self.tb.pk, 's2', [(mcq.question.q_id, mcq.options[0].id, None)]),
+        ])
+
+        self.client.post(reverse('delete_option', args=[mcq.options[0].id]))
+        self.assertEqual(verify_rollups(), [])
+        self.tb.refresh_from_db()
+        self.assertEqual(self.tb.submission_count, 1)
+        self.assertFalse(FeedbackSession.objects.filter(session_id='s2').exists())
+
+        self.client.post(reverse('delete_question', args=[other.question.q_id]))
+        self.assertEqual(verify_rollups(), [])
+
+
+class AverageScoreTests(SubmissionTestCase):
+    """The SQL rating averages match scoring every stored answer in Python."""
+
+    def python_average(self, responses):
+        # The per-option computation the dashboards used to do: weight each
+        # scored option by its answers, leaving unscored options out
+        picked = Counter(responses.filter(selected_option__isnull=False).values_list('selected_option', flat=True))
+        scores = dict(FeedbackQOption.objects.filter(pk__in=picked).values_list('pk', 'score'))
+        rated = {option: count for option, count in picked.items() if scores[option] is not None}
+        if not rated:
+            return 0
+        return sum(scores[option] * count for option, count in rated.items()) / sum(rated.values())
+
+    def test_sql_average_matches_python(self):
+        questionnaire = get_questionnaire()
+        unscored = questionnaire.mcq_questions[0].options[0]
+        FeedbackQOption.objects.filter(pk=unscored.id).update(score=None)
+        other_tb = TeacherBatch.objects.exclude(pk=self.tb.pk).order_by('pk').first()
+
+        submissions = []
+        for n in range(7):
+            answers = [
+                (mcq.question.q_id, mcq.options[(n + i) % len(mcq.options)].id, None)
+                for i, mcq in enumerate(questionnaire.mcq_questions)
+            ]
+            submissions.append(Submission(self.tb.pk if n % 3 else other_tb.pk, f's{n}', answers))
+        save_submissions(submissions)
+        self.assertTrue(StudentFeedbackResponse.objects.filter(selected_option_id=unscored.id).exists())
+
+        teacher_id = self.tb.teacher_id
+        responses = StudentFeedbackResponse.objects.filter(teacher_batch__teacher_id=teacher_id)
+        data = build_teacher_dashboard_data(teacher_id)
+        self.assertAlmostEqual(data['teacher_avg_rating'], self.python_average(responses))
+        for course in data['teacher_courses']:
+            tb = TeacherBatch.objects.get(teacher_id=teacher_id, course=course['course'], batch=course['batch'])
+            self.assertAlmostEqual(course['avg_rating'], self.python_average(responses.filter(teacher_batch=tb)))
+
+        overall = FeedbackOptionCount.objects.filter(selected_option__score__isnull=False).aggregate(avg=average_score())
+        self.assertAlmostEqual(overall['avg'], self.python_average(StudentFeedbackResponse.objects.all()))
+
+
+class DashboardCacheTests(SubmissionTestCase):
+    """New submissions retire the cached dashboards, including the copies other processes hold."""
+
+    def setUp(self):
+        cache.clear()
+
+    def other_process_cached(self, key, value):
+        """Put back the copy another process would still hold, and drop this process's stamps."""
+        cache.set(key, value)
+        versions.forget()
+
+    def test_submission_retires_teacher_dashboard(self):
+        self.client.force_login(self.tb.teacher.user)
+        before = self.client.get(reverse('index')).context['unique_students']
+        key = f'teacher_dashboard:{self.tb.teacher_id}'
+        cached = cache.get(key)
+        self.assertIsNotNone(cached)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            save_submissions([self.submission('s1')])
+        self.other_process_cached(key, cached)
+
+        self.assertEqual(self.client.get(reverse('index')).context['unique_students'], before + 1)
+
+    def test_submission_updates_admin_stats(self):
+        self.client.force_login(User.objects.create_superuser('stats_admin', password='x'))
+        before = self.client.get(reverse('index')).context
+        cached = cache.get(ADMIN_STATS_KEY)
+
+        # The process that saved the submission adds it to its store without a rebuild
+        with self.captureOnCommitCallbacks(execute=True):
+            save_submissions([self.submission('s1')])
+        after = self.client.get(reverse('index')).context
+        self.assertEqual(after['total_feedback_submissions'], before['total_feedback_submissions'] + 1)
+        self.assertEqual(after['stats_built_at'], before['stats_built_at'])
+
+        # Another process's store is retired and rebuilt
+        self.other_process_cached(ADMIN_STATS_KEY, cached)
+        self.assertEqual(self.client.get(reverse('index')).context['total_feedback_submissions'],
+                         before['total_feedback_submissions'] + 1)
+
+        # As is this one's, once another process changed the stats in between
+        cached = cache.get(ADMIN_STATS_KEY)
+        versions.bump_version(ADMIN_STATS_KEY)
+        cache.set(ADMIN_STATS_KEY, cached)
+        with self.captureOnCommitCallbacks(execute=True):
+            save_submissions([self.submission('s2')])
+        self.assertIsNone(cache.get(ADMIN_STATS_KEY))
+
+
+class JournalDrainTests(SubmissionTestCase):
+    """A bad journal entry is retried on its own and set aside without holding up the rest."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(
+            FEEDBACK_JOURNAL_ENABLED=True, FEEDBACK_JOURNAL_PATH=os.path.join(directory.name, 'journal.sqlite3'),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_failing_entry_is_isolated_and_set_aside(self):
+        journal.append(self.submission('s1'))
+        journal.append(self.submission('s2')._replace(teacher_batch_id=0))
+        journal.append(self.submission('s3'))
+
+        with self.assertLogs('feedback_app.journal', 'WARNING'):
+            self.assertEqual(journal.drain(), 3)
+        self.assertEqual(
+            set(StudentFeedbackResponse.objects.filter(session_id__in=['s1', 's2', 's3']).values_list(
+                'session_id', flat=True).distinct()),
+            {'s1', 's3'},
+        )
+        self.assertEqual(journal.lag()['pending'], 1)
+
+        with self.assertLogs('feedback_app.journal', 'ERROR'):
+            for _ in range(journal.MAX_ATTEMPTS - 1):
+                journal.drain()
+        self.assertEqual(journal.drain(), 0)
+        self.assertEqual((journal.lag()['pending'], journal.lag()['failed']), (0, 1))
+        self.assertIn('DoesNotExist', journal.failed_entries()[0][3])
+
+        out = io.StringIO()
+        call_command('drain_feedback_journal', status=True, stdout=out)
+        self.assertIn('1 entries failed', out.getvalue())
+
+        self.assertEqual(journal.requeue_failed(), 1)
+        self.assertEqual((journal.lag()['pending'], journal.lag()['failed']), (1, 0))
+
+
+RESPONSE_TIME_CEILING = 1.0  # Seconds, per request, on the seeded dataset
+
+
+class QueryBudgetTests(ReportingTestCase):
+    """Every view stays within a fixed number of queries on a medium dataset.
+
+    The dataset has enough departments, courses and teachers that a query
+    per row on any list would blow its budget. Each request is made from a
+    fresh client with an empty cache, so roles, the questionnaire and the
+    dashboards are all loaded cold and the budgets are worst cases.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command(
+            'generate_feedback_data', departments=3, programmes=2, courses=2, batches=2,
+            teachers=6, responses=3000, stdout=io.StringIO(),
+        )
+        cls.admin = User.objects.create_superuser('budget_admin', password='x')
+        cls.teacher = Teacher.objects.filter(role__role_name='Teacher').select_related('user').first()
+        cls.hod = Teacher.objects.filter(role__role_name='HOD').select_related('user').first()
+        cls.tb = TeacherBatch.objects.filter(teacher=cls.teacher).select_related('course').first()
+        cls.mcq = FeedbackQuestion.objects.filter(q_type='MCQ').first()
+
+    def setUp(self):
+        cache.clear()
+
+    def request(self, url, user=None, method='get', data=None, headers=None):
+        client = Client()
+        if user is not None:
+            client.force_login(user)
+        cache.clear()
+        # A new questionnaire version, and no stamp read yet in this process
+        bump_questionnaire_version()
+        versions.forget()
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            captures = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in sorted(self.databases)]
+            response = getattr(client, method)(url, data or {}, headers=headers)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        queries = [query for capture in captures for query in capture.captured_queries]
+        return response, queries, time.perf_counter() - started
+
+    def assertBudget(self, url, budget, user=None, method='get', data=None, status=200, headers=None):
+        response, queries, elapsed = self.request(url, user, method, data, headers)
+        self.assertEqual(response.status_code, status, url)
+        sql = '\n'.join(query['sql'] for query in queries)
+        self.assertLessEqual(len(queries), budget, f'{url} ran {len(queries)} queries (budget {budget}):\n{sql}')
+        self.assertLess(elapsed, RESPONSE_TIME_CEILING, f'{url} took {elapsed:.2f}s')
+        return response
+
+    def test_login(self):
+        self.assertBudget(reverse('login'), 0)
+        self.assertBudget(reverse('login'), 9, method='post', status=302,
+                          data={'username': self.teacher.user.username, 'password': 'synthetic'})
+
+    def test_index(self):
+        self.assertBudget(reverse('index'), 19, self.admin)
+        self.assertBudget(reverse('index'), 16, self.teacher.user)
+
+    def test_admin_lists(self):
+        budgets = {
+            'programme_list': 9,
+            'course_list': 11,
+            'teacher_list': 10,
+            'teacher_batch_list': 10,
+            'list_questions': 10,
+        }
+        for name, budget in budgets.items():
+            with self.subTest(name):
+                self.assertBudget(reverse(name), budget, self.admin)
+
+    def test_admin_forms(self):
+        tb = self.tb
+        budgets = {
+            reverse('add_programme'): 9,
+            reverse('edit_programme', args=[tb.course.pgm_id]): 10,
+            reverse('add_course'): 10,
+            reverse('edit_course', args=[tb.course_id]): 11,
+            reverse('batch_list', args=[tb.course_id]): 9,
+            reverse('add_batch', args=[tb.course_id]): 9,
+            reverse('add_teacher'): 10,
+            reverse('edit_teacher', args=[tb.teacher_id]): 12,
+            reverse('teacher_courses', args=[tb.teacher_id]): 11,
+            reverse('assign_teacher_batch'): 9,
+            reverse('edit_teacher_batch_group', args=[tb.batch_id, tb.course_id, tb.department_id]): 15,
+            reverse('add_question'): 8,
+            reverse('add_options', args=[self.mcq.q_id]): 10,
+        }
+        for url, budget in budgets.items():
+            with self.subTest(url):
+                self.assertBudget(url, budget, self.admin)
+
+    def test_student_forms(self):
+        budgets = {
+            reverse('select_teacher_for_feedback'): 1,
+            reverse('student_feedback_form') + f'?teacher_id={self.tb.teacher_id}': 4,
+            reverse('student_feedback_form_by_teacher', args=[self.tb.teacher_id]): 4,
+            reverse('student_feedback_form_by_teacher_course', args=[self.tb.pk]): 4,
+        }
+        for url, budget in budgets.items():
+            with self.subTest(url):
+                self.assertBudget(url, budget)
+
+    def test_submit(self):
+        questionnaire = get_questionnaire()
+        data = {'teacher_batch_id': self.tb.pk, 'submission_token': new_submission_token()}
+        for question in questionnaire.mcq_questions:
+            data[f'question_{question.question.q_id}'] = question.options[0].id
+        for question in questionnaire.desc_questions:
+            data[f'question_{question.q_id}'] = 'Fine.'
+
+        response = self.assertBudget(reverse('submit_student_feedback'), 16, method='post', data=data)
+        self.assertTrue(response.json()['success'], response.json())
+
+        # Replaying the same token stores nothing
+        response = self.assertBudget(reverse('submit_student_feedback'), 1, method='post', data=data)
+        self.assertFalse(response.json()['success'])
+
+    def test_submit_idempotency_key(self):
+        questionnaire = get_questionnaire()
+        data = {'teacher_batch_id': self.tb.pk, 'submission_token': new_submission_token()}
+        for question in questionnaire.mcq_questions:
+            data[f'question_{question.question.q_id}'] = question.options[0].id
+        url = reverse('submit_student_feedback')
+        key = {'Idempotency-Key': 'a1b2c3d4-retry-key'}
+
+        # A failed attempt releases the key
+        incomplete = dict(data)
+        del incomplete[f'question_{questionnaire.mcq_questions[0].question.q_id}']
+        self.assertFalse(self.assertBudget(url, 10, method='post', data=incomplete, headers=key).json()['success'])
+        self.assertFalse(SubmissionIdempotencyKey.objects.exists())
+
+        first = self.assertBudget(url, 21, method='post', data=data, headers=key)
+        self.assertTrue(first.json()['success'], first.json())
+        stored = StudentFeedbackResponse.objects.count()
+
+        # A retry with the key gets the original answer back and writes nothing
+        replay = self.assertBudget(url, 1, method='post', data=data, headers=key)
+        self.assertEqual(replay.json(), first.json())
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(StudentFeedbackResponse.objects.count(), stored)
+
+        other = dict(data, submission_token=new_submission_token())
+        self.assertBudget(url, 1, method='post', data=other, headers=key, status=422)
+        self.assertBudget(url, 0, method='post', data=data, headers={'Idempotency-Key': 'x'}, status=400)
+
+        # Still running: the client is told to retry; once abandoned the key can be taken over
+        digest = SubmissionIdempotencyKey.objects.get(pk=key['Idempotency-Key']).request_hash
+        SubmissionIdempotencyKey.objects.create(key='in-flight-key', request_hash=digest, response=None)
+        self.assertBudget(url, 1, method='post', data=data, headers={'Idempotency-Key': 'in-flight-key'}, status=409)
+        SubmissionIdempotencyKey.objects.filter(pk='in-flight-key').update(created_at=timezone.now() - timedelta(minutes=5))
+        retried = self.client.post(url, data, headers={'Idempotency-Key': 'in-flight-key'})
+        self.assertEqual(retried.json()['error'], 'Feedback already submitted from this session.')
+
+        # Expired keys are evicted and no longer replayed
+        SubmissionIdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(evict_expired(), 1)
+        self.assertFalse(self.client.post(url, data, headers=key).json()['success'])
+
+    def test_submit_combined(self):
+        teacher_batches = list(TeacherBatch.objects.order_by('pk')[:6])
+        TeacherBatch.objects.filter(pk__in=[tb.pk for tb in teacher_batches]).update(is_active_for_feedback=True)
+        form_url = reverse('student_feedback_form_combined') + '?' + '&'.join(f'tb={tb.pk}' for tb in teacher_batches)
+        form = self.assertBudget(form_url, 4)
+        self.assertEqual(len(form.context['courses']), 6)
+
+        questionnaire = get_questionnaire()
+        data = {'teacher_batch_id': [tb.pk for tb in teacher_batches], 'submission_token': form.context['submission_token']}
+        for tb in teacher_batches:
+            for question in questionnaire.mcq_questions:
+                data[f'{tb.pk}-question_{question.question.q_id}'] = question.options[0].id
+            for question in questionnaire.desc_questions:
+                data[f'{tb.pk}-question_{question.q_id}'] = 'Fine.'
+        # The last course is incomplete: only it fails
+        incomplete = teacher_batches[-1].pk
+        del data[f'{incomplete}-question_{questionnaire.mcq_questions[0].question.q_id}']
+
+        before = {tb.pk: tb.submission_count for tb in teacher_batches}
+        url = reverse('submit_student_feedback_combined')
+        # Against 5 x 16 for separate submissions
+        results = self.assertBudget(url, 29, method='post', data=data).json()['results']
+        self.assertEqual([result['success'] for result in results], [True] * 5 + [False])
+        self.assertIn('Please answer all required questions', results[-1]['error'])
+        after = dict(TeacherBatch.objects.filter(pk__in=before).values_list('pk', 'submission_count'))
+        self.assertEqual({pk: after[pk] - before[pk] for pk in before}, {pk: int(pk != incomplete) for pk in before})
+
+        # One token, but the stored courses cannot be linked through their session ids
+        sessions = set(StudentFeedbackResponse.objects.filter(
+            teacher_batch_id__in=before, submitted_at__gte=timezone.now() - timedelta(minutes=1),
+        ).values_list('session_id', flat=True))
+        self.assertEqual(len(sessions), 5)
+
+        # Replaying the token stores nothing again
+        results = self.client.post(url, data).json()['results']
+        self.assertEqual([result['success'] for result in results], [False] * 6)
+        self.assertEqual(results[0]['error'], 'Feedback already submitted from this session.')
+
+        # An unexpected failure is still answered with a JSON error
+        with mock.patch('feedback_app.views.save_submissions', side_effect=RuntimeError('disk full')):
+            data['submission_token'] = new_submission_token()
+            response = self.client.post(url, data)
+        self.assertEqual(response.json(), {'success': False, 'error': 'An error occurred: disk full'})
+
+    def test_combined_code_redeemed_concurrently(self):
+        teacher_batches = list(TeacherBatch.objects.order_by('pk')[:2])
+        questionnaire = get_questionnaire()
+        data = {'teacher_batch_id': [tb.pk for tb in teacher_batches], 'submission_token': new_submission_token()}
+        for tb in teacher_batches:
+            (_, data[f'{tb.pk}-access_code']), = access_codes.generate_codes(tb.pk, 1)
+            for question in questionnaire.mcq_questions:
+                data[f'{tb.pk}-question_{question.question.q_id}'] = question.options[0].id
+        taken = teacher_batches[0]
+        access_codes.redeem(taken.pk, 1)
+        before = dict(TeacherBatch.objects.filter(pk__in=[tb.pk for tb in teacher_batches]).values_list('pk', 'submission_count'))
+
+        # The first check runs before the other submission's redemption is visible
+        used_codes, stale = access_codes.used_codes, [set()]
+        with mock.patch.object(access_codes, 'used_codes', side_effect=lambda codes: stale.pop() if stale else used_codes(codes)):
+            results = self.client.post(reverse('submit_student_feedback_combined'), data).json()['results']
+        self.assertEqual(
+            [(result['success'], result.get('error')) for result in results],
+            [(False, 'This access code has already been used.'), (True, None)],
+        )
+        self.assertEqual(AccessCodeRedemption.objects.filter(teacher_batch__in=teacher_batches).count(), 2)
+        after = dict(TeacherBatch.objects.filter(pk__in=before).values_list('pk', 'submission_count'))
+        self.assertEqual({pk: after[pk] - before[pk] for pk in before}, {pk: int(pk != taken.pk) for pk in before})
+
+    @override_settings(FEEDBACK_ACCESS_CODES_REQUIRED=True)
+    def test_submit_with_access_code(self):
+        questionnaire = get_questionnaire()
+        (_, code), (_, other_code) = access_codes.generate_codes(self.tb.pk, 2)
+        data = {'teacher_batch_id': self.tb.pk, 'submission_token': new_submission_token(), 'access_code': code}
+        for question in questionnaire.mcq_questions:
+            data[f'question_{question.question.q_id}'] = question.options[0].id
+        for question in questionnaire.desc_questions:
+            data[f'question_{question.q_id}'] = 'Fine.'
+
+        # No duplicate lookup on the response table: the redemption insert replaces it
+        response = self.assertBudget(reverse('submit_student_feedback'), 18, method='post', data=data)
+        self.assertTrue(response.json()['success'], response.json())
+        self.assertTrue(AccessCodeRedemption.objects.filter(teacher_batch=self.tb, slot=1).exists())
+
+        # A used code is refused, even with a fresh token
+        data['submission_token'] = new_submission_token()
+        response = self.assertBudget(reverse('submit_student_feedback'), 8, method='post', data=data)
+        self.assertEqual(response.json()['error'], 'This access code has already been used.')
+
+        for bad_code in ('', other_code[:-1] + ('0' if other_code[-1] != '0' else '1')):
+            response = self.client.post(reverse('submit_student_feedback'), dict(data, access_code=bad_code))
+            self.assertFalse(response.json()['success'])
+        other_tb = TeacherBatch.objects.exclude(pk=self.tb.pk).first()
+        response = self.client.post(reverse('submit_student_feedback'), dict(data, teacher_batch_id=other_tb.pk, access_code=other_code))
+        self.assertEqual(response.json()['error'], 'This access code is for a different course.')
+        self.assertEqual(AccessCodeRedemption.objects.count(), 1)
+
+    def test_redemption_ids_carry_no_order(self):
+        access_codes.redeem_many((self.tb.pk, slot) for slot in range(1, 11))
+        for slot in range(11, 21):
+            access_codes.redeem(self.tb.pk, slot)
+        ids = list(AccessCodeRedemption.objects.filter(teacher_batch=self.tb).order_by('slot').values_list('pk', flat=True))
+        self.assertEqual(len(ids), 20)
+        self.assertNotEqual(ids, sorted(ids))
+
+    def test_access_code_sheets(self):
+        for file_format, magic in (('csv', b'Slot,Access Code'), ('pdf', b'%PDF-')):
+            url = reverse('teacher_course_access_codes', args=[self.tb.pk, file_format])
+            response = self.assertBudget(url + '?count=100', 3, self.admin)
+            self.assertTrue(response.content.startswith(magic))
+        self.assertBudget(url, 0, status=302)
+
+        code = access_codes.make_code(self.tb.pk, 3)
+        response = self.assertBudget(reverse('student_feedback_access_code') + f'?code={code.lower()}', 0, status=302)
+        self.assertIn(reverse('student_feedback_form_by_teacher_course', args=[self.tb.pk]), response['Location'])
+
+    def test_roster_and_pending_feedback(self):
+        batch = self.tb.batch
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        roster_path, keys_path = os.path.join(tmp.name, 'roster.csv'), os.path.join(tmp.name, 'keys.csv')
+        with open(roster_path, 'w') as fh:
+            fh.write('roll_number,name\n' + ''.join(f'R{n:03},Student {n}\n' for n in range(1, 41)))
+        call_command('import_roster', roster_path, batch=batch.pk, chunk_size=15, keys_output=keys_path,
+                     stdout=io.StringIO())
+        with open(keys_path, newline='') as fh:
+            keys = {row['roll_number']: row['access_key'] for row in csv.DictReader(fh)}
+        self.assertEqual(len(keys), 40)
+        # Only digests are stored
+        self.assertFalse(RosterEntry.objects.filter(key_digest__in=keys.values()).exists())
+
+        # Re-importing, and enrolling the same student in another batch, adds only the new entry under the same key
+        other_batch = Batch.objects.exclude(pk=batch.pk).first()
+        issued = []
+        self.assertEqual(import_roster([(batch.pk, 'R001', ''), (other_batch.pk, 'R001', '')], keys=issued.extend), (1, 1))
+        self.assertEqual(issued, [])
+        self.assertEqual(RosterEntry.objects.filter(roll_number='R001').values('key_digest').distinct().count(), 1)
+
+        batch.refresh_from_db()
+        self.assertEqual(batch.enrolled_count, 40)
+        self.assertEqual(verify_rollups(), [])
+
+        TeacherBatch.objects.filter(batch=batch).update(is_active_for_feedback=True)
+        Batch.objects.filter(pk=batch.pk).update(is_active=True)
+        url = reverse('student_pending_feedback')
+        student = {'roll_number': 'R007', 'access_key': keys['R007'].lower()}
+        response = self.assertBudget(url, 3, method='post', data=student)
+        self.assertEqual({tb.pk for tb in response.context['pending']},
+                         set(TeacherBatch.objects.filter(batch=batch).values_list('pk', flat=True)))
+        pending_page = response.content.decode()
+
+        # A roll number alone, or with another student's key, shows nothing
+        for data in ({'roll_number': 'R007'}, dict(student, access_key=keys['R008']), dict(student, roll_number='NOBODY')):
+            response = self.assertBudget(url, 1, method='post', data=data)
+            self.assertIsNone(response.context['pending'])
+            self.assertEqual(response.context['error'], 'That roll number and access key do not match.')
+        self.assertBudget(reverse('student_feedback_form_combined'), 1, method='post', data={'roll_number': 'R007'},
+                          status=302)
+
+        # The combined form carries the student's own codes, above the sheet slots, and redeems them
+        form = self.client.post(reverse('student_feedback_form_combined'), student)
+        codes = dict(form.context['courses'])
+        tb = next(tb for tb in codes if tb.pk == self.tb.pk)
+        teacher_batch_id, slot = access_codes.parse_code(codes[tb])
+        self.assertEqual(teacher_batch_id, tb.pk)
+        self.assertGreaterEqual(slot, access_codes.STUDENT_SLOT_BASE)
+        # The pending page lists course names only
+        self.assertNotIn(codes[tb], pending_page)
+        questionnaire = get_questionnaire()
+        data = {'teacher_batch_id': tb.pk, 'submission_token': form.context['submission_token'],
+                f'{tb.pk}-access_code': codes[tb]}
+        for question in questionnaire.mcq_questions:
+            data[f'{tb.pk}-question_{question.question.q_id}'] = question.options[0].id
+        response = self.client.post(reverse('submit_student_feedback_combined'), data)
+        self.assertTrue(response.json()['success'], response.json())
+        self.assertEqual(AccessCodeRedemption.objects.filter(teacher_batch=tb, slot=slot).count(), 1)
+
+        response = self.assertBudget(url, 3, method='post', data=student)
+        self.assertNotIn(tb.pk, {tb.pk for tb in response.context['pending']})
+        other = self.client.post(url, {'roll_number': 'R008', 'access_key': keys['R008']})
+        self.assertIn(tb.pk, {tb.pk for tb in other.context['pending']})
+
+        # Sheets cannot print the students' slots
+        with self.assertRaises(CommandError):
+            call_command('generate_access_codes', tb.pk, start=access_codes.STUDENT_SLOT_BASE, stdout=io.StringIO())
+
+    def test_reports(self):
+        budgets = {
+            reverse('admin_student_feedback_responses'): 20,
+            reverse('admin_feedback_sessions'): 10,
+            reverse('export_student_feedback_responses', args=['csv']): 9,
+        }
+        for user in (self.admin, self.hod.user, self.teacher.user):
+            for url, budget in budgets.items():
+                with self.subTest(url, user=user.username):
+                    self.assertBudget(url, budget, user)
+
+    def test_ajax(self):
+        budgets = {
+            reverse('load_courses_teachers') + f'?department_id={self.tb.department_id}': 4,
+            reverse('load_batches') + f'?course_id={self.tb.course_id}': 3,
+        }
+        for url, budget in budgets.items():
+            with self.subTest(url):
+                self.assertBudget(url, budget, self.admin)
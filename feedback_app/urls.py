@@ -50,10 +50,18 @@ urlpatterns = [
     
     # Admin Feedback Response URLs (login required)
     path('feedback-admin/student-responses/', views.admin_student_feedback_responses, name='admin_student_feedback_responses'),
+    path('feedback-admin/student-responses/sessions/', views.admin_feedback_sessions, name='admin_feedback_sessions'),
+    path('feedback-admin/student-responses/export/<str:file_format>/', views.export_student_feedback_responses, name='export_student_feedback_responses'),
+    path('feedback-admin/sql-profile/', views.sql_profile_report, name='sql_profile_report'),
     path('student-feedback/teacher/<int:teacher_id>/', views.student_feedback_form_by_teacher, name='student_feedback_form_by_teacher'),
     path('student-feedback/teacher-course/<int:teacher_batch_id>/', views.student_feedback_form_by_teacher_course, name='student_feedback_form_by_teacher_course'),
     path('student-feedback/teachers/', views.select_teacher_for_feedback, name='select_teacher_for_feedback'),
     path('student-feedback/submit/', views.submit_student_feedback, name='submit_student_feedback'),
+    path('student-feedback/combined/', views.student_feedback_form_combined, name='student_feedback_form_combined'),
+    path('student-feedback/combined/submit/', views.submit_student_feedback_combined, name='submit_student_feedback_combined'),
+    path('student-feedback/code/', views.student_feedback_access_code, name='student_feedback_access_code'),
+    path('student-feedback/pending/', views.student_pending_feedback, name='student_pending_feedback'),
+    path('teacher-course/<int:teacher_batch_id>/access-codes/<str:file_format>/', views.teacher_course_access_codes, name='teacher_course_access_codes'),
 
     path('ajax/load-courses-teachers/', views.get_courses_teachers_by_department, name='load_courses_teachers'),
     path('ajax/load-batches/', views.load_batches, name='load_batches'),
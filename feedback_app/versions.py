@@ -0,0 +1,109 @@
+"""
+Version stamps every process agrees on.
+
+The compiled questionnaire lives in each process and the dashboards and
+roles in the default cache, which is a per-process LocMemCache unless a
+shared backend is configured. Each tags its data with a stamp kept in the
+``VersionStamp`` table, so a bump made by any process (a web worker, or the
+journal drainer) retires the copies held by all of them.
+
+A process trusts the stamps it has read for FEEDBACK_VERSION_CHECK_INTERVAL
+seconds, which bounds how long another process's change can go unseen
+while costing at most one query per stamp per interval. Its own bumps are
+seen at once. A bump written inside a transaction commits or rolls back
+with it.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .models import VersionStamp
+
+CHECK_INTERVAL = 2  # Seconds; FEEDBACK_VERSION_CHECK_INTERVAL overrides
+
+_lock = threading.Lock()
+_local = {}  # key -> (version, monotonic time it was read)
+
+
+def check_interval():
+    return getattr(settings, 'FEEDBACK_VERSION_CHECK_INTERVAL', CHECK_INTERVAL)
+
+
+def get_versions(keys):
+    """Return ``{key: version}``, reading the stamps this process has not checked lately in one query.
+
+    A key that was never bumped is version 0.
+    """
+    now = time.monotonic()
+    interval = check_interval()
+    versions = {}
+    stale = []
+    for key in keys:
+        known = _local.get(key)
+        if known is not None and now - known[1] < interval:
+            versions[key] = known[0]
+        else:
+            stale.append(key)
+    if stale:
+        stored = dict(VersionStamp.objects.filter(pk__in=stale).values_list('key', 'version'))
+        with _lock:
+            for key in stale:
+                versions[key] = stored.get(key, 0)
+                _local[key] = (versions[key], now)
+    return versions
+
+
+def get_version(key):
+    return get_versions([key])[key]
+
+
+def bump_versions(keys):
+    """Give each key a new version with one upsert, retiring what was cached under the old ones."""
+    keys = set(keys)
+    if not keys:
+        return
+    version = time.time_ns()
+    VersionStamp.objects.bulk_create(
+        [VersionStamp(key=key, version=version) for key in keys],
+        update_conflicts=True, unique_fields=['key'], update_fields=['version'],
+    )
+    now = time.monotonic()
+    with _lock:
+        for key in keys:
+            _local[key] = (version, now)
+
+
+def bump_version(key, expected=None):
+    """Give ``key`` a new version.
+
+    With ``expected``, returns the new version if it directly follows
+    ``expected``, that is if nobody bumped the key since that version was
+    read; data tagged ``expected`` can then be brought up to date and
+    re-tagged instead of rebuilt. Returns ``None`` otherwise.
+    """
+    if expected is not None:
+        version = time.time_ns()
+        if expected == 0:
+            # Never bumped: follows on only if nobody creates the row first
+            try:
+                with transaction.atomic():
+                    VersionStamp.objects.create(key=key, version=version)
+                followed = True
+            except IntegrityError:
+                followed = False
+        else:
+            followed = VersionStamp.objects.filter(pk=key, version=expected).update(version=version) == 1
+        if followed:
+            with _lock:
+                _local[key] = (version, time.monotonic())
+            return version
+    bump_versions([key])
+    return None
+
+
+def forget():
+    """Drop this process's copies of the stamps, so the next reads go to the database."""
+    with _lock:
+        _local.clear()
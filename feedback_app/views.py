@@ -19,7 +19,7 @@ def user_login(request):
     return render(request, 'login.html')
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Avg, Q
+from django.db.models import Max, Sum
 from django.utils import timezone
 from datetime import datetime, timedelta
 import json
@@ -30,97 +30,69 @@ import calendar
 from .models import (
     StudentFeedbackResponse, Teacher, Course, Department, 
     TeacherBatch, FeedbackQOption, TeacherFeedbackResponse,
-    Feedback, Programme, Batch
+    Feedback, Programme, Batch, FeedbackOptionCount,
+    SCORE_CHOICES, guess_option_score,
+)
+from .reports import average_score
+from .rollups import rebuild_rollups
+from .roles import get_roles
+from .dashboards import (
+    ADMIN_MONTHS, admin_stats, cached_teacher_dashboard, invalidate_admin_stats,
+    invalidate_teacher_dashboards, month_key,
 )
 
 @login_required
 def index(request):
-    user = request.user
+    roles = get_roles(request)
     current_date = timezone.now()
     
     # Base context
     context = {
         "current_date": current_date,
-        "is_admin": user.is_staff,
-        "is_teacher": hasattr(user, 'teacher') and not user.is_staff,
+        "is_admin": roles.is_staff,
+        "is_teacher": roles.has_teacher and not roles.is_staff,
     }
     
-    if user.is_staff:
+    if roles.is_staff:
         # Admin Dashboard Data
         context.update(get_admin_dashboard_data())
-    elif hasattr(user, 'teacher'):
+    elif roles.has_teacher:
         # Teacher Dashboard Data
-        context.update(get_teacher_dashboard_data(user.teacher))
+        context.update(get_teacher_dashboard_data(roles.teacher_id))
     
     return render(request, 'index.html', context)
 
 def get_admin_dashboard_data():
     """Generate comprehensive admin dashboard data"""
-    
-    # Basic statistics
-    total_students_submitted = StudentFeedbackResponse.objects.values('session_id').distinct().count()
-    active_teachers = Teacher.objects.filter(fb_active=True).count()
-    total_courses = Course.objects.count()
-    total_departments = Department.objects.count()
-    
+
+    # Counts, distributions and the monthly series come from the cached
+    # stats store, which submissions keep current (see dashboards.py)
+    stats = admin_stats()
+
     # Gender distribution data
-    gender_stats = Teacher.objects.exclude(gender__isnull=True).exclude(gender__exact='').values('gender').annotate(count=Count('gender'))
-    
-    if gender_stats.exists():
-        gender_labels = []
-        gender_counts = []
-        for stat in gender_stats:
-            gender_labels.append(stat['gender'].title() if stat['gender'] else 'Not Specified')
-            gender_counts.append(stat['count'])
-    else:
+    gender_labels = [gender.title() for gender, _ in stats['gender']]
+    gender_counts = [count for _, count in stats['gender']]
+    if not gender_labels:
         # Default data if no gender data exists
         gender_labels = ['Male', 'Female']
         gender_counts = [0, 0]
-    
-    # Rating distribution (assuming you have rating options)
-    rating_options = ['Excellent', 'Good', 'Average', 'Poor','Very Poor']
-    rating_counts = []
-    
-    for option in rating_options:
-        count = StudentFeedbackResponse.objects.filter(
-            selected_option__answer__icontains=option
-        ).count()
-        rating_counts.append(count)
-    
-    # If all counts are 0, provide sample data for demonstration
-    if sum(rating_counts) == 0:
-        rating_counts = [0, 0, 0, 0, 0]
-    
-    # Monthly response trend (last 6 months)
+
+    # Rating distribution by option score
+    rating_options = [label.split(' - ', 1)[1] for _, label in SCORE_CHOICES]
+    rating_counts = [stats['ratings'].get(score, 0) for score, _ in SCORE_CHOICES]
+
+    # Monthly response trend (last 6 months, oldest first)
     monthly_labels = []
     monthly_counts = []
-    current_date = timezone.now()
-    
-    for i in range(6):
-        date = current_date - timedelta(days=30*i)
-        month_name = calendar.month_name[date.month]
-        monthly_labels.insert(0, f"{month_name[:3]} {date.year}")
-        
-        # Count responses for this month
-        start_date = date.replace(day=1)
-        if i == 0:
-            end_date = current_date
-        else:
-            next_month = start_date.replace(month=start_date.month+1) if start_date.month < 12 else start_date.replace(year=start_date.year+1, month=1)
-            end_date = next_month - timedelta(days=1)
-        
-        count = StudentFeedbackResponse.objects.filter(
-            submitted_at__range=[start_date, end_date]
-        ).count()
-        monthly_counts.insert(0, count)
-    
+    month = timezone.localtime().date().replace(day=1)
+    for i in range(ADMIN_MONTHS):
+        monthly_labels.insert(0, f"{calendar.month_name[month.month][:3]} {month.year}")
+        monthly_counts.insert(0, stats['monthly'].get(month_key(month), 0))
+        month = (month - timedelta(days=1)).replace(day=1)
+
     # Department-wise teacher distribution
-    dept_stats = Department.objects.annotate(
-        teacher_count=Count('teacher')
-    ).order_by('-teacher_count')
-    
-    department_labels = [dept.dept_name for dept in dept_stats]
-    department_counts = [dept.teacher_count for dept in dept_stats]
+    department_labels = [name for name, _ in stats['departments']]
+    department_counts = [count for _, count in stats['departments']]
     
     # Recent activities (last 10 feedback responses)
     recent_activities = TeacherFeedbackResponse.objects.select_related(
@@ -130,10 +102,10 @@ def get_admin_dashboard_data():
     ).order_by('-created_date_time')[:10]
     
     return {
-        'total_feedback_submissions': total_students_submitted,
-        'active_teachers': active_teachers,
-        'total_courses': total_courses,
-        'total_departments': total_departments,
+        'total_feedback_submissions': stats['total_feedback_submissions'],
+        'active_teachers': stats['active_teachers'],
+        'total_courses': stats['total_courses'],
+        'total_departments': stats['total_departments'],
         'gender_labels': json.dumps(gender_labels),
         'gender_counts': json.dumps(gender_counts),
         'rating_labels': json.dumps(rating_options),
@@ -143,102 +115,77 @@ def get_admin_dashboard_data():
         'department_labels': json.dumps(department_labels),
         'department_counts': json.dumps(department_counts),
         'recent_activities': recent_activities,
+        'stats_built_at': stats['built_at'],
+        'stats_updated_at': stats['updated_at'],
     }
 from collections import defaultdict
 import json
 
-def get_teacher_dashboard_data(teacher):
-    """Generate comprehensive teacher dashboard data for a given teacher."""
+def get_teacher_dashboard_data(teacher_id):
+    """Teacher dashboard data, cached per teacher until they receive feedback."""
+    return cached_teacher_dashboard(teacher_id, lambda: build_teacher_dashboard_data(teacher_id))
+
 
-    # All TeacherBatch entries for this teacher
-    teacher_batches = TeacherBatch.objects.filter(teacher=teacher).select_related(
+def build_teacher_dashboard_data(teacher_id):
+    """Generate comprehensive teacher dashboard data for a given teacher.
+
+    Built from a fixed set of queries: the teacher's TeacherBatch rows
+    (carrying submission totals) and grouped aggregates over the option
+    count rollup.
+    """
+
+    # All TeacherBatch entries for this teacher, carrying their submission rollups
+    teacher_batches = list(TeacherBatch.objects.filter(teacher_id=teacher_id).select_related(
         'course', 'batch', 'department'
-    )
+    ))
 
-    teacher_courses_count = teacher_batches.count()
+    teacher_courses_count = len(teacher_batches)
 
     # Total feedback responses for this teacher
-    teacher_responses_count = StudentFeedbackResponse.objects.filter(
-        teacher_batch__teacher=teacher
-    ).count()
-
-    # Calculate average rating
-    rating_map = {
-        'excellent': 5,
-        'good': 4,
-        'average': 3,
-        'poor': 2,
-        'very poor': 1,
-    }
+    teacher_responses_count = sum(tb.response_count for tb in teacher_batches)
 
-    rating_responses = StudentFeedbackResponse.objects.filter(
-        teacher_batch__teacher=teacher,
-        selected_option__isnull=False
-    ).select_related('selected_option')
-
-    total_rating = 0
-    rating_count = 0
-    feedback_distribution = defaultdict(int)
-
-    for response in rating_responses:
-        if not response.selected_option or not response.selected_option.answer:
-            continue
-        option_text = response.selected_option.answer.lower()
-        for key, value in rating_map.items():
-            if key in option_text:
-                total_rating += value
-                rating_count += 1
-                feedback_distribution[response.selected_option.answer] += 1
-                break
+    # Ratings are aggregated in the database from the option count rollup,
+    # weighting each scored option by how often it was picked
+    rated = FeedbackOptionCount.objects.filter(
+        teacher_batch__teacher_id=teacher_id,
+        selected_option__score__isnull=False
+    ).order_by()
+
+    teacher_avg_rating = rated.aggregate(avg=average_score())['avg'] or 0
+    total_questions_count = get_questionnaire().total_questions
 
-    teacher_avg_rating = total_rating / rating_count if rating_count > 0 else 0
-    total_questions_count = FeedbackQuestion.objects.filter(active=True).count() 
-    
     # Unique students count
-    unique_students = StudentFeedbackResponse.objects.filter(
-        teacher_batch__teacher=teacher
-    ).values('session_id').distinct().count()
+    unique_students = sum(tb.submission_count for tb in teacher_batches)
 
-    # Prepare chart data for teacher feedback distribution
-    teacher_feedback_labels = list(feedback_distribution.keys())
-    teacher_feedback_counts = list(feedback_distribution.values())
+    # Prepare chart data for teacher feedback distribution, best rating first
+    distribution = (
+        rated.values_list('selected_option__answer')
+        .annotate(n=Sum('count'), top=Max('selected_option__score'))
+        .order_by('-top', 'selected_option__answer')
+    )
+    teacher_feedback_labels = [answer for answer, _, _ in distribution]
+    teacher_feedback_counts = [count for _, count, _ in distribution]
 
     # ✅ UPDATED: Batch-wise performance with student count instead of response count
     batch_performance = {}  # Dictionary to group by batch
     batch_labels = []
     batch_ratings = []  # Changed from batch_ratings to batch_student_counts
 
-    # Group responses by batch
+    batch_avgs = {
+        f"{year} {part}": avg
+        for year, part, avg in rated.values_list(
+            'teacher_batch__batch__acad_year', 'teacher_batch__batch__part'
+        ).annotate(avg=average_score())
+    }
+    course_avgs = dict(rated.values_list('teacher_batch_id').annotate(avg=average_score()))
+
+    # Group teacher-courses by batch
     for batch in teacher_batches:
         batch_key = f"{batch.batch.acad_year} {batch.batch.part}"
-        
-        if batch_key not in batch_performance:
-            batch_performance[batch_key] = {
-                'total_rating': 0,
-                'rating_count': 0,
-                'unique_students': 0
-            }
-        
-        # Get unique students for this specific teacher-batch combination
-        unique_students_for_batch = StudentFeedbackResponse.objects.filter(
-            teacher_batch=batch
-        ).values('session_id').distinct().count()
-        
-        batch_performance[batch_key]['unique_students'] = unique_students_for_batch
-        
-        # Still calculate ratings for other purposes
-        batch_responses = StudentFeedbackResponse.objects.filter(
-            teacher_batch=batch
-        ).select_related('selected_option')
-
-        for response in batch_responses:
-            if response.selected_option and response.selected_option.answer:
-                option_text = response.selected_option.answer.lower()
-                for key, value in rating_map.items():
-                    if key in option_text:
-                        batch_performance[batch_key]['total_rating'] += value
-                        batch_performance[batch_key]['rating_count'] += 1
-                        break
+        batch_performance[batch_key] = {
+            'unique_students': batch.submission_count,
+            'avg_rating': batch_avgs.get(batch_key) or 0,
+        }
 
     # ✅ NEW: Sort batch performance by year and part before converting to lists
     def sort_batch_key(item):
@@ -251,43 +198,19 @@ def get_teacher_dashboard_data(teacher):
     # Convert sorted batch performance to lists for chart
     for batch_key, data in sorted_batch_performance:
         batch_labels.append(batch_key)
-        avg_rating = data['total_rating'] / data['rating_count'] if data['rating_count'] > 0 else 0
-        batch_ratings.append(round(avg_rating, 1))
+        batch_ratings.append(round(data['avg_rating'], 1))
 
     # ✅ UPDATED: Course-wise performance for the table with student count
     course_performance = []
 
     for batch in teacher_batches:
-        # Get unique students for this specific teacher-batch combination
-        unique_students_for_course = StudentFeedbackResponse.objects.filter(
-            teacher_batch=batch
-        ).values('session_id').distinct().count()
-        
-        # Still calculate average rating for display
-        course_responses = StudentFeedbackResponse.objects.filter(
-            teacher_batch=batch
-        ).select_related('selected_option')
-
-        course_total = 0
-        course_count = 0
-        response_count = 0
-
-        for response in course_responses:
-            if response.selected_option and response.selected_option.answer:
-                option_text = response.selected_option.answer.lower()
-                for key, value in rating_map.items():
-                    if key in option_text:
-                        course_total += value
-                        course_count += 1
-                        break
-
-        course_avg = course_total / course_count if course_count > 0 else 0
+        course_avg = course_avgs.get(batch.pk) or 0
 
         course_info = {
             'course': batch.course,
             'batch': batch.batch,
             'department': batch.department,
-            'students_reached': unique_students_for_course,  # Changed from response_count
+            'students_reached': batch.submission_count,  # Changed from response_count
             'avg_rating': course_avg
         }
         course_performance.append(course_info)
@@ -308,19 +231,8 @@ def get_teacher_dashboard_data(teacher):
 
 def get_rating_value(option_text):
     """Convert option text to numeric rating"""
-    option_lower = option_text.lower()
-    rating_map = {
-        'excellent': 5,
-        'good': 4,
-        'average': 3,
-        'poor': 2,
-        'very poor': 1,
-    }
-    
-    for key, value in rating_map.items():
-        if key in option_lower:
-            return value
-    return 0  # Default if no match found
+    # Options carry an explicit score now; this only guesses one from the text
+    return guess_option_score(option_text) or 0
 
 # Optional: Function to get color scheme for charts
 def get_chart_colors(count):
@@ -336,7 +248,7 @@ def user_logout(request):
     return redirect('login')
 @login_required
 def programme_list(request):
-    programmes = Programme.objects.all()
+    programmes = Programme.objects.select_related('dept')
     return render(request, 'programme_list.html', {'programmes': programmes})
 
 @login_required
@@ -376,6 +288,7 @@ def course_list(request):
         courses = Course.objects.filter(dept__dept_name=selected_dept).prefetch_related('batch_set')
     else:
         courses = Course.objects.all().prefetch_related('batch_set')
+    courses = courses.select_related('dept', 'pgm')
 
     batch_form = BatchForm()
     edit_forms={}
@@ -398,6 +311,7 @@ def add_course(request):
         form = CourseForm(request.POST)
         if form.is_valid():
             form.save()
+            invalidate_admin_stats()
             return redirect('course_list')
     else:
         form = CourseForm()
@@ -410,6 +324,7 @@ def edit_course(request, pk):
         form = CourseForm(request.POST, instance=course)
         if form.is_valid():
             form.save()
+            invalidate_admin_stats()
             return redirect('course_list')
     else:
         form = CourseForm(instance=course)
@@ -420,6 +335,7 @@ def delete_course(request, pk):
     course = get_object_or_404(Course, pk=pk)
     if request.method == 'POST':
         course.delete()
+        invalidate_admin_stats()
         return redirect('course_list')
     return render(request, 'delete_course.html', {'course': course})
 
@@ -488,6 +404,7 @@ def teacher_list(request):
         teachers = Teacher.objects.filter(dept__dept_name=selected_dept)
     else:
         teachers = Teacher.objects.all()
+    teachers = teachers.select_related('user', 'dept', 'role')
 
     # ✅ This is essential for showing errors in modal
     reset_errors = request.session.pop('reset_errors', None)
@@ -520,6 +437,8 @@ def add_teacher(request):
                 if teacher.user:
                     teacher.user.groups.add(group)
 
+                invalidate_admin_stats()
+
                 messages.success(request, "Teacher added and assigned to group successfully!")
                 return redirect('teacher_list')
             except Exception as e:
@@ -541,6 +460,7 @@ def edit_teacher(request, pk):
         form = TeacherEditForm(request.POST,request.FILES, instance=teacher)  # Only TeacherEditForm (no password)
         if form.is_valid():
             form.save()
+            invalidate_admin_stats()
             messages.success(request, "Teacher updated successfully!")
             return redirect('teacher_list')
     else:
@@ -554,6 +474,7 @@ def delete_teacher(request, pk):
     teacher = get_object_or_404(Teacher, pk=pk)
     if request.method == 'POST':
         teacher.user.delete()
+        invalidate_admin_stats()
         return redirect('teacher_list')
     return render(request, 'delete_teacher.html', {'teacher': teacher})
 
@@ -610,7 +531,6 @@ from django.contrib.auth.decorators import login_required
 from .models import TeacherBatch
 from .forms import TeacherBatchAssignForm
 from collections import defaultdict
-from django.db.models import Prefetch
 
 from collections import defaultdict
 from django.shortcuts import render
@@ -695,6 +615,8 @@ def assign_teacher_batch(request):
                         course=course,
                         department=department
                     )
+                invalidate_teacher_dashboards(t.pk for t in teachers)
+                invalidate_admin_stats()
                 return redirect('teacher_batch_list')
     else:
         form = TeacherBatchAssignForm()
@@ -715,7 +637,7 @@ def edit_teacher_batch_group(request, batch_id, course_id, dept_id):
         batch=batch_obj,
         course=course_obj,
         department=dept_obj,
-    )
+    ).select_related('teacher')
 
     # Pass model instances instead of IDs to preserve display labels
     assigned_teachers = [a.teacher for a in assignments]
@@ -724,6 +646,7 @@ def edit_teacher_batch_group(request, batch_id, course_id, dept_id):
         form = TeacherBatchAssignForm(request.POST)
         if form.is_valid():
             # Remove old assignments
+            invalidate_teacher_dashboards(a.teacher_id for a in assignments)
             assignments.delete()
 
             # Add updated teachers
@@ -735,6 +658,8 @@ def edit_teacher_batch_group(request, batch_id, course_id, dept_id):
                     course=course_obj,
                     department=dept_obj
                 )
+            invalidate_teacher_dashboards(t.pk for t in teachers)
+            invalidate_admin_stats()
             return redirect('teacher_batch_list')
     else:
         # Pre-fill the form with the existing assignments
@@ -754,11 +679,14 @@ def edit_teacher_batch_group(request, batch_id, course_id, dept_id):
 @login_required
 def delete_teacher_batch_group(request, batch_id, course_id, dept_id):
     if request.method == 'POST':
-        TeacherBatch.objects.filter(
+        assignments = TeacherBatch.objects.filter(
             batch__batch_id=batch_id,
             course__course_id=course_id,
             department__dept_id=dept_id,
-        ).delete()
+        )
+        invalidate_teacher_dashboards(assignments.values_list('teacher_id', flat=True))
+        assignments.delete()
+        invalidate_admin_stats()
         messages.success(request, "All assignments deleted successfully.")
     return redirect('teacher_batch_list')
 
@@ -790,6 +718,20 @@ from django.contrib import messages
 from .forms import FeedbackQuestionForm, FeedbackQOptionForm
 from .models import FeedbackQuestion, FeedbackQOption
 
+def _create_options(question, option_texts, first=1):
+    """Add options ``opt_<first>``, ``opt_<first + 1>``, ... to an MCQ question.
+
+    Each option's score is guessed from its text; it stays adjustable under
+    "Option Scores". Saved one by one so the questionnaire version is bumped.
+    """
+    for i, option_text in enumerate(option_texts, first):
+        FeedbackQOption.objects.create(
+            q=question,
+            ans_id=f"opt_{i}",
+            answer=option_text,
+            score=guess_option_score(option_text),
+        )
+
 def add_question(request):
     if request.method == 'POST':
         form = FeedbackQuestionForm(request.POST)
@@ -806,12 +748,7 @@ def add_question(request):
                     options = [opt.strip() for opt in options_text.split(',') if opt.strip()]
                     
                     # Save the options for this question with proper ans_id
-                    for i, option_text in enumerate(options, 1):
-                        FeedbackQOption.objects.create(
-                            q=question, 
-                            ans_id=f"opt_{i}",  # Generate a proper ans_id
-                            answer=option_text
-                        )
+                    _create_options(question, options)
                     
                     messages.success(request, f'Question "{question.q_desc}" created successfully with {len(options)} options!')
                 else:
@@ -831,7 +768,7 @@ def add_question(request):
 
 # List Questions
 def list_questions(request):
-    questions = FeedbackQuestion.objects.all().order_by('-active', 'q_id')  # Show active questions first
+    questions = FeedbackQuestion.objects.all().order_by('-active', 'q_id').prefetch_related('feedbackqoption_set')  # Show active questions first
     return render(request, 'list_questions.html', {'questions': questions})
 
 # Simplified Add Options for MCQ (handles both single and multiple options)
@@ -842,18 +779,23 @@ def add_options(request, q_id):
         messages.error(request, 'Options can only be added to MCQ questions.')
         return redirect('list_questions')
     
+    if request.method == 'POST' and 'update_scores' in request.POST:
+        valid_scores = {str(score) for score, _ in SCORE_CHOICES}
+        for option in FeedbackQOption.objects.filter(q=question):
+            value = request.POST.get(f'score_{option.id}', '')
+            score = int(value) if value in valid_scores else None
+            if score != option.score:
+                option.score = score
+                option.save(update_fields=['score'])
+        messages.success(request, 'Option scores updated successfully!')
+        return redirect('add_options', q_id=q_id)
+
     if request.method == 'POST':
         options_text = request.POST.get('options_text', '')
         if options_text:
             options = [opt.strip() for opt in options_text.split(',') if opt.strip()]
             existing_count = FeedbackQOption.objects.filter(q=question).count()
-            
-            for i, option_text in enumerate(options, existing_count + 1):
-                FeedbackQOption.objects.create(
-                    q=question,
-                    ans_id=f"opt_{i}",
-                    answer=option_text
-                )
+            _create_options(question, options, existing_count + 1)
             
             if len(options) == 1:
                 messages.success(request, f'Option "{options[0]}" added successfully!')
@@ -868,16 +810,28 @@ def add_options(request, q_id):
     
     return render(request, 'add_options.html', {
         'question': question, 
-        'options': options
+        'options': options,
+        'score_choices': SCORE_CHOICES,
     })
 
+def _delete_with_responses(instance, responses):
+    """Delete a question or option and rebuild the rollups of the answers that cascade with it."""
+    with transaction.atomic():
+        teacher_batch_ids = set(
+            responses.filter(teacher_batch__isnull=False).order_by().values_list('teacher_batch_id', flat=True).distinct()
+        )
+        instance.delete()
+        if teacher_batch_ids:
+            rebuild_rollups(teacher_batch_ids=teacher_batch_ids)
+
+
 # Delete Question View
 def delete_question(request, q_id):
     question = get_object_or_404(FeedbackQuestion, q_id=q_id)
     
     if request.method == 'POST':
         question_desc = question.q_desc
-        question.delete()
+        _delete_with_responses(question, StudentFeedbackResponse.objects.filter(question=question))
         messages.success(request, f'Question "{question_desc}" deleted successfully!')
         return redirect('list_questions')
 
@@ -912,7 +866,7 @@ def delete_option(request, option_id):
     
     if request.method == 'POST':
         option_text = option.answer
-        option.delete()
+        _delete_with_responses(option, StudentFeedbackResponse.objects.filter(selected_option=option))
         messages.success(request, f'Option "{option_text}" deleted successfully!')
     
     return redirect('add_options', q_id=question_id)
@@ -923,11 +877,28 @@ def delete_option(request, option_id):
 
 from django.shortcuts import render, redirect
 from django.contrib import messages
-from django.http import JsonResponse
+from contextlib import nullcontext
+from urllib.parse import urlencode
+from django.db import transaction
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
 import json
-import uuid
-from .models import FeedbackQuestion, FeedbackQOption, StudentFeedbackResponse, Teacher
+from .models import FeedbackQuestion, FeedbackQOption, FeedbackSession, StudentFeedbackResponse, Teacher
+from .questionnaire import get_questionnaire
+from .reports import InvalidCursor, session_page, summarize_questions
+from .exports import export_rows, stream_csv, stream_xlsx
+from .profiling import worst_views
+from .sqlite import reporting, reporting_db
+from django.conf import settings
+from django.template.loader import render_to_string
+from .submission import (
+    SubmissionError, build_submission, course_session_id, new_submission_token, read_submission_token,
+    save_submissions,
+)
+from . import access_codes, journal
+from .idempotency import idempotent
+from .roster import RosterError, pending_teacher_batches
 
 
 def student_feedback_form(request):
@@ -935,121 +906,68 @@ def student_feedback_form(request):
     teacher_id = request.GET.get('teacher_id')
     teacher = get_object_or_404(Teacher, teacher_id=teacher_id)
 
-    # Get only active questions
-    questions = FeedbackQuestion.objects.filter(active=True).order_by('q_id')
-
-    # Generate a unique session ID for this feedback submission
-    if 'student_feedback_session' not in request.session:
-        request.session['student_feedback_session'] = str(uuid.uuid4())
-
-    # Separate MCQ and Descriptive questions
-    mcq_questions = []
-    desc_questions = []
-
-    for question in questions:
-        if question.q_type == 'MCQ':
-            options = FeedbackQOption.objects.filter(q=question).order_by('ans_id')
-            mcq_questions.append({
-                'question': question,
-                'options': options
-            })
-        elif question.q_type == 'DESC':
-            desc_questions.append(question)
+    # Active questions and their options, compiled once per questionnaire version
+    questionnaire = get_questionnaire()
 
     context = {
         'teacher': teacher,
-        'mcq_questions': mcq_questions,
-        'desc_questions': desc_questions,
-        'session_id': request.session['student_feedback_session'],
-        'total_questions': questions.count()
+        'mcq_questions': questionnaire.mcq_questions,
+        'desc_questions': questionnaire.desc_questions,
+        'submission_token': new_submission_token(),
+        'total_questions': questionnaire.total_questions,
+        'questionnaire_version': questionnaire.version,
     }
     return render(request, 'feedback_form.html', context)
 
 
+@idempotent
 def submit_student_feedback(request):
     """Handle student feedback submission with teacher-course linking."""
     if request.method == 'POST':
         try:
-            session_id = request.session.get('student_feedback_session')
-            if not session_id:
-                return JsonResponse({'success': False, 'error': 'Session expired. Please refresh the page.'})
+            # The signed token from the form stands in for a Django session
+            session_id = read_submission_token(request.POST.get('submission_token'))
 
-            # Prevent duplicate submissions
-            existing_responses = StudentFeedbackResponse.objects.filter(session_id=session_id)
-            if existing_responses.exists():
-                return JsonResponse({'success': False, 'error': 'Feedback already submitted from this session.'})
+            access_code = None
+            if access_codes.is_required() or request.POST.get('access_code'):
+                # Checked by HMAC alone; redeeming it below is what prevents a second submission
+                access_code = access_codes.parse_code(request.POST.get('access_code'))
+            else:
+                # Prevent duplicate submissions
+                existing_responses = StudentFeedbackResponse.objects.filter(session_id=session_id)
+                if existing_responses.exists():
+                    return JsonResponse({'success': False, 'error': 'Feedback already submitted from this session.'})
 
             # Get teacher_batch_id instead of teacher_id
             teacher_batch_id = request.POST.get('teacher_batch_id')
-            teacher_batch = TeacherBatch.objects.filter(pk=teacher_batch_id).first() if teacher_batch_id else None
+            teacher_batch = TeacherBatch.objects.select_related('course').filter(pk=teacher_batch_id).first() if teacher_batch_id else None
             
             if not teacher_batch:
                 return JsonResponse({'success': False, 'error': 'Invalid teacher-course selection.'})
 
-            # Get all active questions
-            questions = FeedbackQuestion.objects.filter(active=True)
-            unanswered_questions = []
-            responses_to_save = []
-
-            for question in questions:
-                if question.q_type == 'MCQ':
-                    option_id = request.POST.get(f'question_{question.q_id}')
-                    if not option_id:
-                        unanswered_questions.append(f"Question {question.q_id}")
-                    else:
-                        try:
-                            option = FeedbackQOption.objects.get(id=option_id, q=question)
-                            responses_to_save.append({
-                                'question': question,
-                                'selected_option': option,
-                                'session_id': session_id
-                            })
-                        except FeedbackQOption.DoesNotExist:
-                            unanswered_questions.append(f"Question {question.q_id} (Invalid option)")
-
-                elif question.q_type == 'DESC':
-                    response_text = request.POST.get(f'question_{question.q_id}', '').strip()
-                    if question.is_required and not response_text:
-                        unanswered_questions.append(f"Question {question.q_id}")
-                    else:
-                        responses_to_save.append({
-                            'question': question,
-                            'response_text': response_text if response_text else None,
-                            'session_id': session_id
-                        })
-
-            # If unanswered required questions exist, return error
-            if unanswered_questions:
-                return JsonResponse({
-                    'success': False,
-                    'error': f'Please answer all required questions. Missing answers for: {", ".join(unanswered_questions)}'
-                })
-
-            # Generate feedback number based on teacher-course
-            feedback_count = StudentFeedbackResponse.objects.filter(teacher_batch=teacher_batch).values('session_id').distinct().count()
-            feedback_number = feedback_count + 1
-
-            # Save responses with teacher_batch relationship
-            for response_data in responses_to_save:
-                StudentFeedbackResponse.objects.create(
-                    question=response_data['question'],
-                    selected_option=response_data.get('selected_option'),
-                    response_text=response_data.get('response_text'),
-                    session_id=session_id,
-                    feedback_number=feedback_number,
-# Keep for backward compatibility
-                    teacher_batch=teacher_batch  # NEW: Link to specific teacher-course
-                )
-
-            # Clear session
-            if 'student_feedback_session' in request.session:
-                del request.session['student_feedback_session']
+            if access_code and access_code[0] != teacher_batch.pk:
+                return JsonResponse({'success': False, 'error': 'This access code is for a different course.'})
+
+            # Validate against the active questions, then write every response in one transaction
+            submission = build_submission(request.POST, teacher_batch.pk, session_id)
+            # The code is only used up if the submission is stored
+            with transaction.atomic() if access_code else nullcontext():
+                if access_code:
+                    access_codes.redeem(*access_code)
+                if journal.is_enabled():
+                    # Write-behind mode: the drainer assigns the feedback number later
+                    journal.append(submission)
+                    message = f'Thank you! Your feedback for {teacher_batch.course.code} has been received successfully.'
+                else:
+                    feedback_number, = save_submissions([submission])
+                    if feedback_number is None:
+                        raise SubmissionError('Feedback already submitted from this session.')
+                    message = f'Thank you! Your feedback for {teacher_batch.course.code} has been submitted successfully. (Feedback #{feedback_number})'
 
-            return JsonResponse({
-                'success': True,
-                'message': f'Thank you! Your feedback for {teacher_batch.course.code} has been submitted successfully. (Feedback #{feedback_number})'
-            })
+            return JsonResponse({'success': True, 'message': message})
 
+        except SubmissionError as e:
+            return JsonResponse({'success': False, 'error': str(e)})
         except Exception as e:
             return JsonResponse({'success': False, 'error': f'An error occurred: {str(e)}'})
 
@@ -1057,28 +975,62 @@ def submit_student_feedback(request):
 
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-@login_required
-def admin_student_feedback_responses(request):
-    user = request.user
-
-    # Default role flags
-    is_admin = user.is_staff
-    is_hod = False
-    is_teacher = False
-    teacher = None
+def _report_role(request):
+    """Return (is_admin, is_hod, is_teacher, teacher_id) for the report views."""
+    roles = get_roles(request)
 
     # Detect role via Teacher → Role relation
-    try:
-        teacher = Teacher.objects.get(user=user)
-        role_name = teacher.role.role_name.lower()
-        is_hod = (role_name == "hod")
-        is_teacher = (role_name == "teacher")
-    except Teacher.DoesNotExist:
-        teacher = None
-        role_name = None
+    role_name = roles.teacher_role
+    return roles.is_staff, role_name == "hod", role_name == "teacher", roles.teacher_id
+
+
+def _report_scope(request, is_admin, is_hod, is_teacher, teacher_id):
+    """TeacherBatch lookups the caller may see, narrowed by the report's GET filters.
+
+    Returns ``None`` when the caller may see nothing, ``{}`` for everything.
+    """
+    selected_dept_id = request.GET.get('department')
+    selected_teacher_id = request.GET.get('teacher')
+    selected_course_id = request.GET.get('course')
+    selected_batch_id = request.GET.get('batch')
+
+    if is_admin:
+        lookups = {}
+        if selected_dept_id:
+            lookups['department_id'] = selected_dept_id
+        if selected_teacher_id:
+            lookups['teacher_id'] = selected_teacher_id
+    elif (is_hod or is_teacher) and teacher_id:
+        lookups = {'teacher_id': teacher_id}
+    else:
+        return None
+
+    if selected_course_id:
+        lookups['course_id'] = selected_course_id
+    if selected_batch_id:
+        lookups['batch_id'] = selected_batch_id
+    return lookups
+
+
+def _scoped(queryset, scope, prefix='teacher_batch__'):
+    """Apply a ``_report_scope`` result to a queryset related to TeacherBatch."""
+    if scope is None:
+        return queryset.none()
+    return queryset.filter(**{prefix + key: value for key, value in scope.items()})
+
+
+def _report_responses(request, is_admin, is_hod, is_teacher, teacher_id):
+    """Responses the caller may see, narrowed by the report's GET filters."""
+    scope = _report_scope(request, is_admin, is_hod, is_teacher, teacher_id)
+    return _scoped(StudentFeedbackResponse.objects.all(), scope)
+
 
-    total_questions = FeedbackQuestion.objects.filter(active=True).count()
-    all_responses = StudentFeedbackResponse.objects.all()
+@login_required
+@reporting()
+def admin_student_feedback_responses(request):
+    is_admin, is_hod, is_teacher, teacher_id = _report_role(request)
+
+    total_questions = get_questionnaire().total_questions
 
     # Filters from GET params
     selected_dept_id = request.GET.get('department')
@@ -1098,12 +1050,12 @@ def admin_student_feedback_responses(request):
 
     # Role-based filtering for courses & batches
     if is_hod or is_teacher:
-        if not teacher:
+        if not teacher_id:
             messages.error(request, "Teacher profile not found.")
             return redirect('login')
 
         # Courses assigned to the logged-in teacher
-        user_courses = Course.objects.filter(teacherbatch__teacher=teacher).distinct()
+        user_courses = Course.objects.filter(teacherbatch__teacher_id=teacher_id).distinct()
         course_ids = list(user_courses.values_list('course_id', flat=True))
 
         if selected_course_id:
@@ -1124,107 +1076,29 @@ def admin_student_feedback_responses(request):
 
         batches = Batch.objects.filter(course_id=selected_course_id) if selected_course_id else Batch.objects.all()
 
-    # Build the filtered responses queryset
-    responses = StudentFeedbackResponse.objects.none()
-
-    if is_admin:
-        responses = all_responses
-        if selected_dept_id:
-            responses = responses.filter(teacher_batch__department_id=selected_dept_id)
-        if selected_teacher_id:
-            responses = responses.filter(teacher_batch__teacher_id=selected_teacher_id)
-        if selected_course_id:
-            responses = responses.filter(teacher_batch__course_id=selected_course_id)
-        if selected_batch_id:
-            responses = responses.filter(teacher_batch__batch_id=selected_batch_id)
-
-    elif is_hod or is_teacher:
-        if not teacher:
-            messages.error(request, "Teacher profile not found.")
-            return redirect('login')
-
-        responses = StudentFeedbackResponse.objects.filter(teacher_batch__teacher=teacher)
-        if selected_course_id:
-            responses = responses.filter(teacher_batch__course_id=selected_course_id)
-        if selected_batch_id:
-            responses = responses.filter(teacher_batch__batch_id=selected_batch_id)
+    # Build the filtered querysets: raw responses for the submission list
+    # and descriptive answers, rollups for everything that is counted
+    scope = _report_scope(request, is_admin, is_hod, is_teacher, teacher_id)
+    responses = _scoped(StudentFeedbackResponse.objects.all(), scope)
+    option_counts = _scoped(FeedbackOptionCount.objects.all(), scope)
 
     # Stats calculations
-    total_feedback_submissions = responses.values('session_id').distinct().count()
-    total_responses_overall = responses.count()
+    totals = _scoped(TeacherBatch.objects.all(), scope, prefix='').aggregate(
+        submissions=Sum('submission_count'),
+        responses=Sum('response_count'),
+        latest=Max('last_submitted_at'),
+    )
+    total_feedback_submissions = totals['submissions'] or 0
+    total_responses_overall = totals['responses'] or 0
     avg_responses_per_student = round((total_responses_overall / total_feedback_submissions), 2) if total_feedback_submissions else 0
 
-    latest_submission_obj = responses.order_by('-submitted_at').first()
-    latest_submission = latest_submission_obj.submitted_at if latest_submission_obj else "--"
-
-    # Group responses by session_id
-    grouped = {}
-    for r in responses.order_by('submitted_at'):
-        grouped.setdefault(r.session_id, []).append(r)
-
-    feedback_sessions = []
-    for i, (session_id, session_responses) in enumerate(grouped.items(), start=1):
-        first_response = session_responses[0]
-        course_info = None
-        if first_response.teacher_batch:
-            tb = first_response.teacher_batch
-            course_info = {
-                'course_code': tb.course.code,
-                'course_name': tb.course.name,
-                'batch': f"{tb.batch.acad_year} - {tb.batch.part}"
-            }
+    latest_submission = totals['latest'] or "--"
 
-        feedback_sessions.append({
-            'feedback_number': i,
-            'submitted_at': first_response.submitted_at,
-            'total_responses': len(session_responses),
-            'responses': session_responses,
-            'course_info': course_info,
-        })
+    # First page of submissions; the rest is fetched on scroll from admin_feedback_sessions
+    feedback_sessions, next_cursor = session_page(_scoped(FeedbackSession.objects.all(), scope))
 
-    # Prepare question summaries
-    questions_with_responses = []
-    questions = FeedbackQuestion.objects.filter(active=True).order_by('q_id')
-
-    for question in questions:
-        q_responses = responses.filter(question=question)
-
-        if question.q_type == 'MCQ':
-            all_options = FeedbackQOption.objects.filter(q=question).order_by('ans_id')
-            option_counts = {opt.answer: 0 for opt in all_options}
-            for r in q_responses:
-                if r.selected_option:
-                    option_counts[r.selected_option.answer] += 1
-
-            questions_with_responses.append({
-                'question': question,
-                'type': 'MCQ',
-                'option_counts': option_counts,
-                'total_responses': q_responses.count(),
-                'all_options': [opt.answer for opt in all_options],
-            })
-
-        elif question.q_type == 'DESC':
-            # Only include responses that actually have text
-            non_empty_responses = q_responses.filter(
-                response_text__isnull=False
-            ).exclude(
-                response_text__exact=""
-            )
-
-            desc_list = [{
-                'text': r.response_text,
-                'submitted_at': r.submitted_at,
-                'feedback_number': r.feedback_number,
-                'course_info': f"{r.teacher_batch.course.code}" if r.teacher_batch else "N/A"
-            } for r in non_empty_responses]
-
-            questions_with_responses.append({
-                'question': question,
-                'type': 'DESC',
-                'responses': desc_list,
-                'total_responses': non_empty_responses.count()
-            })
+    # Prepare question summaries (MCQ counts from the rollup + one descriptive query)
+    questions_with_responses = summarize_questions(responses, option_counts)
 
     return render(request, 'admin_response.html', {
         'departments': departments,
@@ -1245,24 +1119,75 @@ def admin_student_feedback_responses(request):
         'avg_responses_per_student': avg_responses_per_student,
 
         'feedback_sessions': feedback_sessions,
+        'next_cursor': next_cursor,
         'questions_with_summary': questions_with_responses,
 
         'is_admin': is_admin,
         'is_hod': is_hod,
         'is_teacher': is_teacher,
     })
-    
+
+
+@login_required
+@reporting()
+def admin_feedback_sessions(request):
+    """Next page of submissions for the report's infinite scroll (JSON)."""
+    is_admin, is_hod, is_teacher, teacher_id = _report_role(request)
+    scope = _report_scope(request, is_admin, is_hod, is_teacher, teacher_id)
+
+    try:
+        feedback_sessions, next_cursor = session_page(_scoped(FeedbackSession.objects.all(), scope), request.GET.get('cursor'))
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor.'}, status=400)
+
+    html = render_to_string('feedback_sessions_page.html', {'feedback_sessions': feedback_sessions}, request=request)
+    return JsonResponse({'html': html, 'next_cursor': next_cursor})
+
+
+EXPORT_FORMATS = {
+    'csv': (stream_csv, 'text/csv; charset=utf-8'),
+    'xlsx': (stream_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+
+@login_required
+def export_student_feedback_responses(request, file_format):
+    """Stream every response under the report's filters as CSV or XLSX."""
+    if file_format not in EXPORT_FORMATS:
+        raise Http404("Unknown export format.")
+
+    is_admin, is_hod, is_teacher, teacher_id = _report_role(request)
+    responses = _report_responses(request, is_admin, is_hod, is_teacher, teacher_id)
+
+    stream, content_type = EXPORT_FORMATS[file_format]
+    # Streamed after the view returns, so pin the read-only alias explicitly
+    rows = export_rows(responses.using(reporting_db()))
+    response = StreamingHttpResponse(stream(rows), content_type=content_type)
+    filename = f"student_feedback_{timezone.localdate():%Y%m%d}.{file_format}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+def sql_profile_report(request):
+    """Worst views by query count over the profiling window (staff only, JSON)."""
+    try:
+        window = int(request.GET['window']) if 'window' in request.GET else None
+        limit = int(request.GET.get('limit', 20))
+    except ValueError:
+        return JsonResponse({'error': 'window and limit must be integers.'}, status=400)
+
+    report = worst_views(window=window, limit=limit)
+    report['enabled'] = getattr(settings, 'FEEDBACK_SQL_PROFILING', False)
+    return JsonResponse(report)
+
 
 def select_teacher_for_feedback(request):
-    print("🔥🔥🔥 VIEW IS BEING CALLED 🔥🔥🔥")
- 
-    # Your existing code here...
     active_teacher_batches = TeacherBatch.objects.filter(
         batch__is_active=True,
         is_active_for_feedback=True
-    ).select_related('teacher', 'course', 'batch', 'department')
-    
-    print(f"🎯 Found {active_teacher_batches.count()} active teacher-batch combinations")
+    ).select_related('teacher__dept', 'course', 'batch', 'department')
     
     teacher_courses = {}
     for tb in active_teacher_batches:
@@ -1271,9 +1196,6 @@ def select_teacher_for_feedback(request):
             teacher_courses[teacher] = []
         teacher_courses[teacher].append(tb)
     
-    print(f"🎯 Final teacher_courses dict has {len(teacher_courses)} teachers")
-    print(f"🎯 teacher_courses is empty: {not teacher_courses}")
-    
     context = {
         'teacher_courses': teacher_courses
     }
@@ -1286,27 +1208,15 @@ def student_feedback_form_by_teacher(request, teacher_id):
     """Display feedback form for a selected teacher."""
     teacher = get_object_or_404(Teacher, pk=teacher_id)
 
-    # Get only active questions
-    questions = FeedbackQuestion.objects.filter(active=True).order_by('q_id')
-
-    if 'student_feedback_session' not in request.session:
-        request.session['student_feedback_session'] = str(uuid.uuid4())
-
-    mcq_questions = []
-    desc_questions = []
-
-    for question in questions:
-        if question.q_type == 'MCQ':
-            options = FeedbackQOption.objects.filter(q=question).order_by('ans_id')
-            mcq_questions.append({'question': question, 'options': options})
-        elif question.q_type == 'DESC':
-            desc_questions.append(question)
+    # Active questions and their options, compiled once per questionnaire version
+    questionnaire = get_questionnaire()
 
     context = {
-        'mcq_questions': mcq_questions,
-        'desc_questions': desc_questions,
-        'session_id': request.session['student_feedback_session'],
-        'total_questions': questions.count(),
+        'mcq_questions': questionnaire.mcq_questions,
+        'desc_questions': questionnaire.desc_questions,
+        'submission_token': new_submission_token(),
+        'total_questions': questionnaire.total_questions,
+        'questionnaire_version': questionnaire.version,
         'teacher': teacher
     }
 
@@ -1326,6 +1236,7 @@ def toggle_feedback_status(request, teacher_id):
         teacher = get_object_or_404(Teacher, pk=teacher_id)
         teacher.fb_active = not teacher.fb_active
         teacher.save()
+        invalidate_admin_stats()
     return redirect('teacher_list')
 
 @login_required  
@@ -1349,7 +1260,8 @@ def toggle_teacher_course_feedback(request, teacher_batch_id):
     teacher_batch = get_object_or_404(TeacherBatch, pk=teacher_batch_id)
     if request.method == 'POST':
         teacher_batch.is_active_for_feedback = not teacher_batch.is_active_for_feedback
-        teacher_batch.save()
+        # Only this field: a full save would overwrite the submission rollups
+        teacher_batch.save(update_fields=['is_active_for_feedback'])
         
         status = "activated" if teacher_batch.is_active_for_feedback else "deactivated"
         messages.success(request, f'Feedback for {teacher_batch.course.code} has been {status}!')
@@ -1358,33 +1270,220 @@ def toggle_teacher_course_feedback(request, teacher_batch_id):
 
 def student_feedback_form_by_teacher_course(request, teacher_batch_id):
     """Display feedback form for a specific teacher-course combination."""
-    teacher_batch = get_object_or_404(TeacherBatch, pk=teacher_batch_id, is_active_for_feedback=True)
+    teacher_batch = get_object_or_404(
+        TeacherBatch.objects.select_related('teacher', 'course', 'batch'),
+        pk=teacher_batch_id, is_active_for_feedback=True
+    )
     
-    # Get only active questions
-    questions = FeedbackQuestion.objects.filter(active=True).order_by('q_id')
-
-    if 'student_feedback_session' not in request.session:
-        request.session['student_feedback_session'] = str(uuid.uuid4())
-
-    mcq_questions = []
-    desc_questions = []
-
-    for question in questions:
-        if question.q_type == 'MCQ':
-            options = FeedbackQOption.objects.filter(q=question).order_by('ans_id')
-            mcq_questions.append({'question': question, 'options': options})
-        elif question.q_type == 'DESC':
-            desc_questions.append(question)
+    # Active questions and their options, compiled once per questionnaire version
+    questionnaire = get_questionnaire()
 
     context = {
-        'mcq_questions': mcq_questions,
-        'desc_questions': desc_questions,
-        'session_id': request.session['student_feedback_session'],
-        'total_questions': questions.count(),
+        'mcq_questions': questionnaire.mcq_questions,
+        'desc_questions': questionnaire.desc_questions,
+        'submission_token': new_submission_token(),
+        'total_questions': questionnaire.total_questions,
+        'questionnaire_version': questionnaire.version,
         'teacher_batch': teacher_batch,  # Pass the teacher-batch object
         'teacher': teacher_batch.teacher,
         'course': teacher_batch.course,
-        'batch': teacher_batch.batch
+        'batch': teacher_batch.batch,
+        'access_codes_required': access_codes.is_required(),
+        'access_code': request.GET.get('code', ''),
     }
 
     return render(request, 'feedback_form.html', context)
+
+
+MAX_COMBINED_COURSES = 12
+
+
+def student_feedback_form_combined(request):
+    """One form covering several teacher-courses: ``?tb=`` ids, or a student's pending list.
+
+    The pending list is posted from the pending feedback page with the
+    student's roll number and access key, never put in the URL.
+    """
+    if request.method == 'POST':
+        try:
+            courses = pending_teacher_batches(
+                request.POST.get('roll_number', '').strip(), request.POST.get('access_key', ''),
+            )
+        except RosterError:
+            return redirect('student_pending_feedback')
+    else:
+        teacher_batch_ids = [tb_id for tb_id in request.GET.getlist('tb') if tb_id.isdigit()]
+        courses = [
+            (tb, '') for tb in TeacherBatch.objects.filter(
+                pk__in=teacher_batch_ids, is_active_for_feedback=True,
+            ).select_related('teacher', 'course', 'batch').order_by('course__code', 'pk')
+        ]
+    if not courses:
+        raise Http404("No teacher-courses to give feedback on.")
+
+    questionnaire = get_questionnaire()
+    context = {
+        'courses': courses[:MAX_COMBINED_COURSES],
+        'mcq_questions': questionnaire.mcq_questions,
+        'desc_questions': questionnaire.desc_questions,
+        'submission_token': new_submission_token(),
+        'total_questions': questionnaire.total_questions,
+        'questionnaire_version': questionnaire.version,
+        'access_codes_required': access_codes.is_required(),
+    }
+    return render(request, 'feedback_form_combined.html', context)
+
+
+@idempotent
+def submit_student_feedback_combined(request):
+    """Store the answers for several teacher-courses in one transaction.
+
+    Answers are posted as ``<teacher_batch_id>-question_<q_id>`` (and
+    ``<teacher_batch_id>-access_code``) for every ``teacher_batch_id``.
+    Each course is validated on its own and gets its own entry in
+    ``results``; the valid ones are written together by one
+    ``save_submissions`` call.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Invalid request method.'})
+
+    try:
+        session_id = read_submission_token(request.POST.get('submission_token'))
+
+        teacher_batch_ids = list(dict.fromkeys(
+            int(tb_id) for tb_id in request.POST.getlist('teacher_batch_id') if tb_id.isdigit()
+        ))
+        if not teacher_batch_ids or len(teacher_batch_ids) > MAX_COMBINED_COURSES:
+            return JsonResponse({'success': False, 'error': 'Invalid teacher-course selection.'})
+        teacher_batches = TeacherBatch.objects.select_related('course').in_bulk(teacher_batch_ids)
+
+        results = {}
+        submissions = []
+        codes = {}
+        for tb_id in teacher_batch_ids:
+            teacher_batch = teacher_batches.get(tb_id)
+            results[tb_id] = {'teacher_batch_id': tb_id, 'course': teacher_batch.course.code if teacher_batch else None}
+            if not teacher_batch:
+                results[tb_id].update(success=False, error='Invalid teacher-course selection.')
+                continue
+
+            prefix = f'{tb_id}-'
+            data = {key[len(prefix):]: value for key, value in request.POST.items() if key.startswith(prefix)}
+            try:
+                if access_codes.is_required() or data.get('access_code'):
+                    code = access_codes.parse_code(data.get('access_code'))
+                    if code[0] != tb_id:
+                        raise SubmissionError('This access code is for a different course.')
+                    codes[tb_id] = code
+                submissions.append(build_submission(data, tb_id, course_session_id(session_id, tb_id)))
+            except SubmissionError as e:
+                results[tb_id].update(success=False, error=str(e))
+
+        retried = False
+        while True:
+            # Used codes are refused up front, so one of them cannot sink the whole batch
+            used = access_codes.used_codes(codes[s.teacher_batch_id] for s in submissions if s.teacher_batch_id in codes)
+            for submission in list(submissions):
+                code = codes.get(submission.teacher_batch_id)
+                if code in used or (retried and code and not used):
+                    submissions.remove(submission)
+                    results[submission.teacher_batch_id].update(success=False, error='This access code has already been used.')
+            try:
+                with transaction.atomic():
+                    access_codes.redeem_many(codes[s.teacher_batch_id] for s in submissions if s.teacher_batch_id in codes)
+                    if journal.is_enabled():
+                        for submission in submissions:
+                            try:
+                                journal.append(submission)
+                                results[submission.teacher_batch_id].update(success=True, message='Received.')
+                            except SubmissionError as e:
+                                results[submission.teacher_batch_id].update(success=False, error=str(e))
+                    else:
+                        for submission, number in zip(submissions, save_submissions(submissions)):
+                            if number is None:
+                                results[submission.teacher_batch_id].update(
+                                    success=False, error='Feedback already submitted from this session.',
+                                )
+                            else:
+                                results[submission.teacher_batch_id].update(success=True, message=f'Submitted. (Feedback #{number})')
+                break
+            except access_codes.AccessCodeError:
+                # A concurrent submission redeemed a code after the check above: refuse it
+                # and write the rest. Should that code not be visible yet, every coded course
+                # is refused rather than retried again
+                retried = True
+
+        results = list(results.values())
+        return JsonResponse({'success': any(result['success'] for result in results), 'results': results})
+
+    except SubmissionError as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': f'An error occurred: {str(e)}'})
+
+
+def student_feedback_access_code(request):
+    """Landing page for printed access codes: opens the form of the code's course."""
+    code = request.GET.get('code', '').strip()
+    error = None
+    if code:
+        try:
+            teacher_batch_id, slot = access_codes.parse_code(code)
+        except access_codes.AccessCodeError as e:
+            error = str(e)
+        else:
+            url = reverse('student_feedback_form_by_teacher_course', args=[teacher_batch_id])
+            return redirect(f'{url}?{urlencode({"code": code})}')
+
+    return render(request, 'access_code.html', {'code': code, 'error': error})
+
+
+def student_pending_feedback(request):
+    """A student's outstanding teacher-courses, for their roll number and access key.
+
+    Lists course names only; the codes stay inside the combined form the
+    "Give Feedback" button posts to.
+    """
+    roll_number = request.POST.get('roll_number', '').strip()
+    pending = error = None
+    if request.method == 'POST':
+        try:
+            pending = [tb for tb, _ in pending_teacher_batches(roll_number, request.POST.get('access_key', ''))]
+        except RosterError as e:
+            error = str(e)
+    return render(request, 'pending_feedback.html', {'roll_number': roll_number, 'pending': pending, 'error': error})
+
+
+ACCESS_CODE_SHEET_FORMATS = {'csv': 'text/csv', 'pdf': 'application/pdf'}
+
+
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+def teacher_course_access_codes(request, teacher_batch_id, file_format):
+    """Download a sheet of one-time access codes for a teacher-course."""
+    if file_format not in ACCESS_CODE_SHEET_FORMATS:
+        raise Http404("Unknown sheet format.")
+    teacher_batch = get_object_or_404(TeacherBatch.objects.select_related('teacher', 'course', 'batch'), pk=teacher_batch_id)
+    try:
+        count = int(request.GET.get('count') or teacher_batch.batch.enrolled_count or access_codes.DEFAULT_SLOTS)
+        start = int(request.GET.get('start', 1))
+    except ValueError:
+        return HttpResponseBadRequest('count and start must be integers.')
+    if not 1 <= count <= 5000 or start < 1:
+        return HttpResponseBadRequest('count must be between 1 and 5000 and start at least 1.')
+    if start + count > access_codes.STUDENT_SLOT_BASE:
+        return HttpResponseBadRequest(f'Sheet slots must stay below {access_codes.STUDENT_SLOT_BASE}.')
+
+    codes = access_codes.generate_codes(teacher_batch.pk, count, start)
+    response = HttpResponse(content_type=ACCESS_CODE_SHEET_FORMATS[file_format])
+    if file_format == 'csv':
+        access_codes.write_csv(response, codes)
+    else:
+        access_codes.write_pdf(
+            response,
+            f'{teacher_batch.course.code} - {teacher_batch.teacher.name} ({teacher_batch.batch.acad_year} {teacher_batch.batch.part})',
+            codes,
+            instructions=f"One code per student. Enter it at {request.build_absolute_uri(reverse('student_feedback_access_code'))}",
+        )
+    response['Content-Disposition'] = f'attachment; filename="access_codes_{teacher_batch.course.code}_{teacher_batch.pk}.{file_format}"'
+    return response